@@ -0,0 +1,115 @@
+# So sánh kích thước prompt chat (và tùy chọn độ trễ Groq) giữa context JSON đầy đủ và context nén
+# (prompt_context.format_chat_context), trên payload /api/predict/all dựng từ dữ liệu thật của các tỉnh
+# (src/data/{hourly,daily}/*.csv) và một kế hoạch nông vụ 7 ngày mẫu.
+#
+#   python benchmarks/bench_prompt_context.py                # số token context theo câu hỏi
+#   python benchmarks/bench_prompt_context.py --budget 600   # thử ngân sách khác
+#   python benchmarks/bench_prompt_context.py --live 5       # + gọi Groq 5 lần mỗi chế độ (cần GROQ_API_KEY,
+#                                                            #   GROQ_BASE_URL để dùng server giả)
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.stages import load_fixtures  # noqa: E402
+from predict import decode_wmo_code_batch, Y_FEATURES  # noqa: E402
+from prompt_context import format_chat_context, CHAT_CONTEXT_TOKENS  # noqa: E402
+from serializers import (  # noqa: E402
+    HOURLY_FIELDS, DAILY_FIELDS, DATE_FORMAT, HOURLY_TIME_FORMAT, frame_records, forecast_records
+)
+
+QUESTIONS = (
+    "Hôm nay có nên tưới cây không?",
+    "Chiều nay gió có mạnh không, phun thuốc được không?",
+    "Tuần này trời nắng hay mây nhiều, có phơi lúa được không?",
+    "Xin chào",
+)
+
+SAMPLE_PLAN = {
+    "id": "7f1c2d9e-0000-4000-8000-000000000001",
+    "user_id": "b0e1a2c3-0000-4000-8000-000000000002",
+    "crop_name": "Lúa",
+    "farm_location": "Ruộng sau nhà",
+    "season_goal": "Vụ Đông Xuân",
+    "notes": "Giống ST25",
+    "created_at": "2025-01-01T07:00:00+00:00",
+    "daily_tasks": [
+        {"task_date": f"2025-01-0{day + 1}", "task_description": f"Công việc ngày {day}",
+         "task_details": "Kiểm tra mực nước ruộng, bón phân đạm theo liều khuyến cáo, theo dõi sâu cuốn lá "
+                         "và rầy nâu; nếu có mưa lớn thì khơi thông mương thoát nước và hoãn phun thuốc."}
+        for day in range(7)
+    ],
+}
+
+
+def sample_weather_context(fixtures, city="Benchmark"):
+    """Payload dạng /api/predict/all: 7 ngày (Y_FEATURES), 24 giờ, hôm nay - từ tỉnh đầu tiên có dữ liệu."""
+    hourly, daily = fixtures["hourly"][0].iloc[:24], fixtures["daily"][0]
+    week = daily.iloc[-7:]
+    return {
+        "city": city,
+        "seven_day_forecast": frame_records(
+            week, [f for f in Y_FEATURES if f in week.columns], time_format=DATE_FORMAT,
+            extra={"weather_code": week["weather_code"].astype(int).tolist(),
+                   "weather_description": decode_wmo_code_batch(week["weather_code"].astype(int).tolist())}),
+        "hourly_forecast": forecast_records(
+            hourly, HOURLY_FIELDS, hourly["weather_code"].astype(int).tolist(),
+            decode_wmo_code_batch(hourly["weather_code"].astype(int).tolist()), time_format=HOURLY_TIME_FORMAT),
+        "today_forecast": forecast_records(
+            daily.iloc[-1:], DAILY_FIELDS, [int(daily["weather_code"].iloc[-1])],
+            decode_wmo_code_batch([int(daily["weather_code"].iloc[-1])]), time_format=DATE_FORMAT)[0],
+    }
+
+
+async def measure_live(weather, question, rounds):
+    """Độ trễ chat_with_groq (ms) cho từng chế độ context."""
+    import groq_service
+    import prompt_context
+
+    results = {}
+    for mode in ("full", "compact"):
+        prompt_context.CHAT_CONTEXT_MODE = mode
+        latencies = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            await groq_service.chat_with_groq(question, weather, SAMPLE_PLAN)
+            latencies.append((time.perf_counter() - started) * 1000)
+        results[mode] = latencies
+    await groq_service.close_groq_client()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat prompt context size: full JSON vs compact")
+    parser.add_argument("--budget", type=int, default=CHAT_CONTEXT_TOKENS, help="Token budget for the compact context")
+    parser.add_argument("--live", type=int, default=0, help="Also call Groq N times per mode and report latency")
+    parser.add_argument("--show", action="store_true", help="Print the compact context of the first question")
+    args = parser.parse_args()
+
+    weather = sample_weather_context(load_fixtures())
+    full_weather, full_agri, full = format_chat_context(weather, SAMPLE_PLAN, mode="full")
+    print(f"full JSON context: ~{full['tokens']} tokens ({len(full_weather) + len(full_agri)} chars)")
+    print(f"{'question':60} {'tokens':>7} {'level':>5} {'saved':>6}")
+    for question in QUESTIONS:
+        weather_str, agri_str, info = format_chat_context(weather, SAMPLE_PLAN, question,
+                                                          budget=args.budget, mode="compact")
+        print(f"{question[:60]:60} {info['tokens']:>7} {info['level']:>5} "
+              f"{1 - info['tokens'] / full['tokens']:>6.0%}")
+        if args.show and question == QUESTIONS[0]:
+            print(weather_str, agri_str, sep="\n\n", end="\n\n")
+
+    if args.live:
+        results = asyncio.run(measure_live(weather, QUESTIONS[0], args.live))
+        for mode, latencies in results.items():
+            print(f"groq {mode:8} median {statistics.median(latencies):8.1f} ms  "
+                  f"max {max(latencies):8.1f} ms  ({len(latencies)} calls)")
+
+
+if __name__ == "__main__":
+    main()
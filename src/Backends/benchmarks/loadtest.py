@@ -0,0 +1,335 @@
+# Load test end-to-end cho Weather Prediction API.
+#
+# Khởi động backend (uvicorn, tiến trình riêng) trỏ tới các upstream giả (benchmarks/stubs.py), bắn
+# request vào các endpoint với nhiều mức đồng thời, rồi ghi p50/p95/p99, throughput và thời gian
+# từng stage (đọc từ header Server-Timing) ra file JSON để so sánh giữa các commit.
+#
+#   python benchmarks/loadtest.py --concurrency 1,8,32 --requests 200
+#   python benchmarks/loadtest.py --endpoints predict_all,raw_all --no-cache --compare results/old.json
+#   python benchmarks/loadtest.py --url http://127.0.0.1:8000   # server có sẵn (upstream do server tự cấu hình)
+#
+# Các endpoint /api/predict/* cần model thật trong MODEL_DIR; thiếu model thì chúng được ghi nhận là lỗi.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from stubs import UpstreamStubs  # noqa: E402
+from geocode_cache import load_province_seeds  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+SCHEDULE_BODY = {
+    "crop_name": "Lúa",
+    "farm_location": "Ruộng A",
+    "season_goal": "Vụ Đông Xuân",
+    "notes": "",
+}
+CHAT_BODY = {
+    "user_message": "Hôm nay có nên tưới cây không?",
+    "weather_context": {"today_forecast": {"temperature_2m_mean": 27.5, "precipitation_sum": 12.0,
+                                           "weather_description": "Moderate rain"}},
+    "agriculture_context": {"daily_tasks": [{"day": 0, "description": "Tưới cây"}]},
+}
+
+# Tên kịch bản -> (method, path, hàm dựng body theo thành phố)
+ENDPOINTS = {
+    "predict_7days": ("POST", "/api/predict/7days", lambda city: {"city": city}),
+    "predict_hourly": ("POST", "/api/predict/hourly", lambda city: {"city": city}),
+    "predict_daily": ("POST", "/api/predict/daily", lambda city: {"city": city}),
+    "predict_all": ("POST", "/api/predict/all", lambda city: {"city": city}),
+    "raw_all": ("POST", "/api/weather/raw/all", lambda city: {"city": city}),
+    "groq_schedule": ("POST", "/api/groq/generate-schedule", lambda city: {**SCHEDULE_BODY, "city": city}),
+    "groq_chat": ("POST", "/api/groq/chat", lambda city: CHAT_BODY),
+    "groq_chat_stream": ("POST", "/api/groq/chat/stream", lambda city: CHAT_BODY),
+    "groq_test": ("GET", "/api/groq/test", None),
+}
+
+
+def parse_server_timing(header):
+    """'geocode;dur=0.41, total;dur=12.3' -> {"geocode": 0.41, "total": 12.3} (ms)."""
+    stages = {}
+    for entry in (header or "").split(","):
+        parts = [p.strip() for p in entry.split(";")]
+        if not parts[0]:
+            continue
+        for param in parts[1:]:
+            if param.startswith("dur="):
+                stages[parts[0]] = float(param[4:])
+    return stages
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values)
+    return {
+        "mean": round(float(values.mean()), 3),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+async def run_scenario(client, name, concurrency, total, cities):
+    """Gửi `total` request tới endpoint `name` với `concurrency` worker, trả về thống kê."""
+    method, path, body = ENDPOINTS[name]
+    latencies, statuses, stages = [], Counter(), {}
+    error_sample = None
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal error_sample
+        for i in counter:
+            city = cities[i % len(cities)]
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body(city) if body else None)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                response, status = None, type(e).__name__
+            elapsed = (time.perf_counter() - started) * 1000
+            statuses[status] += 1
+
+            if response is not None and response.status_code < 400:
+                latencies.append(elapsed)
+                for stage, ms in parse_server_timing(response.headers.get("server-timing")).items():
+                    stages.setdefault(stage, []).append(ms)
+            elif error_sample is None:
+                error_sample = response.text[:300] if response is not None else status
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    ok = len(latencies)
+    return {
+        "endpoint": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": ok,
+        "errors": total - ok,
+        "status_counts": {str(k): v for k, v in statuses.items()},
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(ok / wall, 2) if wall else None,
+        "latency_ms": _percentiles(latencies),
+        "stages_ms": {stage: _percentiles(values) for stage, values in sorted(stages.items())},
+        "error_sample": error_sample,
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(env_overrides, startup_timeout):
+    """Chạy `uvicorn main:app` trong tiến trình riêng, chờ /readyz. Trả về (process, base_url)."""
+    port = _free_port()
+    env = {**os.environ, **env_overrides}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + startup_timeout
+    alive = False
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited during startup (code {process.returncode})")
+        try:
+            response = httpx.get(f"{base_url}/readyz", timeout=2)
+            alive = True
+            if response.status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+
+    if not alive:
+        process.terminate()
+        raise RuntimeError(f"Backend did not start within {startup_timeout}s")
+    print(f"⚠️ Models not ready after {startup_timeout}s - /api/predict/* will likely fail")
+    return process, base_url
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True,
+                              timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_table(results):
+    print(f"\n{'endpoint':<16}{'conc':>5}{'ok/err':>10}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    for r in results:
+        lat = r["latency_ms"] or {}
+        print(f"{r['endpoint']:<16}{r['concurrency']:>5}{str(r['ok']) + '/' + str(r['errors']):>10}"
+              f"{r['throughput_rps'] or 0:>9.1f}{lat.get('p50', 0):>9.1f}{lat.get('p95', 0):>9.1f}"
+              f"{lat.get('p99', 0):>9.1f}")
+        stages = ", ".join(f"{name}={s['mean']:.1f}" for name, s in r["stages_ms"].items() if name != "total")
+        if stages:
+            print(f"{'':<21}stages (mean): {stages}")
+        if r["error_sample"]:
+            print(f"{'':<21}error: {r['error_sample']}")
+
+
+def compare(results, baseline_path):
+    """In chênh lệch p50/p95/p99/throughput so với một file kết quả trước đó."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline_path} (commit {baseline['meta'].get('commit')}):")
+
+    def delta(new, old):
+        if not new or not old:
+            return "     n/a"
+        return f"{(new - old) / old * 100:+7.1f}%"
+
+    for r in results:
+        old = previous.get((r["endpoint"], r["concurrency"]))
+        if old is None or not r["latency_ms"] or not old["latency_ms"]:
+            continue
+        print(f"{r['endpoint']:<16}{r['concurrency']:>5}"
+              f"  p50 {delta(r['latency_ms']['p50'], old['latency_ms']['p50'])}"
+              f"  p95 {delta(r['latency_ms']['p95'], old['latency_ms']['p95'])}"
+              f"  p99 {delta(r['latency_ms']['p99'], old['latency_ms']['p99'])}"
+              f"  rps {delta(r['throughput_rps'], old['throughput_rps'])}")
+
+
+async def run(args, base_url, cities):
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        results = []
+        for name in args.endpoints:
+            if args.warmup:
+                await run_scenario(client, name, 1, args.warmup, cities)
+            for concurrency in args.concurrency:
+                result = await run_scenario(client, name, concurrency, args.requests, cities)
+                results.append(result)
+                print(f"✅ {name} x{concurrency}: {result['ok']}/{result['requests']} ok, "
+                      f"{result['throughput_rps']} req/s")
+
+        try:
+            server_stats = (await client.get("/api/inference/stats")).json()
+        except (httpx.HTTPError, ValueError):
+            server_stats = None
+    return results, server_stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end load test for the Weather Prediction API")
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help=f"Comma-separated scenarios ({', '.join(ENDPOINTS)})")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="Warm-up requests per endpoint (not recorded)")
+    parser.add_argument("--cities", help="Comma-separated city names (default: the 63 provinces)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the forecast and schedule caches (measure cold compute)")
+    parser.add_argument("--upstream-data", choices=("local", "synthetic"), default=None,
+                        help="Open-Meteo stub data (default: local history store if present, else synthetic)")
+    parser.add_argument("--open-meteo-latency-ms", type=float, default=0.0)
+    parser.add_argument("--openweather-latency-ms", type=float, default=0.0)
+    parser.add_argument("--groq-latency-ms", type=float, default=0.0)
+    parser.add_argument("--groq-token-ms", type=float, default=0.0, help="Delay between streamed Groq tokens")
+    parser.add_argument("--startup-timeout", type=float, default=180.0)
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/loadtest-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="Previous result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    args.endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in args.endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    cities = args.cities.split(",") if args.cities else sorted(load_province_seeds())
+
+    stubs = process = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            from history_store import HISTORY_STORE_DIR, INDEX_FILE
+
+            data = args.upstream_data or (
+                "local" if os.path.exists(os.path.join(HISTORY_STORE_DIR, INDEX_FILE)) else "synthetic")
+            stubs = UpstreamStubs(data=data, latency_ms={
+                "open_meteo": args.open_meteo_latency_ms,
+                "openweather": args.openweather_latency_ms,
+                "groq": args.groq_latency_ms,
+            }, token_ms=args.groq_token_ms).start()
+            print(f"🧪 Upstream stubs ({data} data) at {stubs.base_url}")
+
+            cache_dir = tempfile.mkdtemp(prefix="loadtest-")
+            env = {
+                **stubs.env(),
+                "GEOCODE_CACHE_DB": os.path.join(cache_dir, "geocode.sqlite3"),
+                "SCHEDULE_CACHE_DB": os.path.join(cache_dir, "schedule.sqlite3"),
+                "MODEL_WATCH_INTERVAL": "0",
+            }
+            if args.no_cache:
+                env["FORECAST_CACHE_BACKEND"] = "none"
+                env["SCHEDULE_CACHE_ENABLED"] = "0"
+            process, base_url = start_server(env, args.startup_timeout)
+            print(f"🚀 Backend at {base_url}")
+
+        results, server_stats = asyncio.run(run(args, base_url, cities))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if stubs is not None:
+            stubs.stop()
+
+    commit = _git("rev-parse", "--short", "HEAD")
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+            "upstream_calls": stubs.calls if stubs is not None else None,
+        },
+        "server": server_stats,
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"loadtest-{commit or 'nogit'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_table(results)
+    if args.compare:
+        compare(results, args.compare)
+    print(f"\n💾 Results written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
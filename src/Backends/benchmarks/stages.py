@@ -0,0 +1,305 @@
+# Micro-benchmark từng stage tiền xử lý / suy luận trong predict.py, trên dữ liệu thật của các tỉnh
+# (src/data/{hourly,daily}/*.csv), ở các kích thước batch 1, 24, 7×63 và 24×63.
+#
+# Mỗi stage được chạy lặp tới khi đủ BENCH_MIN_ROUNDS lần và BENCH_MIN_TIME giây (tối đa
+# BENCH_MAX_ROUNDS lần); phần dựng input không bị tính giờ. Bộ nhớ cấp phát đỉnh đo bằng tracemalloc
+# trong một lần chạy riêng (tracemalloc làm chậm code nên không dùng chung với lần đo thời gian).
+#
+#   python benchmarks/stages.py                          # chạy và so sánh với baselines/stages.json
+#   python benchmarks/stages.py --stages decode_wmo_code_batch --sizes 24,1512
+#   python benchmarks/stages.py --save-baseline          # ghi kết quả làm baseline mới
+#   python benchmarks/stages.py --fail-over 20           # exit 1 nếu median chậm hơn baseline > 20%
+#
+# Các stage cần model (scaler / LSTM / classifier) bị bỏ qua khi MODEL_DIR không có model.
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+import predict  # noqa: E402
+from crawl import block_to_frame, HOURLY_SCHEMA, DAILY_SCHEMA  # noqa: E402
+from history_store import HISTORY_DATA_DIR, _column_name  # noqa: E402
+from model_registry import registry  # noqa: E402
+from rolling_window import RollingWindow  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines", "stages.json")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# Cấu hình mặc định (ghi đè bằng tham số dòng lệnh)
+BENCH_SIZES = (1, 24, 7 * 63, 24 * 63)   # số dòng (hourly/daily/decode) hoặc số cửa sổ 30 ngày (7days)
+BENCH_MIN_ROUNDS = 5
+BENCH_MAX_ROUNDS = 200
+BENCH_MIN_TIME = 0.2                      # giây đo tối thiểu cho mỗi (stage, batch)
+
+# Số dòng đầu mỗi file CSV được đọc làm fixture
+_FIXTURE_ROWS = {"hourly": 48, "daily": 30 + 7 * (BENCH_SIZES[-1] // 63 + 1)}
+
+
+# ===== Fixtures =====
+def _read_head(path, nrows, fallback_header=None):
+    """Đọc `nrows` dòng dữ liệu đầu của file CSV Open-Meteo (bỏ phần metadata, hỗ trợ file không header)."""
+    with open(path, encoding="utf-8") as f:
+        head = [f.readline() for _ in range(4)]
+    header_line = next((i for i, line in enumerate(head) if line.startswith("time,")), None)
+    if header_line is None:
+        if fallback_header is None or not any(line.strip() for line in head):
+            return None
+        df = pd.read_csv(path, header=None, nrows=nrows)
+        df.columns = fallback_header[:len(df.columns)]
+        return df
+    df = pd.read_csv(path, skiprows=header_line, nrows=nrows)
+    df.columns = [_column_name(c) for c in df.columns]
+    return df
+
+
+def load_fixtures(data_dir=HISTORY_DATA_DIR):
+    """
+    {freq: [DataFrame theo schema của crawl (time + float32)], ...} cho mỗi tỉnh có dữ liệu,
+    cùng dạng với output của process_*_weather_data, kèm mã WMO quan sát được ('weather_code').
+    """
+    fixtures = {}
+    for freq, schema, time_format in (("hourly", HOURLY_SCHEMA, "%Y-%m-%dT%H:%M"),
+                                      ("daily", DAILY_SCHEMA, "%Y-%m-%d")):
+        folder = os.path.join(data_dir, freq)
+        paths = sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(".csv"))
+        header = None
+        frames = []
+        for path in paths:
+            df = _read_head(path, _FIXTURE_ROWS[freq], header)
+            if df is None or df.empty:
+                continue
+            header = header or list(df.columns)
+            frame = block_to_frame({col: df[col].tolist() for col in df.columns}, schema, time_format)
+            frame["weather_code"] = df["weather_code"].to_numpy()
+            frames.append(frame)
+        fixtures[freq] = frames
+    return fixtures
+
+
+def _rows(frames, n):
+    """n dòng lấy đều từ các tỉnh: batch >= số tỉnh thì mỗi tỉnh góp một đoạn liên tiếp."""
+    per_frame = -(-n // len(frames)) if n >= len(frames) else n
+    parts = [df.iloc[:per_frame] for df in (frames if n >= len(frames) else frames[:1])]
+    return pd.concat(parts, ignore_index=True).iloc[:n]
+
+
+def _windows(frames, n, input_window=30):
+    """n cửa sổ `input_window` ngày: xoay vòng các tỉnh, mỗi vòng dời cửa sổ 7 ngày."""
+    return [
+        frames[i % len(frames)].iloc[(i // len(frames)) * 7:(i // len(frames)) * 7 + input_window]
+        .reset_index(drop=True)
+        for i in range(n)
+    ]
+
+
+def _rolling_window(frame):
+    """RollingWindow (rolling_window) chứa cửa sổ 30 ngày `frame`, như sau lần tải đầu tiên của một địa điểm."""
+    block = {"time": frame["time"].dt.strftime("%Y-%m-%d").tolist(),
+             **{field: frame[field].tolist() for field in DAILY_SCHEMA}}
+    window = RollingWindow()
+    window.extend(block, frame["time"].max().date())
+    return window
+
+
+# ===== Các stage =====
+def _inputs(frame):
+    return frame.drop(columns=["weather_code"])
+
+
+def build_stages(fixtures):
+    """
+    {tên stage: (cần model?, setup(n) -> args, fn)} - `setup` dựng input mới mỗi lần chạy
+    (các hàm tiền xử lý sửa DataFrame tại chỗ) và không bị tính giờ.
+    """
+    hourly, daily = fixtures["hourly"], fixtures["daily"]
+
+    def seven_day(name):
+        return predict.active_models().get("7days")[name]
+
+    def run_process_7days(windows):
+        scaler_x = seven_day("scaler_x")
+        return [predict.process_input_7days(window, scaler_x) for window in windows]
+
+    def run_predict_7days(windows):
+        # Như predict_all_batch: chuẩn hóa các cửa sổ (cả 30 dòng, cửa sổ mới) + một forward pass
+        bundle = predict.active_models().get("7days")
+        return predict.predict_weather_7days_inputs(
+            [window.model_input(bundle["scaler_x"]) for window in windows],
+            [window.last_time() for window in windows],
+            bundle["scaler_y"], bundle["model"])
+
+    return {
+        "hourly_feature_frame": (False, lambda n: (_inputs(_rows(hourly, n)),), predict.hourly_feature_frame),
+        "daily_feature_frame": (False, lambda n: (_inputs(_rows(daily, n)),), predict.daily_feature_frame),
+        "process_input_7days": (True, lambda n: ([w.drop(columns=["weather_code"]) for w in _windows(daily, n)],),
+                                run_process_7days),
+        "process_input_hourly": (True, lambda n: (_inputs(_rows(hourly, n)),), predict.process_input_hourly),
+        "process_input_daily": (True, lambda n: (_inputs(_rows(daily, n)),), predict.process_input_daily),
+        "predict_weather_7days": (True, lambda n: ([_rolling_window(w) for w in _windows(daily, n)],),
+                                  run_predict_7days),
+        "predict_weather_hourly": (True, lambda n: (predict.process_input_hourly(_inputs(_rows(hourly, n))),),
+                                   predict.predict_weather_hourly),
+        "predict_weather_daily": (True, lambda n: (predict.process_input_daily(_inputs(_rows(daily, n))),),
+                                  predict.predict_weather_daily),
+        "decode_wmo_code_batch": (False, lambda n: (_rows(hourly, n)["weather_code"].tolist(),),
+                                  predict.decode_wmo_code_batch),
+    }
+
+
+# ===== Đo =====
+def measure(fn, setup, n, min_rounds=BENCH_MIN_ROUNDS, max_rounds=BENCH_MAX_ROUNDS, min_time=BENCH_MIN_TIME):
+    """Thời gian (ms) qua nhiều lần chạy và bộ nhớ cấp phát đỉnh (KiB) của `fn(*setup(n))`."""
+    fn(*setup(n))  # chạy thử (warm-up: import lười, cache của pandas/sklearn)
+
+    timings = []
+    while len(timings) < min_rounds or (sum(timings) < min_time and len(timings) < max_rounds):
+        args = setup(n)
+        started = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - started)
+
+    args = setup(n)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    ms = [t * 1000 for t in timings]
+    return {
+        "rounds": len(ms),
+        "min_ms": round(min(ms), 4),
+        "median_ms": round(statistics.median(ms), 4),
+        "mean_ms": round(statistics.fmean(ms), 4),
+        "stddev_ms": round(statistics.stdev(ms), 4) if len(ms) > 1 else 0.0,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def _load_models():
+    try:
+        registry.load_all()
+        predict.use_models(registry.current)
+        return registry.version
+    except Exception as e:
+        print(f"⚠️ Models unavailable ({e}) - skipping stages that need them")
+        return None
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=BENCH_DIR, capture_output=True, text=True,
+                              timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline_path, fail_over=None):
+    """In chênh lệch median/peak so với baseline; trả về danh sách (stage, batch) chậm hơn `fail_over` %."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["stage"], r["batch"]): r for r in baseline["results"] if "median_ms" in r}
+    print(f"\nCompared with {os.path.relpath(baseline_path)} (commit {baseline['meta'].get('commit')}):")
+
+    regressions = []
+    for r in results:
+        old = previous.get((r["stage"], r["batch"]))
+        if old is None or "median_ms" not in r:
+            continue
+        time_delta = (r["median_ms"] - old["median_ms"]) / old["median_ms"] * 100
+        peak_delta = (r["peak_kib"] - old["peak_kib"]) / old["peak_kib"] * 100 if old["peak_kib"] else 0.0
+        flag = ""
+        if fail_over is not None and time_delta > fail_over:
+            regressions.append((r["stage"], r["batch"]))
+            flag = "  ❌"
+        print(f"{r['stage']:<24}{r['batch']:>6}  median {time_delta:+7.1f}%  peak {peak_delta:+7.1f}%{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for predict.py stages")
+    parser.add_argument("--stages", help="Comma-separated stage names (default: all)")
+    parser.add_argument("--sizes", default=",".join(map(str, BENCH_SIZES)), help="Comma-separated batch sizes")
+    parser.add_argument("--min-rounds", type=int, default=BENCH_MIN_ROUNDS)
+    parser.add_argument("--max-rounds", type=int, default=BENCH_MAX_ROUNDS)
+    parser.add_argument("--min-time", type=float, default=BENCH_MIN_TIME, help="Seconds per stage and batch size")
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/stages-<commit>-<time>.json)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline")
+    parser.add_argument("--fail-over", type=float, help="Exit 1 if a median is this many percent above baseline")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    fixtures = load_fixtures()
+    stages = build_stages(fixtures)
+    names = args.stages.split(",") if args.stages else list(stages)
+    unknown = [name for name in names if name not in stages]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)} (available: {', '.join(stages)})")
+
+    model_version = _load_models() if any(stages[name][0] for name in names) else None
+
+    results = []
+    print(f"{'stage':<24}{'batch':>6}{'median ms':>12}{'min ms':>10}{'peak KiB':>11}{'rounds':>8}")
+    for name in names:
+        needs_models, setup, fn = stages[name]
+        for n in sizes:
+            if needs_models and model_version is None:
+                results.append({"stage": name, "batch": n, "skipped": "models not available"})
+                continue
+            result = {"stage": name, "batch": n,
+                      **measure(fn, setup, n, args.min_rounds, args.max_rounds, args.min_time)}
+            results.append(result)
+            print(f"{name:<24}{n:>6}{result['median_ms']:>12.3f}{result['min_ms']:>10.3f}"
+                  f"{result['peak_kib']:>11.1f}{result['rounds']:>8}")
+
+    commit = _git("rev-parse", "--short", "HEAD")
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "model_version": model_version,
+            "config": {"sizes": sizes, "min_rounds": args.min_rounds, "max_rounds": args.max_rounds,
+                       "min_time": args.min_time},
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if not args.save_baseline and os.path.exists(args.baseline):
+        regressions = compare(results, args.baseline, args.fail_over)
+
+    output = args.baseline if args.save_baseline else args.output or os.path.join(
+        RESULTS_DIR, f"stages-{commit or 'nogit'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Results written to {output}")
+
+    if regressions:
+        sys.exit(1)
+    return report
+
+
+if __name__ == "__main__":
+    main()
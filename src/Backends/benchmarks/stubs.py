@@ -0,0 +1,255 @@
+# Upstream giả cho load test offline: Open-Meteo, OpenWeatherMap (/find) và Groq trên cùng một
+# HTTP server đa luồng, để benchmark không bao giờ gọi API thật.
+# - Open-Meteo: dựng lại từ store lịch sử 63 tỉnh (data_sources.LocalHistorySource) nếu có, ngược lại
+#   sinh dữ liệu ổn định theo tọa độ. Mỗi query chỉ dựng một lần, sau đó phát lại từ bộ nhớ.
+# - OpenWeatherMap: tên thành phố được tra trong tọa độ 63 tỉnh (geocode_cache).
+# - Groq: chat completion / danh sách model mẫu theo định dạng OpenAI; `stream: true` trả SSE
+#   từng token (chat.completion.chunk) với độ trễ mỗi token tùy chọn.
+# Mỗi upstream có thể thêm độ trễ cố định để mô phỏng round trip mạng thật.
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from data_sources import LocalHistorySource, _today_vn  # noqa: E402
+from geocode_cache import load_province_seeds, normalize_city_name  # noqa: E402
+
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+
+def _synthetic_block(lat, lon, variables, times):
+    """Giá trị giả nhưng ổn định theo tọa độ (cùng tọa độ -> cùng dữ liệu giữa các lần chạy)."""
+    rng = np.random.default_rng(abs(hash((round(lat, 4), round(lon, 4)))) % (2 ** 32))
+    block = {"time": times}
+    for var in variables:
+        block[var] = np.round(rng.uniform(0, 30, len(times)), 2).tolist()
+    return block
+
+
+def synthetic_open_meteo(params):
+    """Response dạng Open-Meteo cho `params` (query đã parse), không cần store lịch sử."""
+    today = _today_vn()
+    past_days = int(params.get("past_days", 0))
+    forecast_days = int(params.get("forecast_days", 7))
+    days = [today + timedelta(days=d) for d in range(-past_days, forecast_days)]
+    start = datetime.combine(days[0], datetime.min.time())
+    hours = [(start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(len(days) * 24)]
+
+    payloads = []
+    for lat, lon in zip(str(params["latitude"]).split(","), str(params["longitude"]).split(",")):
+        lat, lon = float(lat), float(lon)
+        payload = {"latitude": lat, "longitude": lon, "timezone": params.get("timezone", "GMT"),
+                   "utc_offset_seconds": 25200}
+        if params.get("hourly"):
+            payload["hourly_units"] = {"time": "iso8601"}
+            payload["hourly"] = _synthetic_block(lat, lon, params["hourly"].split(","), hours)
+        if params.get("daily"):
+            payload["daily_units"] = {"time": "iso8601"}
+            payload["daily"] = _synthetic_block(lat, lon, params["daily"].split(","),
+                                                [d.isoformat() for d in days])
+        payloads.append(payload)
+    return payloads[0] if len(payloads) == 1 else payloads
+
+
+def _groq_content(body):
+    """JSON 7 công việc nếu request đòi json_object, ngược lại một câu trả lời mẫu."""
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return json.dumps({"tasks": [
+            {"day": day, "description": f"Stub task {day}", "details": "Generated by the benchmark stub"}
+            for day in range(7)
+        ]})
+    return "Đây là câu trả lời mẫu từ stub Groq dùng cho benchmark."
+
+
+def _groq_completion(body):
+    """Chat completion kiểu OpenAI (không stream)."""
+    content = _groq_content(body)
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", GROQ_MODEL),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def _groq_chunks(body):
+    """Các chat.completion.chunk của một completion stream: mỗi từ là một token, chunk cuối có usage."""
+    words = _groq_content(body).split(" ")
+    base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": body.get("model", GROQ_MODEL)}
+    for i, word in enumerate(words):
+        delta = {"role": "assistant", "content": word} if i == 0 else {"content": " " + word}
+        yield {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+    yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+           "x_groq": {"usage": {"completion_tokens": len(words)}}}
+
+
+class UpstreamStubs:
+    """
+    Chạy các upstream giả trên 127.0.0.1 (cổng ngẫu nhiên) trong một thread nền.
+
+    Args:
+        data (str): 'local' (dựng từ history store) hoặc 'synthetic'.
+        latency_ms (dict): Độ trễ thêm cho từng upstream: {"open_meteo", "openweather", "groq"}.
+        token_ms (float): Độ trễ giữa các token khi Groq stream (`stream: true`).
+    """
+
+    def __init__(self, data="local", latency_ms=None, token_ms=0.0):
+        self.data = data
+        self.latency_ms = {"open_meteo": 0.0, "openweather": 0.0, "groq": 0.0, **(latency_ms or {})}
+        self.token_ms = token_ms
+        self.calls = {"open_meteo": 0, "openweather": 0, "groq": 0}
+        # Số stream Groq bị client đóng giữa chừng (kiểm tra việc hủy generation khi ngắt kết nối)
+        self.aborted_streams = 0
+        # Mã lỗi trả về cho các lần gọi Groq / Open-Meteo kế tiếp (VD: [429, 503]) để kiểm tra retry, xử lý lỗi
+        self.groq_errors = []
+        self.open_meteo_errors = []
+        self._responses = {}
+        self._lock = threading.Lock()
+        self._local = LocalHistorySource() if data == "local" else None
+        self._seeds = load_province_seeds()
+        self._server = None
+
+    # ----- upstream handlers: (status, body) -----
+    def open_meteo(self, query):
+        with self._lock:
+            error = self.open_meteo_errors.pop(0) if self.open_meteo_errors else None
+            cached = self._responses.get(query)
+        if error is not None:
+            return error, {"error": True, "reason": f"stub error {error}"}
+        if cached is None:
+            params = {k: v[0] for k, v in parse_qs(query).items()}
+            if self._local is not None:
+                payload = asyncio.run(self._local.fetch(params))
+            else:
+                payload = synthetic_open_meteo(params)
+            if payload is None:
+                return 500, {"error": True, "reason": "stub could not build response"}
+            cached = json.dumps(payload).encode()
+            with self._lock:
+                self._responses[query] = cached
+        return 200, cached
+
+    def openweather(self, query):
+        name = parse_qs(query).get("q", [""])[0]
+        coord = self._seeds.get(normalize_city_name(name))
+        if coord is None:
+            return 200, {"message": "accurate", "cod": "200", "count": 0, "list": []}
+        return 200, {"message": "accurate", "cod": "200", "count": 1,
+                     "list": [{"name": name, "coord": {"lat": coord["lat"], "lon": coord["lon"]}}]}
+
+    def groq(self, path, body):
+        with self._lock:
+            error = self.groq_errors.pop(0) if self.groq_errors else None
+        if error is not None:
+            return error, {"error": {"message": f"stub error {error}", "type": "stub_error"}}
+        if path.endswith("/models"):
+            return 200, {"object": "list", "data": [{"id": GROQ_MODEL, "object": "model", "owned_by": "stub"}]}
+        if body.get("stream"):
+            return 200, _groq_chunks(body)
+        return 200, _groq_completion(body)
+
+    def _route(self, method, path, query, body):
+        if path.endswith("/forecast"):
+            upstream, result = "open_meteo", lambda: self.open_meteo(query)
+        elif path.endswith("/find"):
+            upstream, result = "openweather", lambda: self.openweather(query)
+        elif path.startswith("/openai/"):
+            upstream, result = "groq", lambda: self.groq(path, body)
+        else:
+            return 404, {"error": f"unknown stub path {method} {path}"}
+
+        with self._lock:
+            self.calls[upstream] += 1
+        if self.latency_ms[upstream]:
+            time.sleep(self.latency_ms[upstream] / 1000)
+        return result()
+
+    def start(self):
+        stubs = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _respond(self, method, body=None):
+                url = urlparse(self.path)
+                status, payload = stubs._route(method, url.path, url.query, body)
+                if not isinstance(payload, (bytes, dict)):
+                    return self._stream(payload)
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, chunks):
+                # SSE kiểu OpenAI, kết thúc bằng "data: [DONE]"; đóng kết nối để báo hết body
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for chunk in chunks:
+                        if stubs.token_ms:
+                            time.sleep(stubs.token_ms / 1000)
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    with stubs._lock:
+                        stubs.aborted_streams += 1
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b"{}"
+                self._respond("POST", json.loads(raw or b"{}"))
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, name="upstream-stubs", daemon=True).start()
+        return self
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def env(self):
+        """Biến môi trường để backend gọi các stub thay vì API thật."""
+        return {
+            "OPEN_METEO_URL": f"{self.base_url}/v1/forecast",
+            "OPENWEATHER_URL": f"{self.base_url}/data/2.5/find",
+            "OPENWEATHER_API_KEY": "benchmark",
+            "GROQ_BASE_URL": self.base_url,
+            "GROQ_API_KEY": "benchmark",
+            "WEATHER_SOURCE": "live",
+        }
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
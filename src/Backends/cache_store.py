@@ -0,0 +1,147 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Bộ nhớ đệm LRU trong tiến trình, mỗi phần tử có thời hạn sống (TTL).
+
+    Args:
+        maxsize (int): Số phần tử tối đa, vượt quá thì loại phần tử ít dùng nhất.
+        ttl (float | None): Thời hạn mặc định (giây). None = không hết hạn.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteStore:
+    """
+    Kho key/value (giá trị JSON) lưu trên đĩa bằng SQLite, có TTL.
+
+    Dùng chế độ WAL nên nhiều worker uvicorn có thể đọc/ghi chung một file,
+    và dữ liệu vẫn còn sau khi khởi động lại server.
+
+    Args:
+        path (str): Đường dẫn file SQLite (thư mục cha được tạo nếu chưa có).
+        table (str): Tên bảng chứa dữ liệu.
+    """
+
+    def __init__(self, path, table="cache"):
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            f"key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        conn.commit()
+
+    def _connect(self):
+        # Mỗi thread giữ một connection riêng (sqlite3 không chia sẻ giữa thread)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        row = self._connect().execute(
+            f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            return default
+        return json.loads(value)
+
+    def ttl_remaining(self, key):
+        """Số giây còn lại của key (None = vĩnh viễn hoặc không tồn tại)."""
+        row = self._connect().execute(
+            f"SELECT expires_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return max(row[0] - time.time(), 0.0)
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        conn = self._connect()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), expires_at),
+        )
+        conn.commit()
+
+    def set_many(self, items, ttl=None, overwrite=True):
+        """Ghi nhiều cặp (key, value) trong một transaction."""
+        expires_at = time.time() + ttl if ttl is not None else None
+        verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+        conn = self._connect()
+        conn.executemany(
+            f"{verb} INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+            [(key, json.dumps(value, ensure_ascii=False), expires_at) for key, value in items],
+        )
+        conn.commit()
+
+    def delete(self, key):
+        conn = self._connect()
+        conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        conn.commit()
+
+    def purge_expired(self):
+        conn = self._connect()
+        conn.execute(
+            f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (time.time(),),
+        )
+        conn.commit()
@@ -1,39 +1,73 @@
-import urllib.request
-import urllib.parse
+import asyncio
 import json
-import sys
+import numpy as np
 import pandas as pd
-import requests
 from datetime import datetime, timezone, timedelta
 import os
 from dotenv import load_dotenv
 
+from geocode_cache import geocode_cache, normalize_city_name
+import http_client
+from http_client import close_client
+from data_sources import data_source
+from timing import timed
+
 load_dotenv()
 
-def get_coordinates(location):
+# Địa chỉ upstream (có thể trỏ sang stub server khi test/benchmark offline)
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "https://api.openweathermap.org/data/2.5/find")
+
+OPENWEATHER_HEADERS = {
+    'Accept': '*/*',
+    'Accept-Language': 'vi-VN,vi;q=0.9,fr-FR;q=0.8,fr;q=0.7,en-US;q=0.6,en;q=0.5',
+    'Origin': 'https://openweathermap.org',
+    'Referer': 'https://openweathermap.org/',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-site',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
+    'sec-ch-ua': '"Google Chrome";v="131", "Chromium";v="131", "Not_A Brand";v="24"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Windows"'
+}
+
+# Các lượt geocode đang chạy, để nhiều coroutine hỏi cùng một thành phố chỉ gọi API 1 lần
+_pending_geocodes = {}
+
+
+@timed("geocode")
+async def get_coordinates(location):
+    # Tra cache trước (LRU + SQLite, đã nạp sẵn 63 tỉnh) -> không cần gọi OpenWeatherMap
+    cached = geocode_cache.get(location)
+    if cached is not None:
+        return cached
+
+    key = normalize_city_name(location)
+    task = _pending_geocodes.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_geocode(location))
+        _pending_geocodes[key] = task
+        task.add_done_callback(lambda done: _geocode_done(key, done))
+
+    # shield: một request bị hủy (client ngắt kết nối) không hủy lượt geocode của các request khác
+    return dict(await asyncio.shield(task))
+
+
+def _geocode_done(key, task):
+    if _pending_geocodes.get(key) is task:
+        del _pending_geocodes[key]
+    if not task.cancelled():
+        task.exception()  # đánh dấu đã xử lý khi mọi request chờ đều đã bị hủy
+
+
+@timed("upstream.openweather")
+async def _geocode(location):
     api_key = os.getenv('OPENWEATHER_API_KEY')
     if not api_key:
         raise ValueError("OPENWEATHER_API_KEY not found in environment variables")
 
-    encoded_location = urllib.parse.quote(location)
-    url = f"https://api.openweathermap.org/data/2.5/find?q={location}&appid={api_key}&units=metric"
-
-    headers = {
-        'Accept': '*/*',
-        'Accept-Language': 'vi-VN,vi;q=0.9,fr-FR;q=0.8,fr;q=0.7,en-US;q=0.6,en;q=0.5',
-        'Connection': 'keep-alive',
-        'Origin': 'https://openweathermap.org',
-        'Referer': 'https://openweathermap.org/',
-        'Sec-Fetch-Dest': 'empty',
-        'Sec-Fetch-Mode': 'cors',
-        'Sec-Fetch-Site': 'same-site',
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-        'sec-ch-ua': '"Google Chrome";v="131", "Chromium";v="131", "Not_A Brand";v="24"',
-        'sec-ch-ua-mobile': '?0',
-        'sec-ch-ua-platform': '"Windows"'
-    }
-
-    response = requests.get(url, headers=headers)
+    params = {"q": location, "appid": api_key, "units": "metric"}
+    response = await http_client.get(OPENWEATHER_URL, params=params, headers=OPENWEATHER_HEADERS)
 
     # Kiểm tra nếu có lỗi xảy ra
     if response.status_code != 200:
@@ -44,287 +78,311 @@ def get_coordinates(location):
     # Kiểm tra nếu danh sách 'list' không trống
     if "list" in data and len(data["list"]) > 0:
         coord = data["list"][0]["coord"]
+        geocode_cache.set(location, coord)
         return coord
     else:
         raise Exception("Location not found or data unavailable.")
 
 
-# Hàm giả lập tọa độ (Bạn thay bằng logic thực tế của bạn)
-
-def get_weather_data_24hour(location):
-    coord = get_coordinates(location)
-    lat = coord["lat"]
-    lon = coord["lon"]
-
-    # 1. Cấu hình URL:
-    # - forecast_days=2: Lấy 48h để đảm bảo đủ dữ liệu cho việc cắt 24h
-    # - timezone=Asia%2FBangkok: API trả về giờ GMT+7
-    url = (
-        f"https://api.open-meteo.com/v1/forecast?"
-        f"latitude={lat}&longitude={lon}&"
-        f"hourly=temperature_2m,apparent_temperature,dew_point_2m,precipitation,cloud_cover,"
-        f"relative_humidity_2m,wind_gusts_10m,wind_speed_10m,wind_direction_10m,"
-        f"surface_pressure,pressure_msl&"
-        f"timezone=Asia%2FBangkok&forecast_days=3"
-    )
-
-    try:
-        with urllib.request.urlopen(url) as response:
-            data = json.load(response)
-
-            # --- BẮT ĐẦU XỬ LÝ CẮT DATA 24H ---
-            if 'hourly' in data:
-                hourly = data['hourly']
-                times = hourly['time']
-
-                # 2. Xử lý thời gian
-                # Định nghĩa múi giờ GMT+7
-                tz_vn = timezone(timedelta(hours=7))
-
-                # Lấy giờ hiện tại hệ thống theo GMT+7, bỏ thông tin timezone để khớp format API
-                now_vn = datetime.now(tz_vn).replace(tzinfo=None)
-
-                # QUAN TRỌNG: Làm tròn về đầu giờ (VD: 23:10:07 -> 23:00:00)
-                # Để đảm bảo lấy luôn cả khung giờ hiện tại
-                target_time = now_vn.replace(minute=0, second=0, microsecond=0)
-
-                start_index = 0
-                found = False
-
-                # 3. Tìm vị trí bắt đầu
-                for i, t_str in enumerate(times):
-                    t_obj = datetime.strptime(t_str, "%Y-%m-%dT%H:%M")
-
-                    # So sánh: Nếu giờ trong API >= Giờ mục tiêu (đã làm tròn)
-                    if t_obj >= target_time:
-                        start_index = i
-                        found = True
-                        break
-
-                if found:
-                    # 4. Cắt dữ liệu: Lấy 24 mốc kể từ start_index
-                    new_hourly = {}
-                    # Duyệt qua tất cả các trường (temp, rain, wind...) và cắt đồng bộ
-                    for key, value_list in hourly.items():
-                        new_hourly[key] = value_list[start_index: start_index + 24]
-
-                    # Cập nhật lại biến data
-                    data['hourly'] = new_hourly
-                else:
-                    print("Cảnh báo: Không tìm thấy mốc thời gian phù hợp trong dữ liệu API.")
-
-            return data
-
-    except urllib.error.HTTPError as e:
-        try:
-            error_info = e.read().decode()
-        except:
-            error_info = str(e)
-        print('HTTP Error:', e.code, error_info)
+# Schema dữ liệu Open-Meteo: tên trường -> dtype (float32 cho số đo, cột 'time' là datetime64)
+HOURLY_SCHEMA = {
+    "temperature_2m": "float32",
+    "apparent_temperature": "float32",
+    "dew_point_2m": "float32",
+    "precipitation": "float32",
+    "cloud_cover": "float32",
+    "relative_humidity_2m": "float32",
+    "wind_gusts_10m": "float32",
+    "wind_speed_10m": "float32",
+    "wind_direction_10m": "float32",
+    "surface_pressure": "float32",
+    "pressure_msl": "float32",
+}
+DAILY_SCHEMA = {
+    "temperature_2m_mean": "float32",
+    "temperature_2m_max": "float32",
+    "temperature_2m_min": "float32",
+    "apparent_temperature_mean": "float32",
+    "apparent_temperature_max": "float32",
+    "apparent_temperature_min": "float32",
+    "dew_point_2m_mean": "float32",
+    "precipitation_sum": "float32",
+    "cloud_cover_mean": "float32",
+    "relative_humidity_2m_mean": "float32",
+    "wind_gusts_10m_mean": "float32",
+    "wind_speed_10m_mean": "float32",
+    "winddirection_10m_dominant": "float32",
+    "surface_pressure_mean": "float32",
+    "pressure_msl_mean": "float32",
+    "daylight_duration": "float32",
+    "sunshine_duration": "float32",
+}
+# Định dạng cột 'time' trong response Open-Meteo
+HOURLY_TIME_FORMAT = "%Y-%m-%dT%H:%M"
+DAILY_TIME_FORMAT = "%Y-%m-%d"
+
+# Danh sách biến Open-Meteo dùng chung cho các hàm crawl
+HOURLY_VARIABLES = ",".join(HOURLY_SCHEMA)
+DAILY_VARIABLES = ",".join(DAILY_SCHEMA)
+PAST_DAYS_30 = 29  # 29 ngày quá khứ + hôm nay = 30 ngày cho model 7day
+OPEN_METEO_BATCH_SIZE = int(os.getenv("OPEN_METEO_BATCH_SIZE", 50))  # số tọa độ tối đa / request
+
+# Định nghĩa múi giờ GMT+7
+TZ_VN = timezone(timedelta(hours=7))
+
+
+def slice_next_24h(data):
+    """
+    Cắt block `hourly` của response Open-Meteo còn 24 mốc, bắt đầu từ giờ hiện tại (GMT+7).
+
+    Args:
+        data (dict): Response JSON của Open-Meteo (timezone=Asia/Bangkok).
+
+    Returns:
+        dict: Chính `data`, với `data['hourly']` đã được cắt.
+    """
+    if 'hourly' not in data:
+        return data
+
+    hourly = data['hourly']
+    times = hourly['time']
+
+    # Lấy giờ hiện tại hệ thống theo GMT+7, bỏ thông tin timezone để khớp format API
+    now_vn = datetime.now(TZ_VN).replace(tzinfo=None)
+
+    # QUAN TRỌNG: Làm tròn về đầu giờ (VD: 23:10:07 -> 23:00:00)
+    # Để đảm bảo lấy luôn cả khung giờ hiện tại
+    target_time = now_vn.replace(minute=0, second=0, microsecond=0)
+
+    start_index = None
+
+    # Tìm vị trí bắt đầu: giờ trong API >= Giờ mục tiêu (đã làm tròn)
+    for i, t_str in enumerate(times):
+        if datetime.strptime(t_str, "%Y-%m-%dT%H:%M") >= target_time:
+            start_index = i
+            break
+
+    if start_index is None:
+        print("Cảnh báo: Không tìm thấy mốc thời gian phù hợp trong dữ liệu API.")
+        return data
+
+    # Cắt dữ liệu: Lấy 24 mốc kể từ start_index, đồng bộ cho tất cả các trường
+    data['hourly'] = {
+        key: value_list[start_index: start_index + 24]
+        for key, value_list in hourly.items()
+    }
+    return data
+
+
+@timed("upstream.open_meteo")
+async def _fetch_open_meteo(params):
+    """
+    Lấy response dạng Open-Meteo từ nguồn dữ liệu đang chọn (data_sources: live, local, replay),
+    None nếu lỗi. Nguồn mặc định theo WEATHER_SOURCE, có thể đổi theo từng request.
+    """
+    return await data_source().fetch(params)
+
+
+def split_weather_bundle(data, past_days=PAST_DAYS_30):
+    """
+    Tách response gộp (hourly + daily) thành 3 dạng cũ:
+    30 ngày (daily), 24 giờ (hourly) và hôm nay (daily 1 ngày).
+
+    Args:
+        past_days (int): past_days của request đã tải `data` (ngày "hôm nay" đứng sau chừng đó ngày).
+
+    Returns:
+        tuple: (weather_30d, weather_24h, weather_daily) - cùng cấu trúc với
+               get_weather_data_30 / get_weather_data_24hour / get_weather_data_daily.
+    """
+    meta = {k: v for k, v in data.items() if k not in ('hourly', 'hourly_units', 'daily', 'daily_units')}
+    daily = data.get('daily') or {}
+    times = daily.get('time') or []
+
+    # Vị trí "hôm nay" trong block daily (mặc định ngay sau `past_days` ngày quá khứ)
+    today_str = datetime.now(TZ_VN).strftime("%Y-%m-%d")
+    today_index = times.index(today_str) if today_str in times else min(past_days, max(len(times) - 1, 0))
+    start_30 = max(today_index + 1 - (PAST_DAYS_30 + 1), 0)
+
+    weather_30d = dict(meta, daily_units=data.get('daily_units', {}),
+                       daily={k: v[start_30: today_index + 1] for k, v in daily.items()})
+    weather_daily = dict(meta, daily_units=data.get('daily_units', {}),
+                         daily={k: v[today_index: today_index + 1] for k, v in daily.items()})
+    weather_24h = slice_next_24h(dict(meta, hourly_units=data.get('hourly_units', {}),
+                                      hourly=dict(data.get('hourly') or {})))
+
+    return weather_30d, weather_24h, weather_daily
+
+
+async def get_weather_data_all(location, past_days=PAST_DAYS_30):
+    """
+    Lấy dữ liệu cho cả 3 pipeline (30 ngày, 24 giờ, hôm nay) bằng MỘT request Open-Meteo.
+
+    Request gộp past_days=29, forecast_days=3, cả hourly lẫn daily, sau đó tách bằng
+    `split_weather_bundle`. Dùng thay cho việc gọi lần lượt get_weather_data_30,
+    get_weather_data_24hour và get_weather_data_daily (3 request).
+
+    Args:
+        past_days (int): Số ngày quá khứ cần tải. Khi cửa sổ 30 ngày đã có sẵn trong
+                         rolling_window, chỉ cần các ngày còn thiếu (thường là 0).
+
+    Returns:
+        tuple: (weather_30d, weather_24h, weather_daily), hoặc (None, None, None) nếu lỗi.
+    """
+    coord = await get_coordinates(location)
+
+    data = await _fetch_open_meteo({
+        "latitude": coord["lat"],
+        "longitude": coord["lon"],
+        "hourly": HOURLY_VARIABLES,
+        "daily": DAILY_VARIABLES,
+        "timezone": "Asia/Bangkok",
+        "past_days": past_days,
+        "forecast_days": 3,
+    })
+    if data is None:
+        return None, None, None
+    return split_weather_bundle(data, past_days)
+
+
+async def get_weather_data_all_batch(coords, past_days=PAST_DAYS_30):
+    """
+    Như `get_weather_data_all` nhưng cho nhiều tọa độ, dùng truy vấn nhiều tọa độ của Open-Meteo
+    (latitude=a,b,...&longitude=x,y,...). Mỗi request gom tối đa OPEN_METEO_BATCH_SIZE điểm,
+    các request được gửi đồng thời.
+
+    Args:
+        coords (list): Danh sách {"lat": float, "lon": float}.
+        past_days (int): Như `get_weather_data_all` (chung cho mọi tọa độ trong batch).
+
+    Returns:
+        list: Mỗi phần tử là (weather_30d, weather_24h, weather_daily) theo đúng thứ tự `coords`,
+              (None, None, None) cho các điểm thuộc request bị lỗi.
+    """
+    chunks = [coords[i: i + OPEN_METEO_BATCH_SIZE] for i in range(0, len(coords), OPEN_METEO_BATCH_SIZE)]
+
+    async def fetch_chunk(chunk):
+        data = await _fetch_open_meteo({
+            "latitude": ",".join(str(c["lat"]) for c in chunk),
+            "longitude": ",".join(str(c["lon"]) for c in chunk),
+            "hourly": HOURLY_VARIABLES,
+            "daily": DAILY_VARIABLES,
+            "timezone": "Asia/Bangkok",
+            "past_days": past_days,
+            "forecast_days": 3,
+        })
+        if data is None:
+            return [(None, None, None)] * len(chunk)
+        # Một tọa độ -> object, nhiều tọa độ -> list theo thứ tự gửi lên
+        payloads = data if isinstance(data, list) else [data]
+        return [split_weather_bundle(payload, past_days) for payload in payloads]
+
+    results = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+    return [bundle for chunk_result in results for bundle in chunk_result]
+
+
+async def get_weather_data_24hour(location):
+    coord = await get_coordinates(location)
+
+    # - forecast_days=3: Lấy dư dữ liệu để đảm bảo đủ cho việc cắt 24h
+    # - timezone=Asia/Bangkok: API trả về giờ GMT+7
+    data = await _fetch_open_meteo({
+        "latitude": coord["lat"],
+        "longitude": coord["lon"],
+        "hourly": HOURLY_VARIABLES,
+        "timezone": "Asia/Bangkok",
+        "forecast_days": 3,
+    })
+    if data is None:
         return None
 
-    except urllib.error.URLError as e:
-        print('URL Error:', e.reason)
-        return None
+    # Cắt 24h kể từ giờ hiện tại
+    return slice_next_24h(data)
 
 
-def get_weather_data_daily(location):
-    coord = get_coordinates(location)
-    lat = coord["lat"]
-    lon = coord["lon"]
+async def get_weather_data_daily(location):
+    coord = await get_coordinates(location)
 
-    url = (f"https://api.open-meteo.com/v1/forecast?"
-           f"latitude={lat}&longitude={lon}&"
-           f"daily=temperature_2m_mean,temperature_2m_max,"
-           f"temperature_2m_min,apparent_temperature_mean,apparent_temperature_max,apparent_temperature_min,dew_point_2m_mean,"
-           f"precipitation_sum,cloud_cover_mean,relative_humidity_2m_mean,wind_gusts_10m_mean,wind_speed_10m_mean,winddirection_10m_dominant,"
-           f"surface_pressure_mean,pressure_msl_mean,daylight_duration,sunshine_duration&timezone=Asia%2FBangkok&forecast_days=1")
-    try:
-        with urllib.request.urlopen(url) as response:
-            data = json.load(response)
-            return data
-    except urllib.error.HTTPError as e:
-        try:
-            error_info = e.read().decode()
-        except:
-            error_info = str(e)
-        print('HTTP Error:', e.code, error_info)
-        return None  # QUAN TRỌNG: Không được sys.exit()
-
-    except urllib.error.URLError as e:
-        print('URL Error:', e.reason)
-        return None  # QUAN TRỌNG: Không được sys.exit()
-
-
-def get_weather_data_30(location):
-    coord = get_coordinates(location)
-    lat = coord["lat"]
-    lon = coord["lon"]
-
-    url = (f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&daily=temperature_2m_mean,"
-           f"temperature_2m_max,temperature_2m_min,apparent_temperature_mean,apparent_temperature_max,apparent_temperature_min,"
-           f"dew_point_2m_mean,precipitation_sum,cloud_cover_mean,relative_humidity_2m_mean,wind_gusts_10m_mean,wind_speed_10m_mean,"
-           f"winddirection_10m_dominant,surface_pressure_mean,pressure_msl_mean,daylight_duration,"
-           f"sunshine_duration&timezone=Asia%2FBangkok&past_days=29&forecast_days=1")
-    try:
-        with urllib.request.urlopen(url) as response:
-            data = json.load(response)
-            return data
-    except urllib.error.HTTPError as e:
-        try:
-            error_info = e.read().decode()
-        except:
-            error_info = str(e)
-        print('HTTP Error:', e.code, error_info)
-        return None  # QUAN TRỌNG: Không được sys.exit()
-
-    except urllib.error.URLError as e:
-        print('URL Error:', e.reason)
-        return None  # QUAN TRỌNG: Không được sys.exit()
+    return await _fetch_open_meteo({
+        "latitude": coord["lat"],
+        "longitude": coord["lon"],
+        "daily": DAILY_VARIABLES,
+        "timezone": "Asia/Bangkok",
+        "forecast_days": 1,
+    })
 
 
-def process_daily_weather_data(weather):
-    # Kiểm tra nếu "daily" có dữ liệu
-    if not weather.get("daily") or not weather["daily"].get("time"):
-        return pd.DataFrame()  # Nếu không có dữ liệu, trả về DataFrame rỗng
+async def get_weather_data_30(location):
+    coord = await get_coordinates(location)
 
-    daily_data = weather["daily"]
-
-    # Lấy dữ liệu ngày đầu tiên (index 0)
-    day_weather_data = {
-        "time": daily_data["time"][0] if daily_data.get("time") else None,
-        "temperature_2m_mean": daily_data["temperature_2m_mean"][0] if daily_data.get("temperature_2m_mean") else None,
-        "temperature_2m_max": daily_data["temperature_2m_max"][0] if daily_data.get("temperature_2m_max") else None,
-        "temperature_2m_min": daily_data["temperature_2m_min"][0] if daily_data.get("temperature_2m_min") else None,
-        "apparent_temperature_mean": daily_data["apparent_temperature_mean"][0] if daily_data.get(
-            "apparent_temperature_mean") else None,
-        "apparent_temperature_max": daily_data["apparent_temperature_max"][0] if daily_data.get(
-            "apparent_temperature_max") else None,
-        "apparent_temperature_min": daily_data["apparent_temperature_min"][0] if daily_data.get(
-            "apparent_temperature_min") else None,
-        "dew_point_2m_mean": daily_data["dew_point_2m_mean"][0] if daily_data.get("dew_point_2m_mean") else None,
-        "precipitation_sum": daily_data["precipitation_sum"][0] if daily_data.get("precipitation_sum") else None,
-        "cloud_cover_mean": daily_data["cloud_cover_mean"][0] if daily_data.get("cloud_cover_mean") else None,
-        "relative_humidity_2m_mean": daily_data["relative_humidity_2m_mean"][0] if daily_data.get(
-            "relative_humidity_2m_mean") else None,
-        "wind_gusts_10m_mean": daily_data["wind_gusts_10m_mean"][0] if daily_data.get("wind_gusts_10m_mean") else None,
-        "wind_speed_10m_mean": daily_data["wind_speed_10m_mean"][0] if daily_data.get("wind_speed_10m_mean") else None,
-        "winddirection_10m_dominant": daily_data["winddirection_10m_dominant"][0] if daily_data.get(
-            "winddirection_10m_dominant") else None,
-        "surface_pressure_mean": daily_data["surface_pressure_mean"][0] if daily_data.get(
-            "surface_pressure_mean") else None,
-        "pressure_msl_mean": daily_data["pressure_msl_mean"][0] if daily_data.get("pressure_msl_mean") else None,
-        "daylight_duration": daily_data["daylight_duration"][0] if daily_data.get("daylight_duration") else None,
-        "sunshine_duration": daily_data["sunshine_duration"][0] if daily_data.get("sunshine_duration") else None,
-    }
+    return await _fetch_open_meteo({
+        "latitude": coord["lat"],
+        "longitude": coord["lon"],
+        "daily": DAILY_VARIABLES,
+        "timezone": "Asia/Bangkok",
+        "past_days": PAST_DAYS_30,
+        "forecast_days": 1,
+    })
 
-    df_day = pd.DataFrame([day_weather_data])
-    return df_day
 
+def block_to_frame(block, schema, time_format):
+    """
+    Dựng DataFrame theo cột trực tiếp từ các mảng trong block `hourly`/`daily` của Open-Meteo.
 
-def process_hourly_weather_data(weather):
-    # Kiểm tra nếu "hourly" có dữ liệu
-    if not weather.get("hourly") or not weather["hourly"].get("time"):
+    Args:
+        block (dict): {"time": [...], <trường>: [...], ...}
+        schema (dict): Tên trường -> dtype. Trường thiếu trong block sẽ là cột NaN.
+        time_format (str): Định dạng chuỗi thời gian trong block.
+
+    Returns:
+        pd.DataFrame: Cột 'time' (datetime64) + các cột trong schema theo đúng thứ tự,
+                      DataFrame rỗng nếu block không có dữ liệu.
+    """
+    if not block or not block.get("time"):
         return pd.DataFrame()  # Nếu không có dữ liệu, trả về DataFrame rỗng
 
-    hourly_data = weather["hourly"]
+    num_rows = len(block["time"])
+    columns = {"time": pd.to_datetime(block["time"], format=time_format, errors="coerce")}
+    for field, dtype in schema.items():
+        values = block.get(field)
+        if values:
+            # None (giá trị thiếu) -> NaN khi ép sang float
+            columns[field] = np.asarray(values, dtype=np.float64).astype(dtype, copy=False)
+        else:
+            columns[field] = np.full(num_rows, np.nan, dtype=dtype)
 
-    # Lấy số lượng giờ có trong dữ liệu
-    num_hours = len(hourly_data["time"])
+    return pd.DataFrame(columns)
 
-    processed_hours = []
 
-    # Duyệt qua từng giờ
-    for i in range(num_hours):
-        hour_data = {
-            "time": hourly_data["time"][i] if hourly_data.get("time") else None,
-            "temperature_2m": hourly_data["temperature_2m"][i] if hourly_data.get("temperature_2m") else None,
-            "apparent_temperature": hourly_data["apparent_temperature"][i] if hourly_data.get(
-                "apparent_temperature") else None,
-            "dew_point_2m": hourly_data["dew_point_2m"][i] if hourly_data.get("dew_point_2m") else None,
-            "precipitation": hourly_data["precipitation"][i] if hourly_data.get("precipitation") else None,
-            "cloud_cover": hourly_data["cloud_cover"][i] if hourly_data.get("cloud_cover") else None,
-            "relative_humidity_2m": hourly_data["relative_humidity_2m"][i] if hourly_data.get(
-                "relative_humidity_2m") else None,
-            "wind_gusts_10m": hourly_data["wind_gusts_10m"][i] if hourly_data.get("wind_gusts_10m") else None,
-            "wind_speed_10m": hourly_data["wind_speed_10m"][i] if hourly_data.get("wind_speed_10m") else None,
-            "wind_direction_10m": hourly_data["wind_direction_10m"][i] if hourly_data.get(
-                "wind_direction_10m") else None,
-            "surface_pressure": hourly_data["surface_pressure"][i] if hourly_data.get("surface_pressure") else None,
-            "pressure_msl": hourly_data["pressure_msl"][i] if hourly_data.get("pressure_msl") else None,
-        }
+@timed("process.daily")
+def process_daily_weather_data(weather):
+    # Chỉ lấy dữ liệu ngày đầu tiên (index 0)
+    daily = (weather.get("daily") or {})
+    return block_to_frame({k: v[:1] for k, v in daily.items()}, DAILY_SCHEMA, DAILY_TIME_FORMAT)
 
-        processed_hours.append(hour_data)
 
-    df_hour = pd.DataFrame(processed_hours)
-    return df_hour
+@timed("process.hourly")
+def process_hourly_weather_data(weather):
+    return block_to_frame(weather.get("hourly"), HOURLY_SCHEMA, HOURLY_TIME_FORMAT)
 
 
+@timed("process.30day")
 def process_30day_weather_data(weather):
-    # Kiểm tra nếu "daily" có dữ liệu
-    if not weather.get("daily") or not weather["daily"].get("time"):
-        return pd.DataFrame()  # Nếu không có dữ liệu, trả về DataFrame rỗng
-
-    daily_data = weather["daily"]
-
-    # Lấy số lượng ngày có trong dữ liệu
-    num_days = len(daily_data["time"])
-
-    processed_days = []
-
-    # Duyệt qua từng ngày
-    for i in range(num_days):
-        day_data = {
-            "time": daily_data["time"][i] if daily_data.get("time") else None,
-            "temperature_2m_mean": daily_data["temperature_2m_mean"][i] if daily_data.get(
-                "temperature_2m_mean") else None,
-            "temperature_2m_max": daily_data["temperature_2m_max"][i] if daily_data.get("temperature_2m_max") else None,
-            "temperature_2m_min": daily_data["temperature_2m_min"][i] if daily_data.get("temperature_2m_min") else None,
-            "apparent_temperature_mean": daily_data["apparent_temperature_mean"][i] if daily_data.get(
-                "apparent_temperature_mean") else None,
-            "apparent_temperature_max": daily_data["apparent_temperature_max"][i] if daily_data.get(
-                "apparent_temperature_max") else None,
-            "apparent_temperature_min": daily_data["apparent_temperature_min"][i] if daily_data.get(
-                "apparent_temperature_min") else None,
-            "dew_point_2m_mean": daily_data["dew_point_2m_mean"][i] if daily_data.get("dew_point_2m_mean") else None,
-            "precipitation_sum": daily_data["precipitation_sum"][i] if daily_data.get("precipitation_sum") else None,
-            "cloud_cover_mean": daily_data["cloud_cover_mean"][i] if daily_data.get("cloud_cover_mean") else None,
-            "relative_humidity_2m_mean": daily_data["relative_humidity_2m_mean"][i] if daily_data.get(
-                "relative_humidity_2m_mean") else None,
-            "wind_gusts_10m_mean": daily_data["wind_gusts_10m_mean"][i] if daily_data.get(
-                "wind_gusts_10m_mean") else None,
-            "wind_speed_10m_mean": daily_data["wind_speed_10m_mean"][i] if daily_data.get(
-                "wind_speed_10m_mean") else None,
-            "winddirection_10m_dominant": daily_data["winddirection_10m_dominant"][i] if daily_data.get(
-                "winddirection_10m_dominant") else None,
-            "surface_pressure_mean": daily_data["surface_pressure_mean"][i] if daily_data.get(
-                "surface_pressure_mean") else None,
-            "pressure_msl_mean": daily_data["pressure_msl_mean"][i] if daily_data.get("pressure_msl_mean") else None,
-            "daylight_duration": daily_data["daylight_duration"][i] if daily_data.get("daylight_duration") else None,
-            "sunshine_duration": daily_data["sunshine_duration"][i] if daily_data.get("sunshine_duration") else None,
-        }
-
-        processed_days.append(day_data)
-
-    df_30days = pd.DataFrame(processed_days)
-    return df_30days
-
+    return block_to_frame(weather.get("daily"), DAILY_SCHEMA, DAILY_TIME_FORMAT)
 
-if __name__ == "__main__":
-    # Nhập tên thành phố
-    city = input("Nhập tên thành phố (ví dụ: Đà Nẵng): ")
 
+async def _main(city):
     try:
         # 1. Lấy tọa độ từ tên thành phố
         print(f"\n[1] Lấy tọa độ cho '{city}'...")
-        coord = get_coordinates(city)
+        coord = await get_coordinates(city)
         lat = coord["lat"]
         lon = coord["lon"]
         print(f"    ✓ Latitude: {lat}, Longitude: {lon}")
 
         # 2. Lấy dữ liệu thời tiết 24 giờ
         print(f"\n[2] Lấy dữ liệu thời tiết 24 giờ...")
-        weather_24h = get_weather_data_24hour(city)
+        weather_24h = await get_weather_data_24hour(city)
         if weather_24h:
             print(f"    ✓ Đã lấy dữ liệu 24 giờ")
             df_24h = process_hourly_weather_data(weather_24h)
@@ -335,7 +393,7 @@ if __name__ == "__main__":
 
         # 3. Lấy dữ liệu thời tiết hàng ngày
         print(f"\n[3] Lấy dữ liệu thời tiết hàng ngày...")
-        weather_daily = get_weather_data_daily(city)
+        weather_daily = await get_weather_data_daily(city)
         if weather_daily:
             print(f"    ✓ Đã lấy dữ liệu hàng ngày")
             df_daily = process_daily_weather_data(weather_daily)
@@ -346,7 +404,7 @@ if __name__ == "__main__":
 
         # 4. Lấy dữ liệu thời tiết 30 ngày
         print(f"\n[4] Lấy dữ liệu thời tiết 30 ngày...")
-        weather_30d = get_weather_data_30(city)
+        weather_30d = await get_weather_data_30(city)
         if weather_30d:
             print(f"    ✓ Đã lấy dữ liệu 30 ngày")
             df_30d = process_30day_weather_data(weather_30d)
@@ -359,4 +417,11 @@ if __name__ == "__main__":
 
     except Exception as e:
         print(f"\n❌ Lỗi: {e}")
+    finally:
+        await close_client()
+
 
+if __name__ == "__main__":
+    # Nhập tên thành phố
+    city = input("Nhập tên thành phố (ví dụ: Đà Nẵng): ")
+    asyncio.run(_main(city))
@@ -0,0 +1,285 @@
+import calendar
+import contextvars
+import hashlib
+import json
+import os
+from datetime import datetime, date, timedelta, timezone
+
+import httpx
+import numpy as np
+from dotenv import load_dotenv
+
+from http_client import fetch_json
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cấu hình qua biến môi trường
+WEATHER_SOURCE = os.getenv("WEATHER_SOURCE", "live").lower()        # live | local | replay | record
+# Nguồn client được chọn theo từng request (X-Weather-Source / ?source=), VD: "local,replay" cho môi trường
+# test/benchmark. Mặc định rỗng = không cho đổi; "record" (gọi API thật + ghi file) không bao giờ được chọn theo request
+WEATHER_SOURCE_OVERRIDES_ENV = os.getenv("WEATHER_SOURCE_OVERRIDES", "")
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+LOCAL_SOURCE_DATE = os.getenv("LOCAL_SOURCE_DATE")                   # VD: 2024-06-15 (mặc định: cùng ngày, năm gần nhất có dữ liệu)
+REPLAY_DIR = os.getenv("REPLAY_DIR", os.path.join(BASE_DIR, "cache", "replay"))
+
+TZ_VN = timezone(timedelta(hours=7))
+
+# Đơn vị thời gian của cột 'time' trong từng block response Open-Meteo
+_BLOCK_TIME_UNITS = {"hourly": "datetime64[m]", "daily": "datetime64[D]"}
+
+
+def _today_vn():
+    return datetime.now(TZ_VN).date()
+
+
+def float32_to_float64(values):
+    """
+    float32 -> float64 ngắn gọn nhất mà vẫn đúng là giá trị float32 đó (23.1 thay vì 23.100000381469727),
+    như chuỗi ngắn nhất của float32 nhưng tính bằng số học vector: làm tròn 7 chữ số có nghĩa, các phần tử
+    không khôi phục được đúng float32 thì 8, rồi 9 chữ số (luôn đủ). NaN giữ nguyên.
+    """
+    original = np.asarray(values, dtype=np.float32)
+    values = original.astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    magnitude = np.where(np.isfinite(magnitude), magnitude, 0)
+
+    result = values
+    for digits in (9, 8, 7):
+        decimals = digits - 1 - magnitude
+        # Nhân/chia cho lũy thừa 10 dương (số nguyên chính xác) để ra double gần nhất với số thập phân
+        scale = 10.0 ** np.abs(decimals)
+        rounded = np.where(decimals >= 0, np.round(values * scale) / scale, np.round(values / scale) * scale)
+        result = np.where(rounded.astype(np.float32) == original, rounded, result)
+    return result
+
+
+def shift_payload_dates(data, days):
+    """
+    Dời mọi mốc thời gian trong response dạng Open-Meteo (dict hoặc list dict) đi `days` ngày,
+    giữ nguyên giờ trong ngày. Dùng để phát lại dữ liệu cũ như thể nó là dữ liệu hôm nay.
+    """
+    if not days:
+        return data
+    if isinstance(data, list):
+        return [shift_payload_dates(item, days) for item in data]
+
+    shifted = dict(data)
+    for block, unit in _BLOCK_TIME_UNITS.items():
+        values = (data.get(block) or {}).get("time")
+        if values:
+            times = np.array(values, dtype=unit) + np.timedelta64(days, "D")
+            shifted[block] = dict(data[block], time=np.datetime_as_string(times).tolist())
+    return shifted
+
+
+class LiveSource:
+    """Gọi Open-Meteo thật qua connection pool dùng chung."""
+
+    name = "live"
+
+    async def fetch(self, params):
+        """Gọi Open-Meteo và trả về JSON, None nếu lỗi (không được sys.exit())."""
+        try:
+            return await fetch_json(OPEN_METEO_URL, params=params)
+        except httpx.HTTPStatusError as e:
+            print('HTTP Error:', e.response.status_code, e.response.text)
+            return None
+
+        except httpx.RequestError as e:
+            print('URL Error:', repr(e))
+            return None
+
+
+class LocalHistorySource:
+    """
+    Dựng response dạng Open-Meteo từ store lịch sử 63 tỉnh (history_store), không gọi mạng.
+
+    Tọa độ được ánh xạ về tỉnh gần nhất. "Hôm nay" ứng với cùng ngày/tháng của năm gần nhất
+    có đủ dữ liệu (hoặc LOCAL_SOURCE_DATE), rồi mốc thời gian được dời về ngày hiện tại để các
+    bước cắt 30 ngày / 24 giờ phía sau hoạt động như với dữ liệu thật. Cùng cấu hình thì
+    cùng kết quả - dùng được cho benchmark offline.
+    """
+
+    name = "local"
+
+    def __init__(self, store=None, anchor_date=LOCAL_SOURCE_DATE):
+        self._store = store
+        self.anchor_date = date.fromisoformat(anchor_date) if anchor_date else None
+
+    @property
+    def store(self):
+        if self._store is None:
+            from history_store import get_store
+            self._store = get_store()
+        return self._store
+
+    def _anchor(self, today, province, freq, forecast_days):
+        if self.anchor_date is not None:
+            return self.anchor_date
+        last = self.store.time_range(province, freq)[1].astype("datetime64[D]").astype(date)
+        year = last.year
+        while True:
+            day = min(today.day, calendar.monthrange(year, today.month)[1])
+            anchor = date(year, today.month, day)
+            if anchor + timedelta(days=forecast_days - 1) <= last:
+                return anchor
+            year -= 1
+
+    def _block(self, province, freq, variables, start, end, shift_days):
+        columns = set(self.store.columns(freq))
+        arrays = self.store.arrays(province, freq, start, end, [v for v in variables if v in columns])
+        times = arrays["time"] + np.timedelta64(shift_days, "D")
+        block = {"time": np.datetime_as_string(times).tolist()}
+        for var in variables:
+            if var not in arrays:
+                block[var] = [None] * len(times)
+                continue
+            # float32 -> float64 (23.1 thay vì 23.100000381469727), NaN -> None
+            values = float32_to_float64(arrays[var])
+            block[var] = np.where(np.isnan(values), None, values).tolist()
+        return block
+
+    def _payload(self, lat, lon, params):
+        past_days = int(params.get("past_days", 0))
+        forecast_days = int(params.get("forecast_days", 7))
+        freq = "daily" if params.get("daily") else "hourly"
+
+        province = self.store.nearest_province(lat, lon, freq=freq)
+        coord = self.store.coordinates(province)
+        today = _today_vn()
+        anchor = self._anchor(today, province, freq, forecast_days)
+        shift_days = (today - anchor).days
+
+        first_day = anchor - timedelta(days=past_days)
+        last_day = anchor + timedelta(days=forecast_days - 1)
+
+        payload = {
+            "latitude": coord["lat"],
+            "longitude": coord["lon"],
+            "timezone": params.get("timezone", "GMT"),
+            "utc_offset_seconds": 25200,
+            "source": self.name,
+            "province": province,
+        }
+        if params.get("hourly"):
+            payload["hourly_units"] = {"time": "iso8601"}
+            payload["hourly"] = self._block(
+                province, "hourly", params["hourly"].split(","),
+                datetime.combine(first_day, datetime.min.time()),
+                datetime.combine(last_day, datetime.min.time()) + timedelta(hours=23),
+                shift_days,
+            )
+        if params.get("daily"):
+            payload["daily_units"] = {"time": "iso8601"}
+            payload["daily"] = self._block(province, "daily", params["daily"].split(","),
+                                           first_day, last_day, shift_days)
+        return payload
+
+    async def fetch(self, params):
+        lats = str(params["latitude"]).split(",")
+        lons = str(params["longitude"]).split(",")
+        try:
+            payloads = [self._payload(float(lat), float(lon), params) for lat, lon in zip(lats, lons)]
+        except (OSError, KeyError, ValueError) as e:
+            print('Local source error:', repr(e))
+            return None
+        # Giống Open-Meteo: một tọa độ -> object, nhiều tọa độ -> list
+        return payloads[0] if len(payloads) == 1 else payloads
+
+
+class ReplaySource:
+    """
+    Phát lại response đã ghi (mỗi bộ tham số một file JSON trong REPLAY_DIR).
+
+    Với record=True, request chưa có bản ghi sẽ gọi Open-Meteo thật rồi lưu lại.
+    Khi phát lại, mốc thời gian được dời theo số ngày kể từ lúc ghi.
+    """
+
+    def __init__(self, directory=REPLAY_DIR, record=False, upstream=None):
+        self.directory = directory
+        self.record = record
+        self.upstream = upstream or LiveSource()
+        self.name = "record" if record else "replay"
+
+    def _path(self, params):
+        canonical = json.dumps(params, sort_keys=True, default=str)
+        return os.path.join(self.directory, hashlib.sha1(canonical.encode()).hexdigest()[:20] + ".json")
+
+    async def fetch(self, params):
+        path = self._path(params)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                recorded = json.load(f)
+            days = (_today_vn() - date.fromisoformat(recorded["recorded_on"])).days
+            return shift_payload_dates(recorded["response"], days)
+
+        if not self.record:
+            print(f"Replay miss: no recording for {params}")
+            return None
+
+        response = await self.upstream.fetch(params)
+        if response is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"recorded_on": _today_vn().isoformat(), "params": params, "response": response},
+                          f, ensure_ascii=False)
+        return response
+
+
+SOURCE_FACTORIES = {
+    "live": LiveSource,
+    "local": LocalHistorySource,
+    "replay": ReplaySource,
+    "record": lambda: ReplaySource(record=True),
+}
+_sources = {}
+
+# Nguồn dữ liệu của request hiện tại (chọn qua header X-Weather-Source / ?source=)
+_active_source = contextvars.ContextVar("weather_source", default=None)
+
+
+def get_source(name):
+    """Trả về (và tạo nếu cần) nguồn dữ liệu theo tên: live | local | replay | record."""
+    name = name.lower()
+    if name not in SOURCE_FACTORIES:
+        raise ValueError(f"Unknown weather source: {name} (expected one of {', '.join(SOURCE_FACTORIES)})")
+    if name not in _sources:
+        _sources[name] = SOURCE_FACTORIES[name]()
+    return _sources[name]
+
+
+def use_data_source(name):
+    """Chọn nguồn dữ liệu cho context hiện tại (request); ValueError nếu tên không hợp lệ."""
+    source = get_source(name)
+    _active_source.set(source)
+    return source
+
+
+def parse_source_overrides(value):
+    """Danh sách nguồn cách nhau bởi dấu phẩy -> tập tên nguồn được chọn theo request (luôn bỏ 'record')."""
+    return {name.strip().lower() for name in (value or "").split(",") if name.strip()} - {"record"}
+
+
+WEATHER_SOURCE_OVERRIDES = parse_source_overrides(WEATHER_SOURCE_OVERRIDES_ENV)
+
+
+def use_request_source(name):
+    """
+    Chọn nguồn dữ liệu theo yêu cầu của client cho request hiện tại.
+
+    Raises:
+        PermissionError: Nếu nguồn không nằm trong WEATHER_SOURCE_OVERRIDES (trừ khi trùng nguồn mặc định).
+        ValueError: Nếu tên không hợp lệ.
+    """
+    name = name.lower()
+    if name != WEATHER_SOURCE and name not in WEATHER_SOURCE_OVERRIDES:
+        raise PermissionError(f"Weather source '{name}' cannot be selected per request")
+    return use_data_source(name)
+
+
+def data_source():
+    """Nguồn dữ liệu đang dùng: theo request nếu có, ngược lại theo WEATHER_SOURCE."""
+    return _active_source.get() or get_source(WEATHER_SOURCE)
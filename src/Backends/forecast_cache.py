@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from fastapi.encoders import jsonable_encoder
+
+from cache_store import TTLCache
+
+load_dotenv()
+
+# Cấu hình qua biến môi trường
+FORECAST_CACHE_BACKEND = os.getenv("FORECAST_CACHE_BACKEND", "memory")  # memory | redis | none
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", 2048))
+FORECAST_CACHE_PREFIX = os.getenv("FORECAST_CACHE_PREFIX", "forecast:")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+TZ_VN = timezone(timedelta(hours=7))
+
+
+def current_hour_bucket(now=None):
+    """Mốc giờ GMT+7 hiện tại, VD: '2026-01-05T14'. Forecast chỉ đổi khi sang giờ mới."""
+    now = now or datetime.now(TZ_VN)
+    return now.strftime("%Y-%m-%dT%H")
+
+
+def seconds_until_next_hour(now=None):
+    """Số giây còn lại tới đầu giờ kế tiếp (GMT+7) - dùng làm TTL cho cache."""
+    now = now or datetime.now(TZ_VN)
+    next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return max((next_hour - now).total_seconds(), 1.0)
+
+
+def make_key(endpoint, coord, model_version, hour_bucket=None, source="live"):
+    """
+    Khóa cache: (endpoint, tọa độ làm tròn 4 chữ số ~ 11m, phiên bản model, mốc giờ GMT+7),
+    thêm tên nguồn dữ liệu nếu không phải Open-Meteo thật (local/replay).
+    """
+    hour_bucket = hour_bucket or current_hour_bucket()
+    key = (f"{endpoint}|{round(float(coord['lat']), 4)},{round(float(coord['lon']), 4)}"
+           f"|{model_version}|{hour_bucket}")
+    return key if source == "live" else f"{key}|{source}"
+
+
+class MemoryBackend:
+    """Backend LRU trong tiến trình (mỗi worker uvicorn có cache riêng)."""
+
+    def __init__(self, maxsize=FORECAST_CACHE_SIZE):
+        self._cache = TTLCache(maxsize=maxsize)
+
+    async def get(self, key):
+        return self._cache.get(key)
+
+    async def set(self, key, value, ttl):
+        self._cache.set(key, value, ttl=ttl)
+
+    async def close(self):
+        self._cache.clear()
+
+
+class RedisBackend:
+    """
+    Backend dùng chung giữa các worker/máy qua Redis (hoặc server tương thích giao thức Redis).
+
+    Cần package `redis` (redis.asyncio); giá trị lưu dưới dạng JSON.
+
+    Args:
+        client: Client kiểu redis.asyncio có sẵn (VD: fakeredis trong test); None = tạo từ `url`.
+    """
+
+    def __init__(self, url=REDIS_URL, prefix=FORECAST_CACHE_PREFIX, client=None):
+        if client is None:
+            try:
+                import redis.asyncio as redis_asyncio
+            except ImportError as e:
+                raise ImportError("FORECAST_CACHE_BACKEND=redis requires the 'redis' package (pip install redis)") from e
+            client = redis_asyncio.from_url(url)
+        self._redis = client
+        self.prefix = prefix
+
+    async def get(self, key):
+        raw = await self._redis.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key, value, ttl):
+        payload = json.dumps(jsonable_encoder(value), ensure_ascii=False)
+        await self._redis.set(self.prefix + key, payload, ex=max(int(ttl), 1))
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class ForecastCache:
+    """
+    Cache response forecast với single-flight: nhiều request giống hệt nhau đến cùng lúc
+    chỉ chạy `compute` một lần, các request còn lại chờ và dùng chung kết quả.
+
+    Args:
+        backend: MemoryBackend, RedisBackend hoặc None (tắt cache, vẫn giữ single-flight).
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_compute(self, key, compute, ttl=None):
+        """
+        Trả về kết quả đã cache cho `key`, hoặc chạy `await compute()` rồi lưu lại.
+
+        Lỗi trong `compute` không được cache và được ném lại cho mọi request đang chờ.
+        """
+        if self.backend is not None:
+            cached = await self.backend.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        task = asyncio.ensure_future(self._compute_and_store(key, compute, ttl))
+        self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def get(self, key):
+        """Kết quả đã cache hoặc đang được tính (single-flight) cho `key`, None nếu chưa có."""
+        if self.backend is not None:
+            cached = await self.backend.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key, value, ttl=None):
+        """Lưu kết quả tính bên ngoài `get_or_compute` (VD: response streaming đã ghép đủ các phần)."""
+        if self.backend is not None:
+            await self.backend.set(key, value, ttl if ttl is not None else seconds_until_next_hour())
+
+    async def _compute_and_store(self, key, compute, ttl):
+        try:
+            result = await compute()
+            if self.backend is not None:
+                await self.backend.set(key, result, ttl if ttl is not None else seconds_until_next_hour())
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+
+def create_backend(name=FORECAST_CACHE_BACKEND):
+    """Tạo backend theo cấu hình FORECAST_CACHE_BACKEND."""
+    name = (name or "none").lower()
+    if name == "memory":
+        return MemoryBackend()
+    if name == "redis":
+        return RedisBackend()
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown FORECAST_CACHE_BACKEND: {name}")
+
+
+forecast_cache = ForecastCache(create_backend())
@@ -0,0 +1,148 @@
+import csv
+import glob
+import os
+import re
+import unicodedata
+
+from dotenv import load_dotenv
+
+from cache_store import TTLCache, SQLiteStore
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cấu hình qua biến môi trường
+GEOCODE_CACHE_DB = os.getenv("GEOCODE_CACHE_DB", os.path.join(BASE_DIR, "cache", "geocode.sqlite3"))
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", 30 * 24 * 3600))  # 30 ngày
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", 1024))
+GEOCODE_SEED_DIR = os.getenv("GEOCODE_SEED_DIR", os.path.join(BASE_DIR, "..", "data", "daily"))
+
+# Tiền tố/hậu tố hành chính bỏ đi khi chuẩn hóa ("Thành phố Đà Nẵng" -> "danang")
+_ADMIN_WORDS = re.compile(r"^(thanh pho|tinh|tp\.?)\s+|\s+(city|province)$")
+
+# Tên chính thức / tên thường gọi (đã chuẩn hóa) -> khóa tỉnh trong seed (tên file src/data/daily/<tinh>_daily.csv),
+# để các tên này trúng tọa độ nạp sẵn thay vì gọi OpenWeatherMap (trả về tọa độ lệch với khóa precompute)
+PROVINCE_ALIASES = {
+    "thuathienhue": "hue",
+    "bariavungtau": "vungtau",
+    "baria": "vungtau",
+    "hochiminhcity": "hochiminh",
+    "tphcm": "hochiminh",
+    "tphochiminh": "hochiminh",
+    "hcm": "hochiminh",
+    "hcmc": "hochiminh",
+    "saigon": "hochiminh",
+    "daclac": "daklak",
+    "darlac": "daklak",
+    "daclak": "daklak",
+    "dacnong": "daknong",
+}
+
+
+def normalize_city_name(name):
+    """
+    Chuẩn hóa tên thành phố làm khóa cache: bỏ dấu tiếng Việt, chữ thường,
+    bỏ "Thành phố"/"Tỉnh"/"City" và mọi ký tự không phải chữ/số.
+
+    Ví dụ: "Đà Nẵng", "da nang", "Thành phố Đà Nẵng" -> "danang"
+           "Thừa Thiên Huế" -> "hue", "Sài Gòn" -> "hochiminh" (PROVINCE_ALIASES)
+    """
+    text = name.strip().lower().replace("đ", "d")
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    text = re.sub(r"\s+", " ", text)
+    text = _ADMIN_WORDS.sub("", text)
+    key = re.sub(r"[^a-z0-9]", "", text)
+    return PROVINCE_ALIASES.get(key, key)
+
+
+def _first_float_row(path):
+    """Trả về dòng đầu tiên của file CSV có 2 cột cuối là số (lat, lon)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            try:
+                return float(row[-2]), float(row[-1])
+            except ValueError:
+                continue
+    return None
+
+
+def load_province_seeds(seed_dir=GEOCODE_SEED_DIR):
+    """
+    Đọc cặp (lat, lon) của 63 tỉnh từ src/data/daily/*.csv.
+
+    Mỗi file `<tinh>_daily.csv` có cột latitude/longitude ở cuối, chỉ cần đọc dòng dữ liệu đầu tiên
+    (một số file không có header). Nếu file daily rỗng thì lấy từ phần metadata đầu file
+    `../hourly/<tinh>_hourly.csv` (dòng `latitude,longitude,...`).
+
+    Returns:
+        dict: {tên tỉnh đã chuẩn hóa: {"lat": float, "lon": float}}
+    """
+    hourly_dir = os.path.join(seed_dir, "..", "hourly")
+    seeds = {}
+    for path in sorted(glob.glob(os.path.join(seed_dir, "*_daily.csv"))):
+        province = os.path.basename(path)[:-len("_daily.csv")]
+        latlon = _first_float_row(path)
+
+        if latlon is None:
+            hourly_path = os.path.join(hourly_dir, f"{province}_hourly.csv")
+            if os.path.exists(hourly_path):
+                with open(hourly_path, newline="", encoding="utf-8") as f:
+                    reader = csv.reader(f)
+                    header, values = next(reader, []), next(reader, [])
+                meta = dict(zip(header, values))
+                if meta.get("latitude") and meta.get("longitude"):
+                    latlon = float(meta["latitude"]), float(meta["longitude"])
+
+        if latlon is not None:
+            seeds[normalize_city_name(province)] = {"lat": latlon[0], "lon": latlon[1]}
+    return seeds
+
+
+class GeocodeCache:
+    """
+    Cache tọa độ theo tên thành phố đã chuẩn hóa.
+
+    Hai tầng: LRU có TTL trong tiến trình (nhanh nhất), phía sau là SQLite trên đĩa
+    dùng chung giữa các worker uvicorn và còn nguyên sau khi khởi động lại.
+    Tọa độ 63 tỉnh được nạp sẵn (không hết hạn) nên các tỉnh không cần gọi mạng.
+    """
+
+    def __init__(self, db_path=GEOCODE_CACHE_DB, ttl=GEOCODE_CACHE_TTL,
+                 maxsize=GEOCODE_CACHE_SIZE, seed_dir=GEOCODE_SEED_DIR):
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.store = SQLiteStore(db_path, table="geocode")
+        self.hits = 0
+        self.misses = 0
+        if seed_dir and os.path.isdir(seed_dir):
+            self.seed(load_province_seeds(seed_dir))
+
+    def seed(self, coords):
+        """Nạp sẵn tọa độ cố định, không ghi đè giá trị đã có."""
+        self.store.set_many(coords.items(), ttl=None, overwrite=False)
+
+    def get(self, location):
+        key = normalize_city_name(location)
+        coord = self.memory.get(key)
+        if coord is None:
+            coord = self.store.get(key)
+            if coord is not None:
+                self.memory.set(key, coord)
+        if coord is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(coord)
+
+    def set(self, location, coord):
+        key = normalize_city_name(location)
+        value = {"lat": float(coord["lat"]), "lon": float(coord["lon"])}
+        self.memory.set(key, value)
+        self.store.set(key, value, ttl=self.ttl)
+
+
+geocode_cache = GeocodeCache()
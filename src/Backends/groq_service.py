@@ -1,35 +1,142 @@
-from groq import Groq
+from groq import AsyncGroq, APIConnectionError, APIStatusError, APITimeoutError
+from contextlib import asynccontextmanager, AsyncExitStack
+import asyncio
 import os
 import json
+import random
+import time
+import httpx
 from dotenv import load_dotenv
 
+from metrics import (
+    upstream_call, observe_llm_stream, observe_prompt_tokens, observe_groq_request, observe_groq_in_flight
+)
+from prompt_context import format_chat_context
+from schedule_cache import schedule_cache, schedule_key, schedule_ttl
+from timing import timed
+
 load_dotenv()
 
+# Groq API endpoint (None = SDK default https://api.groq.com); point at a local fake server for tests/benchmarks
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+CHAT_MODEL = "llama-3.3-70b-versatile"
+CHAT_MAX_TOKENS = 500
+SCHEDULE_MODEL = "llama-3.3-70b-versatile"
+SCHEDULE_PROMPT_VERSION = 1  # tăng khi sửa prompt lịch nông vụ để bỏ qua các lịch đã cache
+
+# Giới hạn, timeout và retry cho các lần gọi Groq
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", 30))                    # giây, cho mỗi lần gọi
+GROQ_CONNECT_TIMEOUT = float(os.getenv("GROQ_CONNECT_TIMEOUT", 5))
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", 8))        # số request Groq đồng thời tối đa
+GROQ_QUEUE_TIMEOUT = float(os.getenv("GROQ_QUEUE_TIMEOUT", 10))         # chờ slot tối đa, quá thì từ chối (503)
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", 2))                # retry khi 429 / 5xx / lỗi mạng
+GROQ_RETRY_BASE_DELAY = float(os.getenv("GROQ_RETRY_BASE_DELAY", 0.5))  # giây, nhân đôi sau mỗi lần
+GROQ_RETRY_MAX_DELAY = float(os.getenv("GROQ_RETRY_MAX_DELAY", 8))
+
+_client = None
+_semaphore = None
+_loop = None
+
+# Bộ đếm từ lúc khởi động: request đang chạy, bị từ chối vì quá tải, số lần retry
+groq_stats = {"in_flight": 0, "rejected": 0, "retries": 0}
+
+
+class GroqBusyError(Exception):
+    """Quá GROQ_MAX_CONCURRENCY request Groq đang chạy và không có slot trống trong GROQ_QUEUE_TIMEOUT giây."""
+
 
-# Initialize Groq client lazily to avoid crash on import
-def get_groq_client():
-    """Get or create Groq client"""
+def _groq_api_key():
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         raise ValueError("GROQ_API_KEY environment variable is not set. Please set it to use AI features.")
-    return Groq(api_key=api_key)
+    return api_key
 
-def generate_farming_schedule(crop_name: str, location: str, season: str, weather_forecast: dict, notes: str = ""):
+
+def get_async_groq_client():
     """
-    Generate a 7-day farming schedule using Groq AI with llama-3.3-70b-versatile
-    
-    Args:
-        crop_name: Name of the crop to plan for
-        location: Farm location/field name
-        season: Season or goal for farming
-        weather_forecast: 7-day weather forecast data
-        notes: Additional notes from user
-    
-    Returns:
-        Dict containing tasks list for 7 days
+    Trả về AsyncGroq dùng chung (một connection pool cho mọi request, timeout theo GROQ_TIMEOUT).
+
+    Retry của SDK bị tắt, việc retry do _with_retries đảm nhận (backoff có jitter). Client gắn với
+    event loop hiện tại; nếu loop đổi (VD: script gọi asyncio.run nhiều lần) thì tạo client mới.
     """
-    
-    # Format weather data for the prompt
+    global _client, _semaphore, _loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _loop is not loop:
+        _client = AsyncGroq(
+            api_key=_groq_api_key(),
+            base_url=GROQ_BASE_URL,
+            timeout=httpx.Timeout(GROQ_TIMEOUT, connect=GROQ_CONNECT_TIMEOUT),
+            max_retries=0,
+        )
+        _semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+        _loop = loop
+    return _client
+
+
+async def close_groq_client():
+    """Đóng connection pool của Groq (gọi khi server shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+    _client = None
+
+
+@asynccontextmanager
+async def _groq_slot():
+    """Giữ một slot trong GROQ_MAX_CONCURRENCY; hết GROQ_QUEUE_TIMEOUT mà chưa có slot thì GroqBusyError."""
+    client = get_async_groq_client()
+    try:
+        await asyncio.wait_for(_semaphore.acquire(), GROQ_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        groq_stats["rejected"] += 1
+        observe_groq_request("rejected")
+        raise GroqBusyError(f"Too many concurrent AI requests ({GROQ_MAX_CONCURRENCY}), please retry shortly")
+    groq_stats["in_flight"] += 1
+    observe_groq_in_flight(1)
+    try:
+        yield client
+    finally:
+        groq_stats["in_flight"] -= 1
+        observe_groq_in_flight(-1)
+        _semaphore.release()
+
+
+def _retry_delay(error, attempt):
+    """Retry-After của upstream nếu có, ngược lại exponential backoff với full jitter."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(float(retry_after), GROQ_RETRY_MAX_DELAY)
+    except (TypeError, ValueError):
+        return random.uniform(0, min(GROQ_RETRY_MAX_DELAY, GROQ_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _is_retryable(error):
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+async def _with_retries(client, call):
+    """await call() (một lần gọi Groq), retry tối đa GROQ_MAX_RETRIES lần khi 429 / 5xx / lỗi mạng."""
+    for attempt in range(GROQ_MAX_RETRIES + 1):
+        try:
+            with upstream_call(client.base_url.host):
+                result = await call()
+            observe_groq_request("ok")
+            return result
+        except Exception as e:
+            if attempt == GROQ_MAX_RETRIES or not _is_retryable(e):
+                observe_groq_request("error")
+                raise
+            delay = _retry_delay(e, attempt)
+            groq_stats["retries"] += 1
+            observe_groq_request("retry")
+            print(f"⚠️ Groq call failed ({type(e).__name__}), retry {attempt + 1}/{GROQ_MAX_RETRIES} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+def summarize_weather(weather_forecast: dict):
+    """Per-day weather summary used in the schedule prompt (and, quantized, in the cache key)"""
     weather_summary = []
     for day in weather_forecast.get('seven_day_forecast', []):
         weather_summary.append({
@@ -41,7 +148,44 @@ def generate_farming_schedule(crop_name: str, location: str, season: str, weathe
             "humidity": day.get('relative_humidity_2m_mean', 0),
             "wind_speed": day.get('wind_speed_10m_mean', 0)
         })
+    return weather_summary
+
+
+async def generate_farming_schedule(crop_name: str, location: str, season: str, weather_forecast: dict, notes: str = ""):
+    """
+    Generate a 7-day farming schedule using Groq AI with llama-3.3-70b-versatile
+    
+    Identical requests (same crop/location/season/notes and a forecast that only differs by small
+    jitter) are served from schedule_cache until the forecast window moves to the next day.
+    
+    Args:
+        crop_name: Name of the crop to plan for
+        location: Farm location/field name
+        season: Season or goal for farming
+        weather_forecast: 7-day weather forecast data
+        notes: Additional notes from user
     
+    Returns:
+        Dict containing tasks list for 7 days
+    """
+    weather_summary = summarize_weather(weather_forecast)
+    if schedule_cache is None:
+        return await _generate_farming_schedule(crop_name, location, season, weather_summary, notes)
+
+    key = schedule_key(SCHEDULE_MODEL, SCHEDULE_PROMPT_VERSION, crop_name, location, season, notes, weather_summary)
+    cached = schedule_cache.get(key)
+    if cached is not None:
+        print(f"♻️ Schedule cache hit for {crop_name} @ {location}")
+        return cached
+
+    result = await _generate_farming_schedule(crop_name, location, season, weather_summary, notes)
+    schedule_cache.set(key, result, ttl=schedule_ttl(weather_summary))
+    return result
+
+
+@timed("upstream.groq")
+async def _generate_farming_schedule(crop_name: str, location: str, season: str, weather_summary: list, notes: str = ""):
+    """Call Groq for a new 7-day schedule (no cache)"""
     prompt = f"""You are an expert agricultural advisor. Generate a detailed 7-day farming schedule based on the following information:
 
 **FARM INFORMATION:**
@@ -82,23 +226,23 @@ def generate_farming_schedule(crop_name: str, location: str, season: str, weathe
 Generate ONLY the JSON response, no additional text."""
 
     try:
-        client = get_groq_client()
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert agricultural advisor. Always respond with valid JSON only."
-                },
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.7,
-            max_tokens=2000,
-            response_format={"type": "json_object"}
-        )
+        async with _groq_slot() as client:
+            chat_completion = await _with_retries(client, lambda: client.chat.completions.create(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are an expert agricultural advisor. Always respond with valid JSON only."
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ],
+                model=SCHEDULE_MODEL,
+                temperature=0.7,
+                max_tokens=2000,
+                response_format={"type": "json_object"}
+            ))
         
         response_text = chat_completion.choices[0].message.content
         
@@ -129,42 +273,39 @@ Generate ONLY the JSON response, no additional text."""
             print(f"Response was: {response_text}")
             raise ValueError(f"Failed to parse AI response as JSON: {e}")
         
+    except GroqBusyError:
+        raise
     except Exception as e:
         print(f"Groq API Error: {e}")
         raise Exception(f"Failed to generate schedule: {str(e)}")
 
 
-def test_groq_connection():
-    """Test if Groq API key is configured correctly"""
+async def test_groq_connection():
+    """Test if Groq API key is configured correctly (lists models, no completion tokens spent)"""
     try:
         api_key = os.environ.get("GROQ_API_KEY")
         if not api_key:
             return {"status": "error", "message": "GROQ_API_KEY not set in environment"}
         
-        # Simple test request
-        client = get_groq_client()
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": "Hello"}],
-            model="llama-3.3-70b-versatile",
-            max_tokens=10
-        )
+        async with _groq_slot() as client:
+            models = await _with_retries(client, lambda: client.models.list())
         
-        return {"status": "success", "message": "Groq API connected successfully"}
+        available = {model.id for model in models.data}
+        missing = sorted({CHAT_MODEL, SCHEDULE_MODEL} - available)
+        if missing:
+            return {"status": "error", "message": f"Groq API connected but model not available: {', '.join(missing)}",
+                    **groq_stats}
+        return {"status": "success", "message": "Groq API connected successfully", **groq_stats}
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return {"status": "error", "message": str(e), **groq_stats}
 
 
-def chat_with_groq(user_message: str, weather_context: dict, agriculture_context: dict):
+def build_chat_messages(user_message: str, weather_context: dict, agriculture_context: dict):
     """
-    Context-aware chatbot using Groq AI
-    
-    Args:
-        user_message: User's question
-        weather_context: Current weather data from predict/all
-        agriculture_context: Current agriculture plans
-    
+    Build the chat messages: system prompt (current date, weather and agriculture context) + user question
+
     Returns:
-        Dict containing AI reply
+        List of messages for chat.completions.create
     """
     from datetime import datetime
     
@@ -172,14 +313,15 @@ def chat_with_groq(user_message: str, weather_context: dict, agriculture_context
     current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     current_date = datetime.now().strftime("%Y-%m-%d")
     
-    # Convert contexts to formatted strings
-    weather_str = json.dumps(weather_context, ensure_ascii=False, indent=2)
-    agri_str = json.dumps(agriculture_context, ensure_ascii=False, indent=2)
+    # Convert contexts to compact tables within the token budget (CHAT_CONTEXT_MODE=full keeps raw JSON)
+    weather_str, agri_str, context_info = format_chat_context(weather_context, agriculture_context, user_message)
+    observe_prompt_tokens(context_info["mode"], context_info["tokens"])
     
     # Log contexts for debugging
     print(f"\n📅 Current Date/Time: {current_datetime}")
     print(f"🌤️ Weather Context Keys: {list(weather_context.keys()) if weather_context else 'Empty'}")
     print(f"🌾 Agriculture Context Keys: {list(agriculture_context.keys()) if agriculture_context else 'Empty'}")
+    print(f"🧾 Context: ~{context_info['tokens']} tokens ({context_info['mode']}, level {context_info['level']}, budget {context_info['budget']})")
     
     system_prompt = f"""Bạn là Trợ lý Ảo Nông Nghiệp Thông Minh (Smart Agri-Assistant).
 
@@ -191,10 +333,10 @@ Nhiệm vụ của bạn là hỗ trợ người nông dân bằng cách trả l
 
 DƯỚI ĐÂY LÀ DỮ LIỆU HIỆN TẠI (Context Data):
 ---
-[THÔNG TIN THỜI TIẾT - WEATHER JSON]:
+[THÔNG TIN THỜI TIẾT - WEATHER DATA]:
 {weather_str}
 
-[KẾ HOẠCH NÔNG NGHIỆP - AGRICULTURE PLAN JSON]:
+[KẾ HOẠCH NÔNG NGHIỆP - AGRICULTURE PLAN DATA]:
 {agri_str}
 ---
 
@@ -209,7 +351,7 @@ CHỈ DẪN TRẢ LỜI THEO 3 LUỒNG (Flow Guidelines):
    - Phân tích xu hướng nhiệt độ, lượng mưa, độ ẩm.
 
 2. LUỒNG NÔNG NGHIỆP (Khi người dùng hỏi nên làm gì, kế hoạch...):
-   - Nhìn vào JSON Kế hoạch (agriculture_context): Tìm daily_tasks để biết công việc cần làm.
+   - Nhìn vào Kế hoạch (agriculture_context): Tìm daily_tasks để biết công việc cần làm.
    - Kết hợp thời tiết: Nếu JSON bảo "Tưới cây" nhưng Thời tiết báo "Mưa to", hãy khuyên người dùng HOÃN tưới.
    - Đưa ra lời khuyên về thời điểm thích hợp cho từng công việc (bón phân, phun thuốc, thu hoạch...).
    - Nhắc nhở ghi chép nhật ký nông vụ.
@@ -223,37 +365,135 @@ CHỈ DẪN TRẢ LỜI THEO 3 LUỒNG (Flow Guidelines):
    - Luôn giữ thái độ thân thiện, chuyên gia, ngắn gọn và dễ hiểu với bà con nông dân.
 
 LƯU Ý QUAN TRỌNG:
-- Tuyệt đối chỉ trả lời dựa trên thông tin có trong JSON ở trên.
+- Tuyệt đối chỉ trả lời dựa trên thông tin có trong dữ liệu ở trên.
 - Khi nói "hôm nay", phải dùng đúng ngày {current_date}, KHÔNG được tự bịa ngày khác.
 - Nếu không có thông tin, hãy nói "Dữ liệu hiện tại không hiển thị thông tin này. Bạn có thể kiểm tra lại ở tab tương ứng."
 - Trả lời bằng tiếng Việt, ngắn gọn (2-4 câu), thân thiện.
 - Ưu tiên phân tích số liệu cụ thể thay vì lý thuyết chung chung.
 - Đưa ra lời khuyên hành động cụ thể, không chỉ mô tả."""
 
+    return [
+        {
+            "role": "system",
+            "content": system_prompt
+        },
+        {
+            "role": "user",
+            "content": user_message
+        }
+    ]
+
+
+@timed("upstream.groq")
+async def chat_with_groq(user_message: str, weather_context: dict, agriculture_context: dict):
+    """
+    Context-aware chatbot using Groq AI
+    
+    Args:
+        user_message: User's question
+        weather_context: Current weather data from predict/all
+        agriculture_context: Current agriculture plans
+    
+    Returns:
+        Dict containing AI reply
+    """
+    messages = build_chat_messages(user_message, weather_context, agriculture_context)
+
     try:
-        client = get_groq_client()
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": user_message
-                }
-            ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.7,
-            max_tokens=500,
-        )
+        async with _groq_slot() as client:
+            chat_completion = await _with_retries(client, lambda: client.chat.completions.create(
+                messages=messages,
+                model=CHAT_MODEL,
+                temperature=0.7,
+                max_tokens=CHAT_MAX_TOKENS,
+            ))
         
         bot_reply = chat_completion.choices[0].message.content
         return {"reply": bot_reply}
         
+    except GroqBusyError:
+        raise
     except Exception as e:
         print(f"Groq Chat Error: {e}")
         raise Exception(f"Failed to chat with AI: {str(e)}")
 
 
+class ChatStream:
+    """
+    Stream trả lời của Groq đã mở (đang giữ một slot GROQ_MAX_CONCURRENCY), xem open_chat_stream.
+
+    `async for` trả về từng đoạn text khi Groq sinh ra. `aclose()` (gọi nhiều lần được) đóng stream
+    upstream - dừng generation phía Groq nếu client ngắt kết nối - và trả slot. Time to first token và
+    tokens/sec được ghi vào metrics và `stats` (ttft_ms, tokens, tokens_per_second) khi stream kết thúc.
+    """
 
+    def __init__(self, stream, slot, started, stats):
+        self._stream = stream
+        self._slot = slot
+        self._started = started
+        self._first_token_at = None
+        self._tokens = 0
+        self._closed = False
+        self.stats = stats
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+            if usage is not None:
+                # Chunk cuối của Groq có số token chính xác
+                self._tokens = usage.completion_tokens
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                if self._first_token_at is None:
+                    self._first_token_at = time.perf_counter()
+                if usage is None:
+                    self._tokens += 1
+                yield content
+        # Hết stream: trả slot ngay và điền `stats` cho event 'done'
+        await self.aclose()
+
+    async def aclose(self):
+        if self._closed:
+            return
+        try:
+            await self._stream.close()
+        finally:
+            await self._slot.aclose()
+        # Chỉ đánh dấu khi đã đóng xong: lần gọi bị hủy giữa chừng (client ngắt kết nối) được gọi lại sau
+        self._closed = True
+
+        if self._first_token_at is not None:
+            ttft = self._first_token_at - self._started
+            generation = time.perf_counter() - self._first_token_at
+            self.stats.update(ttft_ms=round(ttft * 1000, 1), tokens=self._tokens,
+                              tokens_per_second=round(self._tokens / generation, 1) if generation > 0 else None)
+            observe_llm_stream(CHAT_MODEL, ttft, self._tokens, generation)
+
+
+async def open_chat_stream(user_message: str, weather_context: dict, agriculture_context: dict, stats: dict):
+    """
+    Streaming version of chat_with_groq: takes a Groq slot and opens the completion stream
+    (with retries) before returning, so overload (GroqBusyError) and upstream failures surface
+    before any response bytes are sent.
+
+    Returns:
+        ChatStream: iterate it for the reply text; the caller must aclose() it.
+    """
+    messages = build_chat_messages(user_message, weather_context, agriculture_context)
+    started = time.perf_counter()
+    slot = AsyncExitStack()
+    client = await slot.enter_async_context(_groq_slot())
+    try:
+        stream = await _with_retries(client, lambda: client.chat.completions.create(
+            messages=messages,
+            model=CHAT_MODEL,
+            temperature=0.7,
+            max_tokens=CHAT_MAX_TOKENS,
+            stream=True,
+        ))
+    except BaseException:
+        await slot.aclose()
+        raise
+    return ChatStream(stream, slot, started, stats)
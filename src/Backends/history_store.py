@@ -0,0 +1,258 @@
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cấu hình qua biến môi trường
+HISTORY_DATA_DIR = os.getenv("HISTORY_DATA_DIR", os.path.normpath(os.path.join(BASE_DIR, "..", "data")))
+HISTORY_STORE_DIR = os.getenv("HISTORY_STORE_DIR", os.path.join(HISTORY_DATA_DIR, "store"))
+
+INDEX_FILE = "index.json"
+FREQUENCIES = ("hourly", "daily")
+
+# Kiểu thời gian lưu trong time.npy của từng tần suất
+TIME_UNITS = {"hourly": "datetime64[m]", "daily": "datetime64[D]"}
+
+# "temperature_2m (°C)" -> "temperature_2m"
+_UNIT_SUFFIX = re.compile(r"\s*\(.*\)\s*$")
+
+
+def _column_name(header):
+    return _UNIT_SUFFIX.sub("", header.strip())
+
+
+def _scan_csv(path):
+    """
+    Đọc phần đầu file CSV Open-Meteo: bỏ qua phần metadata (latitude,longitude,...) nếu có.
+
+    Returns:
+        tuple: (skiprows, header hoặc None nếu file không có header, metadata dict, số dòng dữ liệu)
+    """
+    meta, header, skiprows, rows = {}, None, 0, 0
+    meta_keys = None
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if i == 0 and line.startswith("latitude,"):
+                meta_keys = line.strip().split(",")
+                continue
+            if i == 1 and meta_keys:
+                meta = dict(zip(meta_keys, line.strip().split(",")))
+                continue
+            if header is None and rows == 0:
+                if not line.strip():
+                    continue
+                if line.startswith("time,"):
+                    header = [_column_name(h) for h in line.strip().split(",")]
+                    skiprows = i
+                    continue
+            if line.strip():
+                rows += 1
+    return skiprows, header, meta, rows
+
+
+def _province_files(data_dir, freq):
+    files = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, freq, f"*_{freq}.csv"))):
+        files[os.path.basename(path)[:-len(f"_{freq}.csv")]] = path
+    return files
+
+
+def ingest(data_dir=HISTORY_DATA_DIR, store_dir=HISTORY_STORE_DIR):
+    """
+    Chuyển src/data/{hourly,daily}/*.csv sang store dạng cột: mỗi biến một file .npy (float32),
+    các tỉnh nối tiếp nhau theo thứ tự tên, cùng `index.json`:
+    {tỉnh: {"lat", "lon", "hourly": [start, stop], "daily": [start, stop]}}.
+
+    Mỗi lần chỉ parse một tỉnh và ghi thẳng vào file .npy đã cấp phát sẵn (memmap),
+    nên RAM không tăng theo kích thước toàn bộ dữ liệu.
+    """
+    started = time.perf_counter()
+    index = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "provinces": {}}
+
+    for freq in FREQUENCIES:
+        files = _province_files(data_dir, freq)
+        scans = {province: _scan_csv(path) for province, path in files.items()}
+
+        # Một số file daily không có header -> dùng header của file khác (cùng thứ tự cột)
+        header = next((scan[1] for scan in scans.values() if scan[1]), None)
+        if header is None:
+            continue
+        columns = [c for c in header if c not in ("time", "latitude", "longitude")]
+        total = sum(scan[3] for scan in scans.values())
+
+        out_dir = os.path.join(store_dir, freq)
+        os.makedirs(out_dir, exist_ok=True)
+        times = np.lib.format.open_memmap(os.path.join(out_dir, "time.npy"), mode="w+",
+                                          dtype=TIME_UNITS[freq], shape=(total,))
+        arrays = {
+            col: np.lib.format.open_memmap(os.path.join(out_dir, f"{col}.npy"), mode="w+",
+                                           dtype=np.float32, shape=(total,))
+            for col in columns
+        }
+
+        offset = 0
+        for province, path in files.items():
+            skiprows, file_header, meta, rows = scans[province]
+            entry = index["provinces"].setdefault(province, {})
+            if rows == 0:
+                entry[freq] = [offset, offset]
+                continue
+
+            df = pd.read_csv(path, skiprows=skiprows, header=0 if file_header else None)
+            df.columns = file_header or header
+            df.columns = [_column_name(c) for c in df.columns]
+            df = df.sort_values("time")
+            n = len(df)
+
+            times[offset:offset + n] = pd.to_datetime(df["time"]).to_numpy().astype(TIME_UNITS[freq])
+            for col in columns:
+                if col in df.columns:
+                    arrays[col][offset:offset + n] = pd.to_numeric(df[col], errors="coerce").to_numpy(np.float32)
+                else:
+                    arrays[col][offset:offset + n] = np.nan
+
+            # Tọa độ: metadata đầu file hourly, hoặc 2 cột cuối của file daily
+            if "lat" not in entry:
+                if meta.get("latitude"):
+                    entry["lat"], entry["lon"] = float(meta["latitude"]), float(meta["longitude"])
+                elif "latitude" in df.columns:
+                    entry["lat"], entry["lon"] = float(df["latitude"].iloc[0]), float(df["longitude"].iloc[0])
+
+            entry[freq] = [offset, offset + n]
+            offset += n
+
+        for array in (times, *arrays.values()):
+            array.flush()
+        index[freq] = {"columns": columns, "rows": offset}
+        print(f"✅ {freq}: {len(files)} provinces, {offset} rows, {len(columns)} variables")
+
+    with open(os.path.join(store_dir, INDEX_FILE), "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ Store written to {store_dir} in {time.perf_counter() - started:.1f}s")
+    return index
+
+
+class HistoryStore:
+    """
+    Đọc store dạng cột do `ingest` tạo ra. Các file .npy được mở bằng mmap (chỉ đọc) một lần
+    và dùng chung, nên lấy dữ liệu một tỉnh chỉ là cắt lát mảng, không parse CSV.
+    """
+
+    def __init__(self, store_dir=HISTORY_STORE_DIR):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, INDEX_FILE), encoding="utf-8") as f:
+            self.index = json.load(f)
+        self.provinces = self.index["provinces"]
+        self._arrays = {}
+
+        # Tọa độ các tỉnh (để tìm tỉnh gần nhất)
+        located = [(name, p["lat"], p["lon"]) for name, p in self.provinces.items() if "lat" in p]
+        self._names = [name for name, _, _ in located]
+        self._coords = np.array([(lat, lon) for _, lat, lon in located], dtype=np.float64).reshape(-1, 2)
+
+    def columns(self, freq):
+        return list(self.index[freq]["columns"])
+
+    def _array(self, freq, name):
+        key = (freq, name)
+        array = self._arrays.get(key)
+        if array is None:
+            array = np.load(os.path.join(self.store_dir, freq, f"{name}.npy"), mmap_mode="r")
+            self._arrays[key] = array
+        return array
+
+    def coordinates(self, province):
+        entry = self.provinces[province]
+        return {"lat": entry["lat"], "lon": entry["lon"]}
+
+    def nearest_province(self, lat, lon, freq=None):
+        """
+        Tỉnh có tọa độ gần (lat, lon) nhất (khoảng cách xấp xỉ trên mặt phẳng, đủ cho phạm vi VN).
+        Nếu có `freq`, bỏ qua các tỉnh không có dữ liệu ở tần suất đó (VD: binhthuan daily rỗng).
+        """
+        d_lat = self._coords[:, 0] - lat
+        d_lon = (self._coords[:, 1] - lon) * np.cos(np.radians(lat))
+        distance = d_lat ** 2 + d_lon ** 2
+        if freq is not None:
+            empty = [self.provinces[name][freq][0] == self.provinces[name][freq][1] for name in self._names]
+            distance = np.where(empty, np.inf, distance)
+        return self._names[int(np.argmin(distance))]
+
+    def time_range(self, province, freq):
+        """(mốc đầu, mốc cuối) dạng np.datetime64 của một tỉnh, None nếu không có dữ liệu."""
+        lo, hi = self.provinces[province][freq]
+        if lo == hi:
+            return None
+        times = self._array(freq, "time")
+        return times[lo], times[hi - 1]
+
+    def arrays(self, province, freq="hourly", start=None, end=None, columns=None):
+        """
+        Các cột của một tỉnh dưới dạng view memmap (không copy).
+
+        Args:
+            province (str): Tên tỉnh như trong tên file (VD: 'hanoi').
+            freq (str): 'hourly' hoặc 'daily'.
+            start, end: Mốc thời gian (chuỗi/datetime), lấy [start, end] nếu có.
+            columns (list | None): Các biến cần lấy (mặc định: tất cả).
+
+        Returns:
+            dict: {"time": np.ndarray datetime64, <biến>: np.ndarray float32, ...}
+        """
+        lo, hi = self.provinces[province][freq]
+        times = self._array(freq, "time")[lo:hi]
+        if start is not None:
+            lo += int(np.searchsorted(times, np.datetime64(pd.Timestamp(start)), side="left"))
+        if end is not None:
+            hi = lo + int(np.searchsorted(self._array(freq, "time")[lo:hi],
+                                          np.datetime64(pd.Timestamp(end)), side="right"))
+
+        result = {"time": self._array(freq, "time")[lo:hi]}
+        for col in columns or self.columns(freq):
+            result[col] = self._array(freq, col)[lo:hi]
+        return result
+
+    def load(self, province, freq="hourly", start=None, end=None, columns=None):
+        """Như `arrays` nhưng trả về pd.DataFrame (cột 'time' + các biến)."""
+        return pd.DataFrame(self.arrays(province, freq, start, end, columns))
+
+
+_default_store = None
+
+
+def get_store(store_dir=HISTORY_STORE_DIR):
+    """HistoryStore dùng chung của tiến trình (mở index/memmap một lần)."""
+    global _default_store
+    if _default_store is None or _default_store.store_dir != store_dir:
+        _default_store = HistoryStore(store_dir)
+    return _default_store
+
+
+if __name__ == "__main__":
+    # python history_store.py ingest [data_dir] [store_dir]
+    # python history_store.py info [store_dir]
+    if len(sys.argv) < 2 or sys.argv[1] not in ("ingest", "info"):
+        print("Usage: python history_store.py ingest [data_dir] [store_dir] | info [store_dir]")
+        sys.exit(2)
+
+    if sys.argv[1] == "ingest":
+        data_dir = sys.argv[2] if len(sys.argv) > 2 else HISTORY_DATA_DIR
+        store_dir = sys.argv[3] if len(sys.argv) > 3 else os.path.join(data_dir, "store")
+        ingest(data_dir, store_dir)
+    else:
+        store = HistoryStore(sys.argv[2] if len(sys.argv) > 2 else HISTORY_STORE_DIR)
+        for freq in FREQUENCIES:
+            if freq in store.index:
+                print(f"{freq}: {store.index[freq]['rows']} rows, columns={store.columns(freq)}")
+        print(f"provinces: {len(store.provinces)}")
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+from metrics import observe_upstream
+
+load_dotenv()
+
+# Cấu hình qua biến môi trường
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))              # giây, cho mỗi request
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 50))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+HTTP_MAX_CONCURRENCY = int(os.getenv("HTTP_MAX_CONCURRENCY", 20))  # số request upstream đồng thời tối đa
+
+_client = None
+_semaphore = None
+_loop = None
+
+
+def get_client():
+    """
+    Trả về httpx.AsyncClient dùng chung (keep-alive, connection pool, timeout).
+
+    Client gắn với event loop hiện tại; nếu loop đổi (VD: script gọi asyncio.run nhiều lần)
+    thì tạo client mới.
+    """
+    global _client, _semaphore, _loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            ),
+        )
+        _semaphore = asyncio.Semaphore(HTTP_MAX_CONCURRENCY)
+        _loop = loop
+    return _client
+
+
+async def get(url, params=None, headers=None):
+    """
+    GET `url` qua client dùng chung và trả về httpx.Response (không kiểm tra status).
+
+    Số request đồng thời bị giới hạn bởi HTTP_MAX_CONCURRENCY. Mỗi lần gọi được đếm theo host và
+    status trong metrics (agriweather_upstream_requests_total).
+
+    Raises:
+        httpx.RequestError: Nếu lỗi mạng/timeout.
+    """
+    client = get_client()
+    host = httpx.URL(url).host
+    async with _semaphore:
+        started = time.perf_counter()
+        try:
+            response = await client.get(url, params=params, headers=headers)
+        except httpx.RequestError as e:
+            observe_upstream(host, type(e).__name__, time.perf_counter() - started)
+            raise
+    observe_upstream(host, response.status_code, time.perf_counter() - started)
+    return response
+
+
+async def fetch_json(url, params=None, headers=None):
+    """
+    GET `url` và trả về JSON đã parse.
+
+    Raises:
+        httpx.HTTPStatusError: Nếu upstream trả về mã lỗi (>= 400).
+        httpx.RequestError: Nếu lỗi mạng/timeout.
+    """
+    response = await get(url, params=params, headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+
+async def close_client():
+    """Đóng connection pool (gọi khi server shutdown)."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
@@ -0,0 +1,153 @@
+import asyncio
+import contextvars
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+
+from model_registry import BUNDLE_LOADERS, compute_model_fingerprint
+from timing import stage
+
+load_dotenv()
+
+# Cấu hình qua biến môi trường
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", 4))   # pandas/scaler và model sklearn khi không dùng process
+LSTM_THREADS = int(os.getenv("LSTM_THREADS", 1))             # forward pass LSTM (NumPy/TF nhả GIL)
+# Số process cho từng model sklearn (mỗi process giữ một bản model đã load); 0 = chạy trong thread pool
+INFERENCE_PROCESSES = {
+    "daily": int(os.getenv("INFERENCE_PROCESSES_DAILY", 1)),
+    "hourly": int(os.getenv("INFERENCE_PROCESSES_HOURLY", 1)),
+}
+
+# ===== Phía process con =====
+# {tên bundle: OrderedDict(phiên bản -> bundle)} - model được load sẵn khi process khởi động.
+# Trong lúc hot-reload, request của phiên bản cũ và mới xen kẽ nhau nên giữ vài phiên bản gần nhất
+WORKER_CACHED_VERSIONS = 2
+_worker_bundles = {}
+
+
+class ModelVersionUnavailable(LookupError):
+    """Process con không có phiên bản model của request, và file trên đĩa đã là phiên bản khác."""
+
+
+def _worker_load(model_dir, version, name):
+    """
+    Bundle `name` của phiên bản `version`. Phiên bản chưa có trong process thì load từ đĩa, với điều
+    kiện file trên đĩa đúng là phiên bản đó (dấu vân tay thư mục model).
+
+    Raises:
+        ModelVersionUnavailable: Nếu `version` đã bị thay trên đĩa - load file hiện tại sẽ trả kết quả
+                                 của phiên bản khác dưới `model_version` của request.
+    """
+    versions = _worker_bundles.setdefault(name, OrderedDict())
+    if version not in versions:
+        on_disk = compute_model_fingerprint(model_dir)
+        if on_disk != version:
+            raise ModelVersionUnavailable(f"{name} models {version} replaced on disk by {on_disk}")
+        versions[version] = BUNDLE_LOADERS[name](os.path.join(model_dir, name))
+        while len(versions) > WORKER_CACHED_VERSIONS:
+            versions.popitem(last=False)
+    versions.move_to_end(version)
+    return versions[version]
+
+
+def _worker_init(model_dir, name):
+    """Initializer của process con: load sẵn bundle `name` (file hiện có trên đĩa) để request đầu tiên không phải chờ."""
+    try:
+        _worker_load(model_dir, compute_model_fingerprint(model_dir), name)
+    except Exception as e:
+        # Lỗi sẽ được ném lại ở lần gọi đầu tiên
+        print(f"❌ Worker failed to preload {name} models: {e}")
+
+
+def _worker_classify(model_dir, version, name, features):
+    from predict import classify_features
+
+    # Registry đã hot-reload sang phiên bản khác -> process con load lại đúng phiên bản của request
+    return classify_features(_worker_load(model_dir, version, name), features)
+
+
+# ===== Phía tiến trình chính =====
+class InferenceExecutor:
+    """
+    Lớp thực thi suy luận để các handler `async def` không chạy việc nặng trên event loop.
+
+    - `threads`: thread pool cho công việc NumPy/pandas nhả GIL.
+    - `lstm_threads`: thread pool riêng cho forward pass LSTM (dùng bởi MicroBatcher).
+    - Mỗi model sklearn (daily, hourly) có process pool riêng, kích thước INFERENCE_PROCESSES_<MODEL>,
+      mỗi process load sẵn model; nếu kích thước là 0 thì chạy trong thread pool.
+    """
+
+    def __init__(self, threads=INFERENCE_THREADS, lstm_threads=LSTM_THREADS, processes=None):
+        self.threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="inference")
+        self.lstm_threads = ThreadPoolExecutor(max_workers=lstm_threads, thread_name_prefix="lstm")
+        self.process_sizes = dict(INFERENCE_PROCESSES if processes is None else processes)
+        self._pools = {}
+
+    async def run(self, fn, *args):
+        """Chạy `fn(*args)` trong thread pool, giữ nguyên contextvars (VD: bộ model của request)."""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.threads, context.run, fn, *args)
+
+    def _process_pool(self, name, models):
+        size = self.process_sizes.get(name, 0)
+        if size <= 0:
+            return None
+        pool = self._pools.get(name)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=size,
+                initializer=_worker_init,
+                initargs=(models.model_dir, name),
+            )
+            self._pools[name] = pool
+        return pool
+
+    async def classify(self, name, models, features):
+        """
+        Scale + predict + giải mã nhãn bằng bundle `name` của `models` (ModelSet của request).
+
+        Returns:
+            np.ndarray: Mã WMO cho từng dòng của `features`.
+        """
+        from predict import classify_features
+
+        pool = self._process_pool(name, models)
+        with stage(f"model.{name}"):
+            if pool is None:
+                return await self.run(classify_features, models.get(name), features)
+
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(
+                    pool, _worker_classify, models.model_dir, models.version, name, features
+                )
+            except ModelVersionUnavailable:
+                # Hot-reload xong giữa chừng: process con chỉ còn phiên bản mới, request vẫn dùng
+                # bundle của phiên bản nó giữ (đã load trong tiến trình chính) để khớp model_version
+                return await self.run(classify_features, models.get(name), features)
+            except BrokenProcessPool:
+                # Process con chết (VD: hết RAM) -> tạo lại pool ở lần gọi sau
+                self._pools.pop(name, None)
+                raise
+
+    def stats(self):
+        return {
+            "threads": self.threads._max_workers,
+            "lstm_threads": self.lstm_threads._max_workers,
+            "processes": {name: size for name, size in self.process_sizes.items()},
+            "process_pools_started": sorted(self._pools),
+        }
+
+    def shutdown(self):
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pools.clear()
+        self.threads.shutdown(wait=False)
+        self.lstm_threads.shutdown(wait=False)
+
+
+inference = InferenceExecutor()
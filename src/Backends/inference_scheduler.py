@@ -0,0 +1,159 @@
+import asyncio
+import time
+from collections import Counter
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Gom các request suy luận đồng thời thành một lần forward pass (dynamic micro-batching).
+
+    Mỗi request gửi một mẫu (VD: cửa sổ (30, 19) cho LSTM 7 ngày) kèm model cần dùng qua `submit`.
+    Worker nền lấy mẫu đầu tiên trong hàng đợi, chờ thêm tối đa `max_wait_ms` (hoặc tới khi đủ
+    `max_batch_size`), rồi gọi `predict_fn` MỘT lần cho mỗi model trên batch đã xếp chồng (np.stack)
+    trong thread pool để không chặn event loop. Kết quả dòng thứ i được trả về cho request thứ i.
+
+    Các mẫu của những phiên bản model khác nhau (khi đang hot-reload) không bao giờ bị gộp chung.
+
+    Args:
+        predict_fn (callable): Hàm (model, np.ndarray (batch, ...)) -> mảng (batch, ...).
+        max_batch_size (int): Số mẫu tối đa trong một batch.
+        max_wait_ms (float): Thời gian chờ tối đa (ms) để gom thêm mẫu sau mẫu đầu tiên.
+        name (str): Tên hiển thị trong thống kê.
+        executor: Thread pool chạy `predict_fn` (None = executor mặc định của event loop).
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5.0, name="model", executor=None):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+
+        self._queue = None
+        self._loop = None
+        self._worker = None
+
+        # Thống kê
+        self.batches_total = 0
+        self.items_total = 0
+        self.last_batch_size = 0
+        self.batch_size_counts = Counter()
+        self.predict_seconds_total = 0.0
+
+    def _ensure_worker(self):
+        if self._worker is not None and not self._worker.done():
+            return
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Hàng đợi gắn với event loop: chỉ tạo mới khi loop đổi (VD: script gọi asyncio.run nhiều lần).
+            # Worker chết trên cùng loop thì giữ hàng đợi để các request đang chờ vẫn được xử lý.
+            self._queue = asyncio.Queue()
+            self._loop = loop
+        self._worker = loop.create_task(self._run())
+
+    async def submit(self, sample, model):
+        """
+        Gửi một mẫu vào hàng đợi và chờ kết quả tương ứng.
+
+        Args:
+            sample (np.ndarray): Một mẫu đầu vào (không có chiều batch).
+            model: Model dùng cho mẫu này (phiên bản mà request đang giữ).
+
+        Returns:
+            np.ndarray: Output của model cho mẫu này (không có chiều batch).
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((sample, model, future))
+        return await future
+
+    async def _collect_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Lấy ngay các mẫu đã có sẵn, chỉ chờ khi hàng đợi rỗng
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Bỏ các request đã bị hủy (client ngắt kết nối) trước khi chạy model
+        return [item for item in batch if not item[2].cancelled()]
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            try:
+                # Gom theo model (thường chỉ có một nhóm)
+                groups = {}
+                for sample, model, future in batch:
+                    groups.setdefault(id(model), (model, []))[1].append((sample, future))
+
+                for model, items in groups.values():
+                    await self._predict_group(model, items)
+            except BaseException as e:
+                # Worker dừng giữa batch (bị hủy / lỗi ngoài dự kiến): không để request của batch chờ mãi
+                for _, _, future in batch:
+                    if not future.done():
+                        if isinstance(e, asyncio.CancelledError):
+                            future.cancel()
+                        else:
+                            future.set_exception(e)
+                raise
+
+    async def _predict_group(self, model, items):
+        started = time.perf_counter()
+        try:
+            inputs = np.stack([sample for sample, _ in items])
+            loop = asyncio.get_running_loop()
+            outputs = await loop.run_in_executor(self.executor, self.predict_fn, model, inputs)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.predict_seconds_total += time.perf_counter() - started
+
+        for (_, future), output in zip(items, outputs):
+            if not future.done():
+                future.set_result(output)
+
+        self.batches_total += 1
+        self.items_total += len(items)
+        self.last_batch_size = len(items)
+        self.batch_size_counts[len(items)] += 1
+
+    def stats(self):
+        """Thống kê hàng đợi và kích thước batch (dùng cho endpoint metrics)."""
+        return {
+            "name": self.name,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches_total": self.batches_total,
+            "items_total": self.items_total,
+            "avg_batch_size": self.items_total / self.batches_total if self.batches_total else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+            "predict_seconds_total": self.predict_seconds_total,
+        }
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
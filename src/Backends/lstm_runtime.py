@@ -0,0 +1,210 @@
+import os
+import sys
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Backend suy luận cho LSTM 7 ngày: keras | numpy | onnx
+#   keras : load_model(7day_model.keras) như trước (cần TensorFlow)
+#   numpy : forward pass thuần NumPy từ trọng số đã export (7day_weights.npz), không import TensorFlow
+#   onnx  : onnxruntime với 7day_model.onnx (cần package onnxruntime)
+LSTM_BACKEND = os.getenv("LSTM_BACKEND", "keras").lower()
+
+KERAS_FILE = "7day_model.keras"
+NUMPY_WEIGHTS_FILE = "7day_weights.npz"
+ONNX_FILE = "7day_model.onnx"
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _lstm_layer(x, kernel, recurrent_kernel, bias, return_sequences):
+    """
+    Một lớp LSTM Keras (activation=tanh, recurrent_activation=sigmoid, thứ tự cổng i, f, c, o).
+
+    x: (batch, timesteps, features) -> (batch, timesteps, units) hoặc (batch, units).
+    """
+    batch, timesteps, _ = x.shape
+    units = recurrent_kernel.shape[0]
+
+    # Nhân kernel cho mọi bước thời gian trong một lần matmul, vòng lặp chỉ còn phần recurrent
+    x_proj = x @ kernel + bias
+    h = np.zeros((batch, units), dtype=x.dtype)
+    c = np.zeros((batch, units), dtype=x.dtype)
+    outputs = np.empty((batch, timesteps, units), dtype=x.dtype) if return_sequences else None
+
+    for t in range(timesteps):
+        z = x_proj[:, t, :] + h @ recurrent_kernel
+        i = _sigmoid(z[:, :units])
+        f = _sigmoid(z[:, units:2 * units])
+        g = np.tanh(z[:, 2 * units:3 * units])
+        o = _sigmoid(z[:, 3 * units:])
+        c = f * c + i * g
+        h = o * np.tanh(c)
+        if return_sequences:
+            outputs[:, t, :] = h
+
+    return outputs if return_sequences else h
+
+
+class NumpyLSTMModel:
+    """
+    Forward pass thuần NumPy của model 7 ngày:
+    Input(30, 19) -> LSTM(64, return_sequences) -> LSTM(32) -> Dense(7 * 17) -> Reshape(7, 17).
+    Dropout không có tác dụng khi suy luận nên được bỏ qua.
+
+    Có cùng hàm `predict(x, verbose=0)` như model Keras để dùng thay thế trực tiếp.
+    """
+
+    def __init__(self, weights, output_shape):
+        (self.k1, self.r1, self.b1,
+         self.k2, self.r2, self.b2,
+         self.dense_kernel, self.dense_bias) = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.output_shape = tuple(int(d) for d in output_shape)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            weights = [data[f"w{i}"] for i in range(8)]
+            return cls(weights, data["output_shape"])
+
+    def predict(self, x, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        h = _lstm_layer(x, self.k1, self.r1, self.b1, return_sequences=True)
+        h = _lstm_layer(h, self.k2, self.r2, self.b2, return_sequences=False)
+        out = h @ self.dense_kernel + self.dense_bias
+        return out.reshape((x.shape[0],) + self.output_shape)
+
+
+class OnnxLSTMModel:
+    """Model 7 ngày chạy qua onnxruntime (CPU), cùng hàm `predict(x, verbose=0)` như Keras."""
+
+    def __init__(self, path):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("LSTM_BACKEND=onnx requires the 'onnxruntime' package (pip install onnxruntime)") from e
+        self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, x, verbose=0):
+        return self.session.run(None, {self.input_name: np.asarray(x, dtype=np.float32)})[0]
+
+
+def load_keras_model(model_dir):
+    """Load 7day_model.keras (chỉ import Keras/TensorFlow khi thực sự cần)."""
+    from keras.models import load_model
+    return load_model(os.path.join(model_dir, KERAS_FILE))
+
+
+def export_numpy_weights(keras_model, path):
+    """
+    Lưu trọng số 2 lớp LSTM + lớp Dense của model Keras ra file .npz cho NumpyLSTMModel.
+
+    Thứ tự w0..w7: kernel, recurrent_kernel, bias của LSTM 1 và LSTM 2, rồi kernel, bias của Dense.
+    """
+    weights = []
+    for layer in keras_model.layers:
+        if type(layer).__name__ in ("LSTM", "Dense"):
+            weights.extend(layer.get_weights())
+    if len(weights) != 8:
+        raise ValueError(f"Unexpected 7-day model architecture ({len(weights)} weight arrays, expected 8)")
+
+    output_shape = keras_model.output_shape[1:]
+    np.savez(path, output_shape=np.asarray(output_shape), **{f"w{i}": w for i, w in enumerate(weights)})
+    return path
+
+
+def export_onnx(keras_model, path, input_window=30, num_features=19):
+    """Export model Keras sang ONNX (cần tensorflow + tf2onnx, chỉ chạy một lần)."""
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None, input_window, num_features), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(keras_model, input_signature=spec, output_path=path)
+    return path
+
+
+def load_lstm(model_dir, backend=LSTM_BACKEND):
+    """
+    Load model LSTM 7 ngày theo backend đã chọn.
+
+    Với numpy/onnx, nếu chưa có file export thì load model Keras một lần và export ra cạnh
+    7day_model.keras; các lần khởi động sau không cần import TensorFlow nữa.
+    """
+    if backend == "keras":
+        return load_keras_model(model_dir)
+
+    if backend == "numpy":
+        path = os.path.join(model_dir, NUMPY_WEIGHTS_FILE)
+        if not os.path.exists(path):
+            print(f"⚙️ Exporting LSTM weights to {path}")
+            export_numpy_weights(load_keras_model(model_dir), path)
+        return NumpyLSTMModel.load(path)
+
+    if backend == "onnx":
+        path = os.path.join(model_dir, ONNX_FILE)
+        if not os.path.exists(path):
+            print(f"⚙️ Exporting LSTM to {path}")
+            export_onnx(load_keras_model(model_dir), path)
+        return OnnxLSTMModel(path)
+
+    raise ValueError(f"Unknown LSTM_BACKEND: {backend}")
+
+
+def check_parity(model_dir, backend="numpy", samples=64, atol=1e-4, seed=0):
+    """
+    So sánh output của backend `backend` với Keras trên `samples` cửa sổ ngẫu nhiên (đã chuẩn hóa).
+
+    Returns:
+        dict: max_abs_diff, ok, và thời gian predict trung bình (ms) cho batch 1 của mỗi backend.
+    """
+    reference = load_keras_model(model_dir)
+    candidate = load_lstm(model_dir, backend)
+
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal((samples,) + tuple(reference.input_shape[1:])).astype(np.float32)
+
+    expected = np.asarray(reference.predict(x, verbose=0))
+    actual = np.asarray(candidate.predict(x, verbose=0))
+    max_abs_diff = float(np.max(np.abs(expected - actual)))
+
+    def latency_ms(model, runs=50):
+        started = time.perf_counter()
+        for _ in range(runs):
+            model.predict(x[:1], verbose=0)
+        return (time.perf_counter() - started) / runs * 1000
+
+    return {
+        "backend": backend,
+        "max_abs_diff": max_abs_diff,
+        "ok": max_abs_diff <= atol,
+        "keras_ms": latency_ms(reference),
+        f"{backend}_ms": latency_ms(candidate),
+    }
+
+
+if __name__ == "__main__":
+    # python lstm_runtime.py export <model_dir>/7days [numpy|onnx]
+    # python lstm_runtime.py parity <model_dir>/7days [numpy|onnx]
+    if len(sys.argv) < 3 or sys.argv[1] not in ("export", "parity"):
+        print("Usage: python lstm_runtime.py export|parity <7days model dir> [numpy|onnx]")
+        sys.exit(2)
+
+    command, model_dir = sys.argv[1], sys.argv[2]
+    backend = sys.argv[3] if len(sys.argv) > 3 else "numpy"
+
+    if command == "export":
+        keras_model = load_keras_model(model_dir)
+        if backend == "onnx":
+            print(export_onnx(keras_model, os.path.join(model_dir, ONNX_FILE)))
+        else:
+            print(export_numpy_weights(keras_model, os.path.join(model_dir, NUMPY_WEIGHTS_FILE)))
+    else:
+        result = check_parity(model_dir, backend)
+        print(result)
+        sys.exit(0 if result["ok"] else 1)
@@ -1,7 +1,12 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import time
+
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-import pandas as pd
+from typing import List, Optional
 from dotenv import load_dotenv
 import os
 
@@ -10,25 +15,63 @@ load_dotenv()
 
 from predict import (
     load_models,
-    predict_weather_7days,
-    predict_weather_hourly,
-    predict_weather_daily,
+    ensure_models,
+    use_models,
+    predict_weather_7days_window_async,
+    predict_weather_7days_inputs,
+    predict_weather_codes_async,
     decode_wmo_code_batch,
-    process_input_hourly,
-    process_input_daily
+    Y_FEATURES
 )
 from crawl import (
     get_coordinates,
-    get_weather_data_30,
     get_weather_data_24hour,
     get_weather_data_daily,
+    get_weather_data_all,
+    get_weather_data_all_batch,
     process_30day_weather_data,
     process_hourly_weather_data,
     process_daily_weather_data
 )
-from groq_service import generate_farming_schedule, test_groq_connection, chat_with_groq
+from http_client import close_client
+from data_sources import data_source, use_request_source
+from forecast_cache import forecast_cache, make_key
+from inference_scheduler import MicroBatcher
+from inference_executor import inference
+from model_registry import registry, MODEL_LOAD_MODE, MODEL_WATCH_INTERVAL
+from timing import stage, start_request, server_timing_header
+import metrics
+from geocode_cache import geocode_cache
+from schedule_cache import schedule_cache
+from precompute import ForecastPrecomputer
+from rolling_window import rolling_windows, history_window
+from serializers import (
+    ORJSONResponse,
+    HOURLY_FIELDS,
+    DAILY_FIELDS,
+    DATE_FORMAT,
+    HOURLY_TIME_FORMAT,
+    OPEN_METEO_HOURLY_FORMAT,
+    STREAM_MEDIA_TYPES,
+    frame_records,
+    forecast_records,
+    stream_event
+)
+from groq_service import (
+    generate_farming_schedule,
+    test_groq_connection,
+    chat_with_groq,
+    open_chat_stream,
+    close_groq_client,
+    GroqBusyError
+)
+
+app = FastAPI(title="Weather Prediction API", default_response_class=ORJSONResponse)
 
-app = FastAPI(title="Weather Prediction API")
+metrics.watch_cache("forecast", forecast_cache)
+metrics.watch_cache("geocode", geocode_cache)
+if schedule_cache is not None:
+    metrics.watch_cache("schedule", schedule_cache)
 
 # CORS middleware
 app.add_middleware(
@@ -40,6 +83,42 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def select_weather_source(request: Request, call_next):
+    """Per-request weather data source: X-Weather-Source header or ?source=, limited to WEATHER_SOURCE_OVERRIDES"""
+    name = request.headers.get("x-weather-source") or request.query_params.get("source")
+    if name:
+        try:
+            use_request_source(name)
+        except PermissionError as e:
+            return ORJSONResponse({"detail": str(e)}, status_code=403)
+        except ValueError as e:
+            return ORJSONResponse({"detail": str(e)}, status_code=400)
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Per-stage durations of the request (geocode, upstream, process, predict, ...) in a Server-Timing header"""
+    started = time.perf_counter()
+    stages = start_request()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    stages["total"] = [elapsed, 1]
+    response.headers["Server-Timing"] = server_timing_header(stages)
+    metrics.observe_request(request.method, _route_path(request), response.status_code, elapsed)
+    return response
+
+
+def _route_path(request):
+    """Route template (VD: /api/predict/all) làm nhãn metrics - không dùng URL thô để tránh nhãn vô hạn"""
+    endpoint = request.scope.get("endpoint")
+    for route in app.routes:
+        if getattr(route, "endpoint", None) is endpoint:
+            return route.path
+    return "unmatched"
+
+
 # Request models
 class CityRequest(BaseModel):
     city: str
@@ -54,10 +133,89 @@ class CoordinatesResponse(BaseModel):
 
 @app.on_event("startup")
 async def startup_event():
-    """Load all models when server starts"""
-    print("🚀 Loading models...")
-    load_models()
-    print("✅ Models loaded successfully!")
+    """Load models according to MODEL_LOAD_MODE (eager | background | lazy)"""
+    if MODEL_LOAD_MODE == "eager":
+        print("🚀 Loading models...")
+        load_models()
+        print("✅ Models loaded successfully!")
+    elif MODEL_LOAD_MODE == "background":
+        # Server nhận request ngay; /readyz trả 503 cho tới khi load xong
+        print("🚀 Loading models in background...")
+        app.state.model_loading = asyncio.create_task(_load_models_background())
+    else:
+        print("💤 Models will be loaded on first use")
+
+    if MODEL_WATCH_INTERVAL > 0:
+        # Theo dõi thư mục model và hot-reload phiên bản mới không cần restart
+        app.state.model_watcher = asyncio.create_task(registry.watch(MODEL_WATCH_INTERVAL))
+
+    if precomputer.enabled:
+        # Tính sẵn forecast cho PRECOMPUTE_LOCATIONS mỗi đầu giờ
+        app.state.precompute = asyncio.create_task(precomputer.run())
+
+
+async def _load_models_background():
+    try:
+        await ensure_models()
+        print("✅ Models loaded successfully!")
+    except Exception as e:
+        print(f"❌ Error loading models: {str(e)}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the shared upstream HTTP connection pools"""
+    await close_client()
+    await close_groq_client()
+    await forecast_cache.close()
+    await lstm_batcher.close()
+    inference.shutdown()
+    for name in ("model_watcher", "precompute"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+
+
+# Micro-batching cho LSTM 7 ngày: gom tối đa LSTM_MAX_BATCH_SIZE request hoặc chờ tối đa LSTM_MAX_WAIT_MS
+LSTM_MAX_BATCH_SIZE = int(os.getenv("LSTM_MAX_BATCH_SIZE", 64))
+LSTM_MAX_WAIT_MS = float(os.getenv("LSTM_MAX_WAIT_MS", 5))
+
+
+def _lstm_predict(model, model_input):
+    with stage("model.7days"):
+        return model.predict(model_input, verbose=0)
+
+
+lstm_batcher = MicroBatcher(_lstm_predict, max_batch_size=LSTM_MAX_BATCH_SIZE,
+                            max_wait_ms=LSTM_MAX_WAIT_MS, name="7day_lstm",
+                            executor=inference.lstm_threads)
+
+# Số địa điểm tối đa trong một request /api/predict/batch
+MAX_BATCH_LOCATIONS = int(os.getenv("MAX_BATCH_LOCATIONS", 100))
+
+# /api/predict/7days trả thời gian dạng ISO đầy đủ như trước (Timestamp -> jsonable_encoder)
+SEVEN_DAY_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+async def cached_forecast(endpoint, city, compute):
+    """
+    Serve a forecast from the response cache, keyed by the resolved coordinates,
+    the endpoint, the loaded model version and the current GMT+7 hour.
+    Identical concurrent requests share a single `compute()` run.
+    """
+    # Giữ một phiên bản model cho cả request (hot-reload không đổi model giữa chừng)
+    models = registry.snapshot()
+    use_models(models)
+
+    async def compute_with_version():
+        return {**await compute(), "model_version": models.version}
+
+    coord = await get_coordinates(city)
+    key = make_key(endpoint, coord, models.version, source=data_source().name)
+    result = await forecast_cache.get_or_compute(key, compute_with_version)
+    # Các tên thành phố khác nhau có thể cùng tọa độ -> trả lại đúng tên người dùng gửi lên
+    # Trả thẳng ORJSONResponse để bỏ qua bước jsonable_encoder của FastAPI
+    return ORJSONResponse({**result, "city": city})
 
 
 @app.get("/")
@@ -65,11 +223,47 @@ async def root():
     return {"message": "Weather Prediction API is running"}
 
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and the event loop is responsive"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: all model bundles are loaded (always ready in lazy mode)"""
+    status = registry.status()
+    ready = registry.is_ready() or MODEL_LOAD_MODE == "lazy"
+    return ORJSONResponse({"ready": ready, **status}, status_code=200 if ready else 503)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics: request/stage/model/upstream latency histograms, upstream counters, cache hit ratios"""
+    rendered = metrics.render()
+    if rendered is None:
+        raise HTTPException(status_code=503, detail="Metrics disabled (METRICS_ENABLED=0 or prometheus_client missing)")
+    body, content_type = rendered
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/api/precompute/status")
+async def precompute_status():
+    """Background forecast precompute: last run, next run and last-refresh age per location"""
+    return precomputer.status()
+
+
+@app.get("/api/inference/stats")
+async def inference_stats():
+    """Queue depth and batch-size statistics of the 7-day LSTM micro-batcher, executor pool sizes"""
+    return {"lstm_batcher": lstm_batcher.stats(), "executor": inference.stats()}
+
+
 @app.post("/api/coordinates")
 async def get_city_coordinates(request: CityRequest):
     """Get coordinates for a city"""
     try:
-        coord = get_coordinates(request.city)
+        coord = await get_coordinates(request.city)
         return CoordinatesResponse(
             lat=coord["lat"],
             lon=coord["lon"],
@@ -83,321 +277,452 @@ async def get_city_coordinates(request: CityRequest):
 async def predict_7days(request: CityRequest):
     """Predict weather for next 7 days"""
     try:
-        import predict
+        return await cached_forecast("7days", request.city, lambda: _predict_7days(request.city))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        weather_30d = get_weather_data_30(request.city)
-        df_30d = process_30day_weather_data(weather_30d)
 
-        predictions_df = predict_weather_7days(
-            df_30d,
-            predict.scaler_x,
-            predict.scaler_y,
-            predict.pre7day_model,
-            input_window=30
-        )
+async def _predict_7days(city):
+    """Bring the city's rolling 30-day window up to date (only missing days are fetched) and run the 7-day LSTM"""
+    coord = await get_coordinates(city)
+    window, models = await asyncio.gather(history_window(coord), ensure_models("7days"))
+    seven_day = models.get("7days")
 
-        result = predictions_df.to_dict(orient="records")
-        return {"city": request.city, "predictions": result}
+    predictions_df = await predict_weather_7days_window_async(
+        window,
+        seven_day["scaler_x"],
+        seven_day["scaler_y"],
+        seven_day["model"],
+        lstm_batcher
+    )
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    result = frame_records(predictions_df, Y_FEATURES, time_format=SEVEN_DAY_TIME_FORMAT)
+    return {"city": city, "predictions": result}
 
 
 @app.post("/api/predict/hourly")
 async def predict_hourly(request: CityRequest):
     """Predict hourly weather codes for next 24 hours with full weather data"""
     try:
-        weather_24h = get_weather_data_24hour(request.city)
-        df_hourly = process_hourly_weather_data(weather_24h)
-
-        prepared_hourly = process_input_hourly(df_hourly)
-        predictions_hourly = predict_weather_hourly(prepared_hourly)
-
-        weather_descriptions = decode_wmo_code_batch(predictions_hourly)
-
-        # Create detailed hourly forecast with all weather parameters
-        hourly_forecast = []
-        for i in range(len(predictions_hourly)):
-            # Helper function to safely convert to float
-            def safe_float(value):
-                if pd.isna(value) or value is None:
-                    return 0.0
-                return float(value)
-
-            hourly_data = {
-                "time": str(df_hourly.iloc[i]['time']),
-                "weather_code": int(predictions_hourly[i]),
-                "weather_description": weather_descriptions[i],
-                "raw_data": {
-                    "temperature_2m": safe_float(df_hourly.iloc[i]['temperature_2m']),
-                    "apparent_temperature": safe_float(df_hourly.iloc[i]['apparent_temperature']),
-                    "dew_point_2m": safe_float(df_hourly.iloc[i]['dew_point_2m']),
-                    "precipitation": safe_float(df_hourly.iloc[i]['precipitation']),
-                    "cloud_cover": safe_float(df_hourly.iloc[i]['cloud_cover']),
-                    "relative_humidity_2m": safe_float(df_hourly.iloc[i]['relative_humidity_2m']),
-                    "wind_gusts_10m": safe_float(df_hourly.iloc[i]['wind_gusts_10m']),
-                    "wind_speed_10m": safe_float(df_hourly.iloc[i]['wind_speed_10m']),
-                    "wind_direction_10m": safe_float(df_hourly.iloc[i]['wind_direction_10m']),
-                    "surface_pressure": safe_float(df_hourly.iloc[i]['surface_pressure']),
-                    "pressure_msl": safe_float(df_hourly.iloc[i]['pressure_msl'])
-                }
-            }
-            hourly_forecast.append(hourly_data)
-
-        return {
-            "city": request.city,
-            "predictions": hourly_forecast
-        }
-
+        return await cached_forecast("hourly", request.city, lambda: _predict_hourly(request.city))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+async def _predict_hourly(city):
+    """Fetch the next 24 hours and run the hourly classifier"""
+    weather_24h, _ = await asyncio.gather(get_weather_data_24hour(city), ensure_models("hourly"))
+    df_hourly = process_hourly_weather_data(weather_24h)
+
+    # Scale + predict off the event loop (hourly process pool)
+    predictions_hourly, = await predict_weather_codes_async("hourly", [df_hourly], inference)
+
+    weather_descriptions = decode_wmo_code_batch(predictions_hourly)
+
+    # Create detailed hourly forecast with all weather parameters
+    hourly_forecast = forecast_records(
+        df_hourly, HOURLY_FIELDS, predictions_hourly, weather_descriptions,
+        time_format=HOURLY_TIME_FORMAT
+    )
+
+    return {
+        "city": city,
+        "predictions": hourly_forecast
+    }
+
+
 @app.post("/api/predict/daily")
 async def predict_daily(request: CityRequest):
     """Predict daily weather code with full weather parameters"""
     try:
-        weather_daily = get_weather_data_daily(request.city)
-        df_daily = process_daily_weather_data(weather_daily)
-
-        prepared_daily = process_input_daily(df_daily)
-        predictions_daily = predict_weather_daily(prepared_daily)
-
-        weather_description = decode_wmo_code_batch(predictions_daily)
-
-        # Helper function to safely convert to float
-        def safe_float(value):
-            if pd.isna(value) or value is None:
-                return 0.0
-            return float(value)
-
-        # Extract all weather parameters
-        raw_data = {
-            "temperature_2m_mean": safe_float(df_daily.iloc[0]['temperature_2m_mean']),
-            "temperature_2m_max": safe_float(df_daily.iloc[0]['temperature_2m_max']),
-            "temperature_2m_min": safe_float(df_daily.iloc[0]['temperature_2m_min']),
-            "apparent_temperature_mean": safe_float(df_daily.iloc[0]['apparent_temperature_mean']),
-            "apparent_temperature_max": safe_float(df_daily.iloc[0]['apparent_temperature_max']),
-            "apparent_temperature_min": safe_float(df_daily.iloc[0]['apparent_temperature_min']),
-            "dew_point_2m_mean": safe_float(df_daily.iloc[0]['dew_point_2m_mean']),
-            "precipitation_sum": safe_float(df_daily.iloc[0]['precipitation_sum']),
-            "cloud_cover_mean": safe_float(df_daily.iloc[0]['cloud_cover_mean']),
-            "relative_humidity_2m_mean": safe_float(df_daily.iloc[0]['relative_humidity_2m_mean']),
-            "wind_gusts_10m_mean": safe_float(df_daily.iloc[0]['wind_gusts_10m_mean']),
-            "wind_speed_10m_mean": safe_float(df_daily.iloc[0]['wind_speed_10m_mean']),
-            "winddirection_10m_dominant": safe_float(df_daily.iloc[0]['winddirection_10m_dominant']),
-            "surface_pressure_mean": safe_float(df_daily.iloc[0]['surface_pressure_mean']),
-            "pressure_msl_mean": safe_float(df_daily.iloc[0]['pressure_msl_mean']),
-            "daylight_duration": safe_float(df_daily.iloc[0]['daylight_duration']),
-            "sunshine_duration": safe_float(df_daily.iloc[0]['sunshine_duration'])
-        }
-
-        return {
-            "city": request.city,
-            "time": str(df_daily.iloc[0]['time']),
-            "weather_code": int(predictions_daily[0]),
-            "weather_description": weather_description[0],
-            "raw_data": raw_data
-        }
-
+        return await cached_forecast("daily", request.city, lambda: _predict_daily(request.city))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _predict_daily(city):
+    """Fetch today's data and run the daily classifier"""
+    weather_daily, _ = await asyncio.gather(get_weather_data_daily(city), ensure_models("daily"))
+    df_daily = process_daily_weather_data(weather_daily)
+
+    predictions_daily, = await predict_weather_codes_async("daily", [df_daily], inference)
+
+    weather_description = decode_wmo_code_batch(predictions_daily)
+
+    # Extract all weather parameters
+    today = forecast_records(
+        df_daily, DAILY_FIELDS, predictions_daily, weather_description,
+        time_format=DATE_FORMAT
+    )[0]
+
+    return {"city": city, **today}
+
+
+def stream_format(request: Request, format: Optional[str]):
+    """Streaming format from ?format= (ndjson | sse), else SSE when the client accepts text/event-stream"""
+    if format is None:
+        return "sse" if "text/event-stream" in request.headers.get("accept", "") else "ndjson"
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(STREAM_MEDIA_TYPES)}")
+    return format
+
+
+def streaming_sections(fmt, sections):
+    """
+    Stream (section, data) pairs as NDJSON lines or SSE events as soon as each one is ready.
+    A failure after the first byte cannot change the status code, so it is sent as an 'error' section.
+    """
+    async def body():
+        try:
+            async for section, data in sections:
+                yield stream_event(fmt, section, data)
+            yield stream_event(fmt, "done", {})
+        except Exception as e:
+            yield stream_event(fmt, "error", {"detail": str(e)})
+
+    return StreamingResponse(body(), media_type=STREAM_MEDIA_TYPES[fmt],
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _raw_all_sections(city):
+    """Sections of /api/weather/raw/all: coordinates first, then each data block as it is processed"""
+    coord_task = asyncio.ensure_future(get_coordinates(city))
+    weather_task = asyncio.ensure_future(get_weather_data_all(city))
+    try:
+        # Geocode và một request Open-Meteo cho cả 3 khối dữ liệu, chạy đồng thời
+        yield "coordinates", await coord_task
+        weather_30d, weather_24h, weather_daily = await weather_task
+    finally:
+        weather_task.cancel()
+
+    # Giá trị thiếu trả về null như dữ liệu gốc của Open-Meteo
+    df_daily = process_daily_weather_data(weather_daily)
+    yield "data_daily", {
+        "processed": frame_records(df_daily, time_format=DATE_FORMAT, fill_value=None)[0],
+        "raw": weather_daily
+    }
+
+    df_hourly = process_hourly_weather_data(weather_24h)
+    yield "data_24hours", {
+        "total_hours": len(df_hourly),
+        "processed": frame_records(df_hourly, time_format=OPEN_METEO_HOURLY_FORMAT, fill_value=None),
+        "raw": weather_24h
+    }
+
+    df_30d = process_30day_weather_data(weather_30d)
+    yield "data_30days", {
+        "total_days": len(df_30d),
+        "processed": frame_records(df_30d, time_format=DATE_FORMAT, fill_value=None),
+        "raw": weather_30d
+    }
+
+
 @app.post("/api/weather/raw/all")
 async def get_raw_weather_all(request: CityRequest):
     """Get all raw weather data at once"""
     try:
-        coord = get_coordinates(request.city)
-        weather_30d = get_weather_data_30(request.city)
-        weather_24h = get_weather_data_24hour(request.city)
-        weather_daily = get_weather_data_daily(request.city)
-
-        df_30d = process_30day_weather_data(weather_30d)
-        df_hourly = process_hourly_weather_data(weather_24h)
-        df_daily = process_daily_weather_data(weather_daily)
-
-        return {
+        sections = {section: data async for section, data in _raw_all_sections(request.city)}
+        return ORJSONResponse({
             "city": request.city,
-            "coordinates": coord,
-            "data_30days": {
-                "total_days": len(df_30d),
-                "processed": df_30d.to_dict(orient="records"),
-                "raw": weather_30d
-            },
-            "data_24hours": {
-                "total_hours": len(df_hourly),
-                "processed": df_hourly.to_dict(orient="records"),
-                "raw": weather_24h
-            },
-            "data_daily": {
-                "processed": df_daily.to_dict(orient="records")[0],
-                "raw": weather_daily
-            }
-        }
+            "coordinates": sections["coordinates"],
+            "data_30days": sections["data_30days"],
+            "data_24hours": sections["data_24hours"],
+            "data_daily": sections["data_daily"]
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/weather/raw/all/stream")
+async def stream_raw_weather_all(request: CityRequest, raw_request: Request, format: Optional[str] = None):
+    """Raw weather data streamed section by section (coordinates, data_daily, data_24hours, data_30days)"""
+    fmt = stream_format(raw_request, format)
+
+    async def sections():
+        yield "meta", {"city": request.city}
+        async for section, data in _raw_all_sections(request.city):
+            yield section, data
+
+    return streaming_sections(fmt, sections())
+
+
 @app.post("/api/predict/all")
 async def predict_all(request: CityRequest):
     """Get all predictions at once (7-day, hourly, daily) - Optimized for single API call"""
     try:
-        import predict
-
-        # Fetch all weather data in parallel (conceptually)
-        weather_30d = get_weather_data_30(request.city)
-        weather_24h = get_weather_data_24hour(request.city)
-        weather_daily = get_weather_data_daily(request.city)
-
-        # Process data
-        df_30d = process_30day_weather_data(weather_30d)
-        df_hourly = process_hourly_weather_data(weather_24h)
-        df_daily = process_daily_weather_data(weather_daily)
-
-        # Make all predictions
-        predictions_7day = predict_weather_7days(
-            df_30d,
-            predict.scaler_x,
-            predict.scaler_y,
-            predict.pre7day_model
-        )
+        return await cached_forecast("all", request.city, lambda: _predict_all(request.city))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        prepared_hourly = process_input_hourly(df_hourly)
-        predictions_hourly = predict_weather_hourly(prepared_hourly)
-        hourly_descriptions = decode_wmo_code_batch(predictions_hourly)
 
-        prepared_daily = process_input_daily(df_daily)
-        predictions_daily = predict_weather_daily(prepared_daily)
-        daily_description = decode_wmo_code_batch(predictions_daily)
+# Các phần của /api/predict/all, theo thứ tự trong response thường
+ALL_SECTIONS = ("seven_day_forecast", "hourly_forecast", "today_forecast")
+
+
+async def _predict_all(city):
+    """Fetch everything with one upstream call and run all three models"""
+    sections = {section: data async for section, data in _predict_all_sections(city)}
+    return {"city": city, **{section: sections[section] for section in ALL_SECTIONS}}
+
+
+async def _predict_all_sections(city):
+    """
+    Yield the today / hourly / seven_day sections of /api/predict/all in completion order.
+    The LSTM and both classifiers run concurrently in the executor pools, so today_forecast
+    is usually ready long before the 7-day forecast.
+    """
+    # Fetch all weather data with a single upstream call (models load meanwhile if lazy).
+    # The 30-day history only needs the days missing from the city's rolling window.
+    coord = await get_coordinates(city)
+    (weather_30d, weather_24h, weather_daily), models = await asyncio.gather(
+        get_weather_data_all(city, past_days=rolling_windows.missing_days(coord)), ensure_models()
+    )
+
+    # Process data
+    df_hourly = process_hourly_weather_data(weather_24h)
+    df_daily = process_daily_weather_data(weather_daily)
+    seven_day = models.get("7days")
+
+    async def today():
+        daily_codes, = await predict_weather_codes_async("daily", [df_daily], inference)
+        return "today_forecast", today_section(df_daily, daily_codes)
+
+    async def hourly():
+        hourly_codes, = await predict_weather_codes_async("hourly", [df_hourly], inference)
+        return "hourly_forecast", hourly_section(df_hourly, hourly_codes)
+
+    async def seven_days():
+        window = await history_window(coord, weather_30d.get("daily"))
+        predictions_7day = await predict_weather_7days_window_async(
+            window,
+            seven_day["scaler_x"],
+            seven_day["scaler_y"],
+            seven_day["model"],
+            lstm_batcher
+        )
+        # Predict weather_code for all 7 days at once using daily model (1 transform + 1 predict)
+        seven_day_codes, = await predict_weather_codes_async(
+            "daily", [predictions_7day[['time'] + Y_FEATURES]], inference
+        )
+        return "seven_day_forecast", seven_day_section(predictions_7day, seven_day_codes)
 
-        # Helper function to safely convert to float
-        def safe_float(value):
-            if pd.isna(value) or value is None:
-                return 0.0
-            return float(value)
+    tasks = [asyncio.ensure_future(section()) for section in (today, hourly, seven_days)]
+    try:
+        for next_section in asyncio.as_completed(tasks):
+            yield await next_section
+    finally:
+        # Client ngắt kết nối giữa chừng -> dừng các phần chưa xong
+        for task in tasks:
+            task.cancel()
+
+
+def seven_day_section(predictions_7day, seven_day_codes):
+    return frame_records(
+        predictions_7day, Y_FEATURES, time_format=DATE_FORMAT,
+        extra={"weather_code": [int(code) for code in seven_day_codes],
+               "weather_description": decode_wmo_code_batch(seven_day_codes)}
+    )
+
+
+def hourly_section(df_hourly, hourly_codes):
+    return forecast_records(
+        df_hourly, HOURLY_FIELDS, hourly_codes, decode_wmo_code_batch(hourly_codes),
+        time_format=HOURLY_TIME_FORMAT
+    )
+
+
+def today_section(df_daily, daily_codes):
+    return forecast_records(
+        df_daily, DAILY_FIELDS, daily_codes, decode_wmo_code_batch(daily_codes),
+        time_format=DATE_FORMAT
+    )[0]
+
+
+def build_all_response(predictions_7day, seven_day_codes, df_hourly, hourly_codes, df_daily, daily_codes):
+    """Build the seven_day / hourly / today blocks of /api/predict/all (columnar, NaN -> 0)"""
+    return {
+        "seven_day_forecast": seven_day_section(predictions_7day, seven_day_codes),
+        "hourly_forecast": hourly_section(df_hourly, hourly_codes),
+        "today_forecast": today_section(df_daily, daily_codes)
+    }
+
+
+@app.post("/api/predict/all/stream")
+async def stream_predict_all(request: CityRequest, raw_request: Request, format: Optional[str] = None):
+    """
+    /api/predict/all streamed as NDJSON (default) or SSE (?format=sse or Accept: text/event-stream):
+    meta, then today_forecast / hourly_forecast / seven_day_forecast as each finishes, then done.
+    """
+    fmt = stream_format(raw_request, format)
+    city = request.city
+    models = registry.snapshot()
+    use_models(models)
+
+    async def sections():
+        use_models(models)
+        coord = await get_coordinates(city)
+        yield "meta", {"city": city, "model_version": models.version}
+
+        # Cùng khóa cache với /api/predict/all: đã có thì phát lại ngay, chưa có thì tính rồi lưu
+        key = make_key("all", coord, models.version, source=data_source().name)
+        cached = await forecast_cache.get(key)
+        if cached is not None:
+            for section in reversed(ALL_SECTIONS):
+                yield section, cached[section]
+            return
+
+        result = {}
+        async for section, data in _predict_all_sections(city):
+            result[section] = data
+            yield section, data
+        await forecast_cache.set(key, {"city": city, **{section: result[section] for section in ALL_SECTIONS},
+                                       "model_version": models.version})
+
+    return streaming_sections(fmt, sections())
+
+
+class LocationItem(BaseModel):
+    city: Optional[str] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+
+
+class BatchRequest(BaseModel):
+    locations: List[LocationItem]
+
+
+@app.post("/api/predict/batch")
+async def predict_batch(request: BatchRequest):
+    """Get all predictions (7-day, hourly, daily) for many locations in one call"""
+    if not request.locations:
+        raise HTTPException(status_code=400, detail="locations must not be empty")
+    if len(request.locations) > MAX_BATCH_LOCATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_LOCATIONS} locations per batch")
+    for item in request.locations:
+        if item.city is None and (item.lat is None or item.lon is None):
+            raise HTTPException(status_code=400, detail="Each location needs either city or lat/lon")
 
-        # Predict weather_code for each of the 7 days using daily model
-        import numpy as np
-        seven_day_with_codes = []
-        
-        for i in range(len(predictions_7day)):
-            day_data = predictions_7day.iloc[i]
-            
-            # Calculate sin_doy and cos_doy from the time field
-            day_time = pd.to_datetime(day_data['time'])
-            day_of_year = day_time.dayofyear
-            sin_doy = np.sin(2 * np.pi * day_of_year / 365.25)
-            cos_doy = np.cos(2 * np.pi * day_of_year / 365.25)
-            
-            # Create a DataFrame with one row containing the predicted day's data
-            # Include 'time' column FIRST (required by process_input_daily)
-            day_features = pd.DataFrame([{
-                'time': day_time,
-                'temperature_2m_mean': day_data['temperature_2m_mean'],
-                'temperature_2m_max': day_data['temperature_2m_max'],
-                'temperature_2m_min': day_data['temperature_2m_min'],
-                'apparent_temperature_mean': day_data['apparent_temperature_mean'],
-                'apparent_temperature_max': day_data['apparent_temperature_max'],
-                'apparent_temperature_min': day_data['apparent_temperature_min'],
-                'dew_point_2m_mean': day_data['dew_point_2m_mean'],
-                'precipitation_sum': day_data['precipitation_sum'],
-                'cloud_cover_mean': day_data['cloud_cover_mean'],
-                'relative_humidity_2m_mean': day_data['relative_humidity_2m_mean'],
-                'wind_gusts_10m_mean': day_data['wind_gusts_10m_mean'],
-                'wind_speed_10m_mean': day_data['wind_speed_10m_mean'],
-                'winddirection_10m_dominant': day_data['winddirection_10m_dominant'],
-                'surface_pressure_mean': day_data['surface_pressure_mean'],
-                'pressure_msl_mean': day_data['pressure_msl_mean'],
-                'daylight_duration': day_data['daylight_duration'],
-                'sunshine_duration': day_data['sunshine_duration'],
-                'sin_doy': sin_doy,
-                'cos_doy': cos_doy
-            }])
-            
-            # Predict weather code for this day
-            prepared_day = process_input_daily(day_features)
-            weather_code = predict_weather_daily(prepared_day)[0]
-            weather_desc = decode_wmo_code_batch([weather_code])[0]
-            
-            # Add weather_code and description to the day data (exclude sin_doy, cos_doy from response)
-            day_dict = {
-                'time': day_time.strftime('%Y-%m-%d'),  # Format as YYYY-MM-DD (same as today)
-                'temperature_2m_mean': safe_float(day_data['temperature_2m_mean']),
-                'temperature_2m_max': safe_float(day_data['temperature_2m_max']),
-                'temperature_2m_min': safe_float(day_data['temperature_2m_min']),
-                'apparent_temperature_mean': safe_float(day_data['apparent_temperature_mean']),
-                'apparent_temperature_max': safe_float(day_data['apparent_temperature_max']),
-                'apparent_temperature_min': safe_float(day_data['apparent_temperature_min']),
-                'dew_point_2m_mean': safe_float(day_data['dew_point_2m_mean']),
-                'precipitation_sum': safe_float(day_data['precipitation_sum']),
-                'cloud_cover_mean': safe_float(day_data['cloud_cover_mean']),
-                'relative_humidity_2m_mean': safe_float(day_data['relative_humidity_2m_mean']),
-                'wind_gusts_10m_mean': safe_float(day_data['wind_gusts_10m_mean']),
-                'wind_speed_10m_mean': safe_float(day_data['wind_speed_10m_mean']),
-                'winddirection_10m_dominant': safe_float(day_data['winddirection_10m_dominant']),
-                'surface_pressure_mean': safe_float(day_data['surface_pressure_mean']),
-                'pressure_msl_mean': safe_float(day_data['pressure_msl_mean']),
-                'daylight_duration': safe_float(day_data['daylight_duration']),
-                'sunshine_duration': safe_float(day_data['sunshine_duration']),
-                'weather_code': int(weather_code),
-                'weather_description': weather_desc
-            }
-            seven_day_with_codes.append(day_dict)
-
-        # Build response with all data
-        return {
-            "city": request.city,
-            "seven_day_forecast": seven_day_with_codes,
-            "hourly_forecast": [
-                {
-                    "time": str(df_hourly.iloc[i]['time']),
-                    "weather_code": int(predictions_hourly[i]),
-                    "weather_description": hourly_descriptions[i],
-                    "raw_data": {
-                        "temperature_2m": safe_float(df_hourly.iloc[i]['temperature_2m']),
-                        "apparent_temperature": safe_float(df_hourly.iloc[i]['apparent_temperature']),
-                        "dew_point_2m": safe_float(df_hourly.iloc[i]['dew_point_2m']),
-                        "precipitation": safe_float(df_hourly.iloc[i]['precipitation']),
-                        "cloud_cover": safe_float(df_hourly.iloc[i]['cloud_cover']),
-                        "relative_humidity_2m": safe_float(df_hourly.iloc[i]['relative_humidity_2m']),
-                        "wind_gusts_10m": safe_float(df_hourly.iloc[i]['wind_gusts_10m']),
-                        "wind_speed_10m": safe_float(df_hourly.iloc[i]['wind_speed_10m']),
-                        "wind_direction_10m": safe_float(df_hourly.iloc[i]['wind_direction_10m']),
-                        "surface_pressure": safe_float(df_hourly.iloc[i]['surface_pressure']),
-                        "pressure_msl": safe_float(df_hourly.iloc[i]['pressure_msl'])
-                    }
-                }
-                for i in range(len(predictions_hourly))
-            ],
-            "today_forecast": {
-                "time": str(df_daily.iloc[0]['time']),
-                "weather_code": int(predictions_daily[0]),
-                "weather_description": daily_description[0],
-                "raw_data": {
-                    "temperature_2m_mean": safe_float(df_daily.iloc[0]['temperature_2m_mean']),
-                    "temperature_2m_max": safe_float(df_daily.iloc[0]['temperature_2m_max']),
-                    "temperature_2m_min": safe_float(df_daily.iloc[0]['temperature_2m_min']),
-                    "apparent_temperature_mean": safe_float(df_daily.iloc[0]['apparent_temperature_mean']),
-                    "apparent_temperature_max": safe_float(df_daily.iloc[0]['apparent_temperature_max']),
-                    "apparent_temperature_min": safe_float(df_daily.iloc[0]['apparent_temperature_min']),
-                    "dew_point_2m_mean": safe_float(df_daily.iloc[0]['dew_point_2m_mean']),
-                    "precipitation_sum": safe_float(df_daily.iloc[0]['precipitation_sum']),
-                    "cloud_cover_mean": safe_float(df_daily.iloc[0]['cloud_cover_mean']),
-                    "relative_humidity_2m_mean": safe_float(df_daily.iloc[0]['relative_humidity_2m_mean']),
-                    "wind_gusts_10m_mean": safe_float(df_daily.iloc[0]['wind_gusts_10m_mean']),
-                    "wind_speed_10m_mean": safe_float(df_daily.iloc[0]['wind_speed_10m_mean']),
-                    "winddirection_10m_dominant": safe_float(df_daily.iloc[0]['winddirection_10m_dominant']),
-                    "surface_pressure_mean": safe_float(df_daily.iloc[0]['surface_pressure_mean']),
-                    "pressure_msl_mean": safe_float(df_daily.iloc[0]['pressure_msl_mean']),
-                    "daylight_duration": safe_float(df_daily.iloc[0]['daylight_duration']),
-                    "sunshine_duration": safe_float(df_daily.iloc[0]['sunshine_duration'])
-                }
-            }
-        }
+    try:
+        models = registry.snapshot()
+        use_models(models)
+
+        # 1. Resolve coordinates (cached geocoding, concurrent)
+        async def resolve(item):
+            if item.lat is not None and item.lon is not None:
+                return {"lat": item.lat, "lon": item.lon}
+            return await get_coordinates(item.city)
+
+        coords = await asyncio.gather(*(resolve(item) for item in request.locations), return_exceptions=True)
+
+        # 2-3. Batched upstream fetch and inference for every resolved location
+        results = [None] * len(request.locations)
+        ok = []
+        for i, coord in enumerate(coords):
+            if isinstance(coord, Exception):
+                results[i] = {"error": str(coord)}
+            else:
+                ok.append(i)
+        for i, result in zip(ok, await predict_all_batch([coords[i] for i in ok], models)):
+            results[i] = result
+
+        # 4. Attach the requested location to every result
+        for i, item in enumerate(request.locations):
+            coord = coords[i]
+            location = {"city": item.city}
+            if not isinstance(coord, Exception):
+                location.update(lat=coord["lat"], lon=coord["lon"])
+            results[i] = {**location, **results[i]}
+
+        return ORJSONResponse({"model_version": models.version, "results": results})
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def predict_all_batch(coords, models):
+    """
+    /api/predict/all bodies (seven_day / hourly / today) for many resolved coordinates:
+    multi-coordinate Open-Meteo requests, one LSTM forward pass on the (N, 30, 19) stack
+    and one predict per classifier. Locations without upstream data get {"error": ...}.
+    Locations are grouped by how many past days their rolling window is missing, so warm
+    windows only fetch today while new locations fetch the full 30 days.
+    """
+    results = [None] * len(coords)
+    groups = {}
+    for i, coord in enumerate(coords):
+        groups.setdefault(rolling_windows.missing_days(coord), []).append(i)
+    group_bundles, _ = await asyncio.gather(
+        asyncio.gather(*(get_weather_data_all_batch([coords[i] for i in indices], past_days=past_days)
+                         for past_days, indices in groups.items())),
+        ensure_models()
+    )
+    bundles = [None] * len(coords)
+    for indices, fetched_group in zip(groups.values(), group_bundles):
+        for i, bundle in zip(indices, fetched_group):
+            bundles[i] = bundle
+    fetched = []
+    for i, bundle in enumerate(bundles):
+        if bundle[0] is None:
+            results[i] = {"error": "Upstream weather data unavailable"}
+        else:
+            fetched.append((i, bundle))
+
+    windows = await asyncio.gather(
+        *(history_window(coords[i], weather_30d.get("daily")) for i, (weather_30d, _, _) in fetched),
+        return_exceptions=True
+    )
+    valid = []
+    for (i, (_, weather_24h, weather_daily)), window in zip(fetched, windows):
+        if isinstance(window, Exception):
+            results[i] = {"error": str(window)}
+        else:
+            valid.append((i, window,
+                          process_hourly_weather_data(weather_24h),
+                          process_daily_weather_data(weather_daily)))
+
+    if valid:
+        _, windows, frames_hourly, frames_daily = zip(*valid)
+        seven_day = models.get("7days")
+        predictions_7day, hourly_codes, daily_codes = await asyncio.gather(
+            inference.run(
+                predict_weather_7days_inputs,
+                [window.model_input(seven_day["scaler_x"]) for window in windows],
+                [window.last_time() for window in windows],
+                seven_day["scaler_y"],
+                seven_day["model"]
+            ),
+            predict_weather_codes_async("hourly", list(frames_hourly), inference),
+            predict_weather_codes_async("daily", list(frames_daily), inference)
+        )
+        seven_day_codes = await predict_weather_codes_async(
+            "daily", [df[['time'] + Y_FEATURES] for df in predictions_7day], inference
+        )
+
+        for n, (i, _, df_hourly, df_daily) in enumerate(valid):
+            results[i] = build_all_response(predictions_7day[n], seven_day_codes[n], df_hourly,
+                                            hourly_codes[n], df_daily, daily_codes[n])
+    return results
+
+
+async def precompute_batch(coords):
+    """compute_batch for ForecastPrecomputer: current model version + predict_all_batch results"""
+    models = registry.snapshot()
+    use_models(models)
+    return models.version, await predict_all_batch(coords, models)
+
+
+precomputer = ForecastPrecomputer(precompute_batch)
+metrics.watch_precompute(precomputer)
+
+
 # Groq AI Endpoints
+# Trường thời tiết gửi cho Groq khi lập lịch (rút gọn so với seven_day_forecast)
+SCHEDULE_FIELDS = [
+    'temperature_2m_mean', 'temperature_2m_max', 'temperature_2m_min', 'precipitation_sum',
+    'relative_humidity_2m_mean', 'wind_speed_10m_mean'
+]
+
+
 class ScheduleRequest(BaseModel):
     crop_name: str
     farm_location: str
@@ -410,82 +735,37 @@ class ScheduleRequest(BaseModel):
 async def generate_schedule(request: ScheduleRequest):
     """Generate 7-day farming schedule using Groq AI"""
     try:
-        import predict
-        
+        use_models(registry.snapshot())
+
         # Get 7-day weather forecast for the city
-        weather_30d = get_weather_data_30(request.city)
-        df_30d = process_30day_weather_data(weather_30d)
+        coord = await get_coordinates(request.city)
+        window, models = await asyncio.gather(history_window(coord), ensure_models("7days", "daily"))
+        seven_day = models.get("7days")
         
-        predictions_7day = predict_weather_7days(
-            df_30d,
-            predict.scaler_x,
-            predict.scaler_y,
-            predict.pre7day_model
+        predictions_7day = await predict_weather_7days_window_async(
+            window,
+            seven_day["scaler_x"],
+            seven_day["scaler_y"],
+            seven_day["model"],
+            lstm_batcher
         )
         
-        # Predict weather codes for the 7 days
-        import numpy as np
-        seven_day_with_codes = []
-        
-        for i in range(len(predictions_7day)):
-            day_data = predictions_7day.iloc[i]
-            
-            day_time = pd.to_datetime(day_data['time'])
-            day_of_year = day_time.dayofyear
-            sin_doy = np.sin(2 * np.pi * day_of_year / 365.25)
-            cos_doy = np.cos(2 * np.pi * day_of_year / 365.25)
-            
-            day_features = pd.DataFrame([{
-                'time': day_time,
-                'temperature_2m_mean': day_data['temperature_2m_mean'],
-                'temperature_2m_max': day_data['temperature_2m_max'],
-                'temperature_2m_min': day_data['temperature_2m_min'],
-                'apparent_temperature_mean': day_data['apparent_temperature_mean'],
-                'apparent_temperature_max': day_data['apparent_temperature_max'],
-                'apparent_temperature_min': day_data['apparent_temperature_min'],
-                'dew_point_2m_mean': day_data['dew_point_2m_mean'],
-                'precipitation_sum': day_data['precipitation_sum'],
-                'cloud_cover_mean': day_data['cloud_cover_mean'],
-                'relative_humidity_2m_mean': day_data['relative_humidity_2m_mean'],
-                'wind_gusts_10m_mean': day_data['wind_gusts_10m_mean'],
-                'wind_speed_10m_mean': day_data['wind_speed_10m_mean'],
-                'winddirection_10m_dominant': day_data['winddirection_10m_dominant'],
-                'surface_pressure_mean': day_data['surface_pressure_mean'],
-                'pressure_msl_mean': day_data['pressure_msl_mean'],
-                'daylight_duration': day_data['daylight_duration'],
-                'sunshine_duration': day_data['sunshine_duration'],
-                'sin_doy': sin_doy,
-                'cos_doy': cos_doy
-            }])
-            
-            prepared_day = process_input_daily(day_features)
-            weather_code = predict_weather_daily(prepared_day)[0]
-            weather_desc = decode_wmo_code_batch([weather_code])[0]
-            
-            def safe_float(value):
-                if pd.isna(value) or value is None:
-                    return 0.0
-                return float(value)
-            
-            day_dict = {
-                'time': day_time.strftime('%Y-%m-%d'),
-                'temperature_2m_mean': safe_float(day_data['temperature_2m_mean']),
-                'temperature_2m_max': safe_float(day_data['temperature_2m_max']),
-                'temperature_2m_min': safe_float(day_data['temperature_2m_min']),
-                'precipitation_sum': safe_float(day_data['precipitation_sum']),
-                'relative_humidity_2m_mean': safe_float(day_data['relative_humidity_2m_mean']),
-                'wind_speed_10m_mean': safe_float(day_data['wind_speed_10m_mean']),
-                'weather_code': int(weather_code),
-                'weather_description': weather_desc
-            }
-            seven_day_with_codes.append(day_dict)
-        
+        # Predict weather codes for the 7 days in one batch
+        seven_day_codes, = await predict_weather_codes_async(
+            "daily", [predictions_7day[['time'] + Y_FEATURES]], inference
+        )
+        seven_day_descriptions = decode_wmo_code_batch(seven_day_codes)
+        seven_day_with_codes = frame_records(
+            predictions_7day, SCHEDULE_FIELDS, time_format=DATE_FORMAT,
+            extra={"weather_code": seven_day_codes, "weather_description": seven_day_descriptions}
+        )
+
         weather_forecast = {
             "seven_day_forecast": seven_day_with_codes
         }
         
         # Generate schedule using Groq AI
-        schedule = generate_farming_schedule(
+        schedule = await generate_farming_schedule(
             crop_name=request.crop_name,
             location=request.farm_location,
             season=request.season_goal,
@@ -493,8 +773,10 @@ async def generate_schedule(request: ScheduleRequest):
             notes=request.notes
         )
         
-        return schedule
+        return {**schedule, "model_version": models.version}
         
+    except GroqBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -502,7 +784,7 @@ async def generate_schedule(request: ScheduleRequest):
 @app.get("/api/groq/test")
 async def test_groq():
     """Test Groq API connection"""
-    return test_groq_connection()
+    return await test_groq_connection()
 
 
 class ChatRequest(BaseModel):
@@ -515,16 +797,60 @@ class ChatRequest(BaseModel):
 async def chat(request: ChatRequest):
     """Chat with context-aware AI assistant"""
     try:
-        response = chat_with_groq(
+        response = await chat_with_groq(
             user_message=request.user_message,
             weather_context=request.weather_context,
             agriculture_context=request.agriculture_context
         )
         return response
+    except GroqBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/groq/chat/stream")
+async def chat_stream(request: ChatRequest, raw_request: Request):
+    """
+    Token-streaming variant of /api/groq/chat as Server-Sent Events:
+    'token' events ({"content"}) as Groq generates them, then 'done' with the full reply
+    and timing (ttft_ms, tokens, tokens_per_second), or 'error'.
+    If the client disconnects, the upstream Groq stream is closed so generation stops.
+    """
+    try:
+        chat_stream = await open_chat_stream(
+            user_message=request.user_message,
+            weather_context=request.weather_context,
+            agriculture_context=request.agriculture_context,
+            stats={}
+        )
+    except GroqBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to chat with AI: {e}")
+
+    async def body():
+        reply = []
+        try:
+            async for content in chat_stream:
+                if await raw_request.is_disconnected():
+                    break
+                reply.append(content)
+                yield stream_event("sse", "token", {"content": content})
+            else:
+                yield stream_event("sse", "done", {"reply": "".join(reply), **chat_stream.stats})
+        except Exception as e:
+            yield stream_event("sse", "error", {"detail": str(e)})
+        finally:
+            # Đóng stream Groq ngay (kể cả khi client ngắt kết nối giữa chừng)
+            await chat_stream.aclose()
+
+    # background: trả slot cả khi client ngắt kết nối trước khi body bắt đầu chạy
+    return StreamingResponse(body(), media_type=STREAM_MEDIA_TYPES["sse"],
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(chat_stream.aclose))
+
+
 if __name__ == "__main__":
     import uvicorn
 
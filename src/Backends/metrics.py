@@ -0,0 +1,192 @@
+import os
+import time
+
+from dotenv import load_dotenv
+
+import timing
+
+load_dotenv()
+
+# Cấu hình qua biến môi trường
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+OTEL_TRACING = os.getenv("OTEL_TRACING", "0").lower() in ("1", "true", "yes")   # span OpenTelemetry cho mỗi stage
+
+# prometheus_client là tùy chọn: thiếu package thì các hàm dưới đây không làm gì và /metrics trả 503
+try:
+    from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+except ImportError:
+    Counter = Gauge = Histogram = None
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+ENABLED = METRICS_ENABLED and Histogram is not None
+
+# Bucket (giây) từ 1ms tới 30s: stage nhỏ (serialize) lẫn upstream chậm (Groq)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+if ENABLED:
+    REQUEST_SECONDS = Histogram(
+        "agriweather_request_seconds", "HTTP request latency by route",
+        ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+    )
+    STAGE_SECONDS = Histogram(
+        "agriweather_stage_seconds", "Duration of request stages (geocode, upstream, process, predict, ...)",
+        ["stage"], buckets=LATENCY_BUCKETS,
+    )
+    MODEL_SECONDS = Histogram(
+        "agriweather_model_inference_seconds", "Model forward pass / classifier latency by model",
+        ["model"], buckets=LATENCY_BUCKETS,
+    )
+    UPSTREAM_REQUESTS = Counter(
+        "agriweather_upstream_requests", "Upstream HTTP calls by host and status (or error type)",
+        ["host", "status"],
+    )
+    UPSTREAM_SECONDS = Histogram(
+        "agriweather_upstream_seconds", "Upstream HTTP call latency by host",
+        ["host"], buckets=LATENCY_BUCKETS,
+    )
+    LLM_TTFT_SECONDS = Histogram(
+        "agriweather_groq_ttft_seconds", "Time to first token of streamed Groq completions",
+        ["model"], buckets=LATENCY_BUCKETS,
+    )
+    LLM_TOKENS_PER_SECOND = Histogram(
+        "agriweather_groq_tokens_per_second", "Generation throughput of streamed Groq completions (after first token)",
+        ["model"], buckets=(5, 10, 25, 50, 100, 200, 400, 800, 1600),
+    )
+    PROMPT_TOKENS = Histogram(
+        "agriweather_groq_context_tokens", "Estimated tokens of the weather/agriculture context in chat prompts",
+        ["mode"], buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000),
+    )
+    GROQ_REQUESTS = Counter(
+        "agriweather_groq_requests", "Groq calls by outcome (ok, error, retry, rejected = no free concurrency slot)",
+        ["outcome"],
+    )
+    GROQ_IN_FLIGHT = Gauge("agriweather_groq_in_flight", "Groq calls currently holding a concurrency slot")
+
+# Các cache có thuộc tính hits/misses: {tên: đối tượng cache}
+_caches = {}
+
+
+def watch_cache(name, cache):
+    """Xuất hits/misses/hit ratio của `cache` (đọc lúc Prometheus scrape, không tốn chi phí mỗi request)."""
+    _caches[name] = cache
+
+
+# Đối tượng có ages() -> {địa điểm: giây từ lần làm mới gần nhất} (ForecastPrecomputer)
+_precomputers = []
+
+
+def watch_precompute(precomputer):
+    """Xuất tuổi của forecast tính sẵn theo địa điểm (agriweather_precompute_age_seconds)."""
+    _precomputers.append(precomputer)
+
+
+def _observe_stage(name, seconds):
+    STAGE_SECONDS.labels(name).observe(seconds)
+    # Stage "model.<tên>" bao quanh đúng lần gọi model -> thêm vào histogram theo model
+    if name.startswith("model."):
+        MODEL_SECONDS.labels(name[6:]).observe(seconds)
+
+
+def observe_request(method, route, status, seconds):
+    if ENABLED:
+        REQUEST_SECONDS.labels(method, route, str(status)).observe(seconds)
+
+
+def observe_upstream(host, status, seconds):
+    """Ghi nhận một lần gọi upstream; `status` là mã HTTP hoặc tên lỗi (VD: 'ConnectTimeout')."""
+    if ENABLED:
+        UPSTREAM_REQUESTS.labels(host, str(status)).inc()
+        UPSTREAM_SECONDS.labels(host).observe(seconds)
+
+
+def observe_llm_stream(model, ttft, tokens, generation_seconds):
+    """Ghi nhận một lần stream LLM: thời gian tới token đầu và tốc độ sinh token (tokens/giây)."""
+    if ENABLED:
+        LLM_TTFT_SECONDS.labels(model).observe(ttft)
+        if generation_seconds > 0 and tokens:
+            LLM_TOKENS_PER_SECOND.labels(model).observe(tokens / generation_seconds)
+
+
+def observe_groq_request(outcome):
+    if ENABLED:
+        GROQ_REQUESTS.labels(outcome).inc()
+
+
+def observe_groq_in_flight(delta):
+    if ENABLED:
+        GROQ_IN_FLIGHT.inc(delta)
+
+
+def observe_prompt_tokens(mode, tokens):
+    if ENABLED:
+        PROMPT_TOKENS.labels(mode).observe(tokens)
+
+
+class upstream_call:
+    """
+    Đo một lần gọi upstream không đi qua http_client (VD: Groq SDK):
+
+        with upstream_call("api.groq.com"):
+            client.chat.completions.create(...)
+    """
+
+    def __init__(self, host):
+        self.host = host
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        status = getattr(exc, "status_code", None) or (exc_type.__name__ if exc_type else 200)
+        observe_upstream(self.host, status, time.perf_counter() - self.started)
+        return False
+
+
+class _CacheCollector:
+    def collect(self):
+        hits = CounterMetricFamily("agriweather_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("agriweather_cache_misses", "Cache misses", labels=["cache"])
+        ratio = GaugeMetricFamily("agriweather_cache_hit_ratio", "Cache hit ratio since start", labels=["cache"])
+        for name, cache in _caches.items():
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+            total = cache.hits + cache.misses
+            ratio.add_metric([name], cache.hits / total if total else 0.0)
+        yield hits
+        yield misses
+        yield ratio
+
+        if _precomputers:
+            age = GaugeMetricFamily("agriweather_precompute_age_seconds",
+                                    "Seconds since the precomputed forecast of a location was last refreshed",
+                                    labels=["location"])
+            for precomputer in _precomputers:
+                for location, seconds in precomputer.ages().items():
+                    age.add_metric([location], seconds)
+            yield age
+
+
+def render():
+    """(body, content type) cho endpoint /metrics, None nếu metrics bị tắt / thiếu prometheus_client."""
+    if not ENABLED:
+        return None
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def _setup_tracing():
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        print("⚠️ OTEL_TRACING=1 but opentelemetry-api is not installed - tracing disabled")
+        return
+    # Exporter/SDK do môi trường cấu hình (VD: chạy qua `opentelemetry-instrument uvicorn main:app`)
+    timing.set_tracer(trace.get_tracer("agri-weather"))
+
+
+if ENABLED:
+    timing.add_observer(_observe_stage)
+    REGISTRY.register(_CacheCollector())
+if OTEL_TRACING:
+    _setup_tracing()
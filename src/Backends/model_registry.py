@@ -0,0 +1,281 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+from dotenv import load_dotenv
+
+from lstm_runtime import load_lstm, LSTM_BACKEND
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _default_model_dir():
+    # README đặt model ở src/Backends/model; đường dẫn cứng trước đây trỏ tới src/model
+    for candidate in (os.path.join(BASE_DIR, "model"), os.path.join(BASE_DIR, "..", "model")):
+        if os.path.isdir(candidate):
+            return os.path.normpath(candidate)
+    return os.path.join(BASE_DIR, "model")
+
+
+# Cấu hình qua biến môi trường
+MODEL_DIR = os.getenv("MODEL_DIR", _default_model_dir())  # chứa 7days/, daily/, hourly/
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "background").lower()     # eager | background | lazy
+MODEL_LOAD_WORKERS = int(os.getenv("MODEL_LOAD_WORKERS", 3))
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", 30))      # giây, 0 = tắt hot-reload
+
+
+def compute_model_fingerprint(base_path):
+    """
+    Tính dấu vân tay ngắn cho các file model trong `base_path` (đường dẫn, kích thước, mtime).
+
+    Returns:
+        str: 12 ký tự hex, đổi mỗi khi có file model được thay/ghi lại.
+    """
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(base_path)):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, base_path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+
+def _load_7days(path):
+    return {
+        "model": load_lstm(path, LSTM_BACKEND),
+        "scaler_x": joblib.load(os.path.join(path, "scaler_x.joblib")),
+        "scaler_y": joblib.load(os.path.join(path, "scaler_y.joblib")),
+    }
+
+
+def _load_daily(path):
+    return {
+        "model": joblib.load(os.path.join(path, "votingC.joblib")),
+        "scaler": joblib.load(os.path.join(path, "scaler.joblib")),
+        "label_encoder": joblib.load(os.path.join(path, "label_encoder.joblib")),
+    }
+
+
+def _load_hourly(path):
+    return {
+        "model": joblib.load(os.path.join(path, "hgbC.joblib")),
+        "scaler": joblib.load(os.path.join(path, "scaler_hourly.joblib")),
+        "label_encoder": joblib.load(os.path.join(path, "label_encoder_hourly.joblib")),
+    }
+
+
+def _validate_7days(bundle):
+    """Chạy thử LSTM trên một cửa sổ toàn 0 và kiểm tra output (1, 7, n) hữu hạn."""
+    scaler_x, scaler_y = bundle["scaler_x"], bundle["scaler_y"]
+    sample = scaler_x.transform(np.zeros((30, scaler_x.n_features_in_)))[np.newaxis]
+    output = np.asarray(bundle["model"].predict(sample, verbose=0))
+    if output.ndim != 3 or output.shape[:2] != (1, 7) or not np.isfinite(output).all():
+        raise ValueError(f"7-day model smoke test failed, output shape={output.shape}")
+    scaler_y.inverse_transform(output.reshape(-1, output.shape[-1]))
+
+
+def _validate_classifier(bundle):
+    """Scale -> predict -> giải mã nhãn trên một dòng toàn 0."""
+    scaler = bundle["scaler"]
+    prepared = scaler.transform(np.zeros((1, scaler.n_features_in_)))
+    bundle["label_encoder"].inverse_transform(bundle["model"].predict(prepared))
+
+
+# Mỗi bundle nằm trong thư mục con cùng tên của MODEL_DIR
+BUNDLE_LOADERS = {
+    "7days": _load_7days,
+    "daily": _load_daily,
+    "hourly": _load_hourly,
+}
+BUNDLE_VALIDATORS = {
+    "7days": _validate_7days,
+    "daily": _validate_classifier,
+    "hourly": _validate_classifier,
+}
+
+
+class ModelSet:
+    """
+    Một phiên bản bộ model (snapshot): các bundle đã load từ `model_dir` tại dấu vân tay `version`.
+
+    Request giữ tham chiếu tới ModelSet lúc bắt đầu, nên khi registry chuyển sang phiên bản mới
+    các request đang chạy vẫn hoàn tất trên phiên bản cũ.
+    """
+
+    def __init__(self, model_dir, version):
+        self.model_dir = model_dir
+        self.version = version
+        self.bundles = {}
+        self.errors = {}
+        self.load_seconds = {}
+        self._locks = {name: threading.Lock() for name in BUNDLE_LOADERS}
+
+    def load_bundle(self, name):
+        """Load bundle `name` (chặn tới khi xong); gọi lại khi đã load thì trả về ngay."""
+        with self._locks[name]:
+            if name in self.bundles:
+                return self.bundles[name]
+            started = time.perf_counter()
+            try:
+                bundle = BUNDLE_LOADERS[name](os.path.join(self.model_dir, name))
+            except Exception as e:
+                self.errors[name] = str(e)
+                raise
+            self.errors.pop(name, None)
+            self.load_seconds[name] = time.perf_counter() - started
+            self.bundles[name] = bundle
+            print(f"✅ Loaded {name} models ({self.version}) in {self.load_seconds[name]:.2f}s")
+            return bundle
+
+    def get(self, name):
+        """Trả về bundle đã load (gọi ensure_models trước khi dự đoán)."""
+        bundle = self.bundles.get(name)
+        if bundle is None:
+            raise RuntimeError(f"Model bundle '{name}' is not loaded")
+        return bundle
+
+    def validate(self):
+        """Chạy thử từng bundle đã load trên đầu vào giả; lỗi thì ném ValueError/Exception."""
+        for name, bundle in self.bundles.items():
+            BUNDLE_VALIDATORS[name](bundle)
+
+    def is_complete(self):
+        return all(name in self.bundles for name in BUNDLE_LOADERS)
+
+
+class ModelRegistry:
+    """
+    Quản lý các phiên bản bộ model (7days, daily, hourly): đường dẫn lấy từ MODEL_DIR,
+    load song song trong thread pool, hoặc load khi được dùng lần đầu (lazy).
+
+    `current` là ModelSet đang phục vụ. `watch()` theo dõi dấu vân tay thư mục model; khi file
+    đổi, phiên bản mới được load nền, chạy thử rồi mới thay `current` (một phép gán, nguyên tử).
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, workers=MODEL_LOAD_WORKERS):
+        self.model_dir = model_dir
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="model-load")
+        self.current = ModelSet(model_dir, self.fingerprint())
+        self.reloads = 0
+        self.last_reload_error = None
+
+    def fingerprint(self):
+        return compute_model_fingerprint(self.model_dir) if os.path.isdir(self.model_dir) else "unloaded"
+
+    @property
+    def version(self):
+        return self.current.version
+
+    @property
+    def bundles(self):
+        return self.current.bundles
+
+    def snapshot(self):
+        """ModelSet hiện tại - request giữ lại để dùng nhất quán tới khi xong."""
+        return self.current
+
+    def load_all(self, names=None, models=None):
+        """Load các bundle song song trong thread pool và chờ tất cả xong."""
+        models = models or self.current
+        futures = [self._executor.submit(models.load_bundle, name) for name in names or BUNDLE_LOADERS]
+        for future in futures:
+            future.result()
+        return models
+
+    async def ensure(self, *names, models=None):
+        """Bản async của load_all: chỉ load các bundle còn thiếu, không chặn event loop."""
+        models = models or self.current
+        missing = [name for name in names or BUNDLE_LOADERS if name not in models.bundles]
+        if missing:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self._executor, models.load_bundle, name)
+                                   for name in missing))
+        return models
+
+    def reload(self, version=None):
+        """
+        Load phiên bản mới (nếu thư mục model đã đổi), kiểm tra rồi thay `current`.
+
+        Chỉ load lại các bundle phiên bản hiện tại đang dùng (lazy mode: phần còn lại load khi cần).
+
+        Returns:
+            bool: True nếu đã chuyển sang phiên bản mới.
+        """
+        version = version or self.fingerprint()
+        old = self.current
+        if version == old.version:
+            return False
+
+        names = [name for name in BUNDLE_LOADERS if name in old.bundles] or None
+        if MODEL_LOAD_MODE == "lazy" and names is None:
+            # Chưa có request nào dùng model: chỉ cần đổi phiên bản
+            self.current = ModelSet(self.model_dir, version)
+            return True
+
+        candidate = ModelSet(self.model_dir, version)
+        self.load_all(names, models=candidate)
+        candidate.validate()
+
+        self.current = candidate
+        self.reloads += 1
+        print(f"🔄 Models switched {old.version} -> {version}")
+        return True
+
+    async def watch(self, interval=MODEL_WATCH_INTERVAL):
+        """
+        Vòng lặp nền: kiểm tra thư mục model mỗi `interval` giây và hot-reload khi có thay đổi.
+
+        Chỉ reload khi dấu vân tay giữ nguyên qua 2 lần kiểm tra liên tiếp (tránh đọc file đang ghi dở).
+        Lỗi khi load/kiểm tra phiên bản mới được ghi lại, phiên bản cũ tiếp tục phục vụ.
+        """
+        loop = asyncio.get_running_loop()
+        last_seen = self.current.version
+        failed = None
+        while True:
+            await asyncio.sleep(interval)
+            version = await loop.run_in_executor(self._executor, self.fingerprint)
+            stable = version == last_seen
+            last_seen = version
+            # Không thử lại phiên bản đã lỗi cho tới khi file đổi tiếp
+            if version in (self.current.version, failed) or not stable:
+                continue
+            try:
+                # Thread riêng: reload chờ các load_bundle chạy trên self._executor, chạy reload
+                # ngay trong pool đó sẽ chiếm một worker (deadlock khi MODEL_LOAD_WORKERS=1)
+                await asyncio.to_thread(self.reload, version)
+                self.last_reload_error = None
+            except Exception as e:
+                failed = version
+                self.last_reload_error = f"{version}: {e}"
+                print(f"❌ Model reload failed, keeping {self.current.version}: {e}")
+
+    def is_ready(self):
+        return self.current.is_complete()
+
+    def status(self):
+        current = self.current
+        return {
+            "model_dir": self.model_dir,
+            "version": current.version,
+            "load_mode": MODEL_LOAD_MODE,
+            "reloads": self.reloads,
+            "last_reload_error": self.last_reload_error,
+            "bundles": {
+                name: {
+                    "loaded": name in current.bundles,
+                    "load_seconds": current.load_seconds.get(name),
+                    "error": current.errors.get(name),
+                }
+                for name in BUNDLE_LOADERS
+            },
+        }
+
+
+registry = ModelRegistry()
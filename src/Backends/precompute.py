@@ -0,0 +1,167 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from crawl import get_coordinates
+from data_sources import data_source
+from forecast_cache import forecast_cache, make_key, current_hour_bucket, seconds_until_next_hour, TZ_VN
+from geocode_cache import load_province_seeds
+
+load_dotenv()
+
+# Cấu hình qua biến môi trường
+PRECOMPUTE_LOCATIONS = os.getenv("PRECOMPUTE_LOCATIONS", "")            # "provinces" | "Hà Nội,Huế,..." | "" (tắt)
+PRECOMPUTE_BATCH_SIZE = int(os.getenv("PRECOMPUTE_BATCH_SIZE", 21))     # số địa điểm mỗi batch (fetch + inference)
+PRECOMPUTE_STAGGER = float(os.getenv("PRECOMPUTE_STAGGER", 60))         # giây: rải thời điểm bắt đầu các batch
+PRECOMPUTE_DELAY = float(os.getenv("PRECOMPUTE_DELAY", 5))              # giây sau đầu giờ mới bắt đầu làm mới
+
+
+class ForecastPrecomputer:
+    """
+    Tính sẵn /api/predict/all cho một danh sách địa điểm cố định (mặc định: 63 tỉnh) vào forecast_cache,
+    mỗi khi sang giờ mới (GMT+7) - cùng khóa cache với request thường nên request cho các địa điểm này
+    chỉ còn là một lần đọc cache.
+
+    Các địa điểm được chia thành batch PRECOMPUTE_BATCH_SIZE điểm (một request Open-Meteo nhiều tọa độ
+    + một lần suy luận cho cả batch); các batch bắt đầu lệch nhau trong khoảng PRECOMPUTE_STAGGER giây
+    để không dồn tải lên upstream và executor cùng một lúc.
+
+    Args:
+        compute_batch: async (coords) -> (model_version, [body /api/predict/all hoặc {"error"} theo thứ tự coords]).
+        cache (ForecastCache): Cache đích.
+        locations (str): "provinces" hoặc danh sách tên thành phố cách nhau bởi dấu phẩy; rỗng = tắt.
+    """
+
+    def __init__(self, compute_batch, cache=forecast_cache, locations=PRECOMPUTE_LOCATIONS,
+                 batch_size=PRECOMPUTE_BATCH_SIZE, stagger=PRECOMPUTE_STAGGER, delay=PRECOMPUTE_DELAY):
+        self.compute_batch = compute_batch
+        self.cache = cache
+        self.locations = (locations or "").strip()
+        self.batch_size = max(batch_size, 1)
+        self.stagger = stagger
+        self.delay = delay
+        self._status = {}       # {địa điểm: {"lat", "lon", "last_refresh", "error"}}
+        self._last_run = None
+        self._next_run_at = None
+
+    @property
+    def enabled(self):
+        return bool(self.locations)
+
+    async def resolve_locations(self):
+        """[(tên, {"lat", "lon"})] của các địa điểm cần tính sẵn (bỏ qua tên không tra được tọa độ)."""
+        if self.locations.lower() == "provinces":
+            return list(load_province_seeds().items())
+
+        names = [name.strip() for name in self.locations.split(",") if name.strip()]
+        coords = await asyncio.gather(*(get_coordinates(name) for name in names), return_exceptions=True)
+        resolved = []
+        for name, coord in zip(names, coords):
+            if isinstance(coord, Exception):
+                self._status.setdefault(name, {"lat": None, "lon": None, "last_refresh": None})["error"] = str(coord)
+            else:
+                resolved.append((name, coord))
+        return resolved
+
+    async def refresh(self):
+        """Một lượt làm mới toàn bộ danh sách, các batch bắt đầu lệch nhau trong khoảng `stagger` giây."""
+        started = time.time()
+        locations = await self.resolve_locations()
+        batches = [locations[i: i + self.batch_size] for i in range(0, len(locations), self.batch_size)]
+
+        async def run_batch(index, batch):
+            await asyncio.sleep(self.stagger * index / len(batches))
+            return await self._refresh_batch(batch)
+
+        refreshed = await asyncio.gather(*(run_batch(i, batch) for i, batch in enumerate(batches)))
+        self._last_run = {
+            "started_at": datetime.fromtimestamp(started, TZ_VN).isoformat(timespec="seconds"),
+            "duration_seconds": round(time.time() - started, 2),
+            "refreshed": sum(refreshed),
+            "failed": len(locations) - sum(refreshed),
+        }
+        print(f"🔄 Precomputed forecasts for {sum(refreshed)}/{len(locations)} locations "
+              f"in {self._last_run['duration_seconds']}s")
+
+    async def _refresh_batch(self, batch):
+        hour_bucket = current_hour_bucket()
+        try:
+            model_version, results = await self.compute_batch([coord for _, coord in batch])
+        except Exception as e:
+            print(f"❌ Precompute batch of {len(batch)} locations failed: {e}")
+            for name, coord in batch:
+                self._entry(name, coord)["error"] = str(e)
+            return 0
+
+        if current_hour_bucket() != hour_bucket:
+            # Đã sang giờ mới trong lúc tính: dữ liệu thuộc giờ cũ, để lượt sau làm mới
+            return 0
+
+        source = data_source().name
+        refreshed = 0
+        for (name, coord), result in zip(batch, results):
+            entry = self._entry(name, coord)
+            if "error" in result:
+                entry["error"] = result["error"]
+                continue
+            key = make_key("all", coord, model_version, hour_bucket, source=source)
+            await self.cache.set(key, {"city": name, **result, "model_version": model_version})
+            entry.update(last_refresh=time.time(), error=None)
+            refreshed += 1
+        return refreshed
+
+    def _entry(self, name, coord):
+        entry = self._status.setdefault(name, {"last_refresh": None, "error": None})
+        entry.update(lat=coord["lat"], lon=coord["lon"])
+        return entry
+
+    async def run(self):
+        """Làm mới ngay khi khởi động, sau đó mỗi đầu giờ (GMT+7) + `delay` giây."""
+        if self.cache.backend is None:
+            print("⚠️ Forecast precompute is enabled but FORECAST_CACHE_BACKEND=none - nothing will be cached")
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"❌ Forecast precompute failed: {e}")
+            wait = seconds_until_next_hour() + self.delay
+            self._next_run_at = time.time() + wait
+            await asyncio.sleep(wait)
+
+    def ages(self):
+        """{địa điểm: số giây từ lần làm mới thành công gần nhất} (bỏ qua địa điểm chưa làm mới lần nào)."""
+        now = time.time()
+        return {name: now - entry["last_refresh"] for name, entry in self._status.items()
+                if entry.get("last_refresh") is not None}
+
+    def status(self):
+        now = time.time()
+        locations = {
+            name: {
+                "lat": entry.get("lat"),
+                "lon": entry.get("lon"),
+                "last_refresh": (datetime.fromtimestamp(entry["last_refresh"], TZ_VN).isoformat(timespec="seconds")
+                                 if entry.get("last_refresh") else None),
+                "age_seconds": round(now - entry["last_refresh"], 1) if entry.get("last_refresh") else None,
+                "error": entry.get("error"),
+            }
+            for name, entry in sorted(self._status.items())
+        }
+        return {
+            "enabled": self.enabled,
+            "locations": self.locations,
+            "last_run": self._last_run,
+            "next_run_in_seconds": round(self._next_run_at - now, 1) if self._next_run_at else None,
+            "by_location": locations,
+        }
+
+
+if __name__ == "__main__":
+    # Worker riêng (VD: cùng FORECAST_CACHE_BACKEND=redis với các worker API):
+    #   PRECOMPUTE_LOCATIONS=provinces python precompute.py
+    from main import precompute_batch
+
+    asyncio.run(ForecastPrecomputer(precompute_batch, locations=PRECOMPUTE_LOCATIONS or "provinces").run())
@@ -1,47 +1,87 @@
 
-import joblib
-from keras.models import load_model
+import contextvars
 
 import pandas as pd
 
 import numpy as np
 
+from model_registry import registry
+from timing import stage, timed
 from crawl import (
     get_weather_data_daily, get_weather_data_24hour, get_weather_data_30, get_coordinates, 
     process_daily_weather_data, process_hourly_weather_data, process_30day_weather_data)
 # ===== MODEL LOADING ===== done
-def load_models():
+# Dấu vân tay của bộ model đang dùng (đổi khi file model đổi) - dùng làm khóa cache forecast
+model_version = registry.version
+
+
+def _publish_models():
+    """Gán các model đã load trong registry vào biến toàn cục của module (giữ API cũ)."""
     global predaily_model, scaler_daily, labele_encoder_daily
     global pre7day_model, scaler_x, scaler_y
     global prehourly_model_hgbC, scaler_hourly, labele_encoder_hourly
-    #global prehourly_model_deep
-    
+    global model_version
+
+    bundles = registry.bundles
+    if "7days" in bundles:
+        pre7day_model = bundles["7days"]["model"]
+        scaler_x = bundles["7days"]["scaler_x"]
+        scaler_y = bundles["7days"]["scaler_y"]
+    if "daily" in bundles:
+        predaily_model = bundles["daily"]["model"]
+        scaler_daily = bundles["daily"]["scaler"]
+        labele_encoder_daily = bundles["daily"]["label_encoder"]
+    if "hourly" in bundles:
+        prehourly_model_hgbC = bundles["hourly"]["model"]
+        scaler_hourly = bundles["hourly"]["scaler"]
+        labele_encoder_hourly = bundles["hourly"]["label_encoder"]
+    model_version = registry.version
 
-    base_path = 'D:\\jetbrain\\project\\Agri-Weather\\src\\model'
 
+def load_models():
+    """Load cả 3 bộ model (7days, daily, hourly) song song từ MODEL_DIR."""
     try:
-        # Load 7-day prediction model
-        pre7day_model = load_model(f'{base_path}\\7days\\7day_model.keras')
-        scaler_x = joblib.load(f'{base_path}\\7days\\scaler_x.joblib')
-        scaler_y = joblib.load(f'{base_path}\\7days\\scaler_y.joblib')
-
-        # Load daily prediction model
-        predaily_model = joblib.load(f'{base_path}\\daily\\votingC.joblib')
-        scaler_daily = joblib.load(f'{base_path}\\daily\\scaler.joblib')
-        labele_encoder_daily = joblib.load(f'{base_path}\\daily\\label_encoder.joblib')
-
-        # Load hourly prediction models
-        prehourly_model_hgbC = joblib.load(f'{base_path}\\hourly\\hgbC.joblib')
-        #prehourly_model_deep = load_model(f'{base_path}\\hourly\\deep.keras')
-        scaler_hourly = joblib.load(f'{base_path}\\hourly\\scaler_hourly.joblib')
-        labele_encoder_hourly = joblib.load(f'{base_path}\\hourly\\label_encoder_hourly.joblib')
-
-        print("✅ All models loaded successfully!")
+        registry.load_all()
+        _publish_models()
+
+        print(f"✅ All models loaded successfully! (version {model_version})")
         return True
 
     except Exception as e:
         print(f"❌ Error loading models: {str(e)}")
         raise
+
+
+# Bộ model (ModelSet) mà request hiện tại đang dùng - cố định suốt request kể cả khi hot-reload
+_active_models = contextvars.ContextVar("active_models", default=None)
+
+
+def use_models(models):
+    """Gắn ModelSet `models` cho context hiện tại: mọi hàm dự đoán sau đó dùng đúng phiên bản này."""
+    _active_models.set(models)
+
+
+def active_models():
+    return _active_models.get() or registry.current
+
+
+def _bundle(name):
+    return active_models().get(name)
+
+
+async def ensure_models(*names):
+    """
+    Đảm bảo các bundle `names` (mặc định: tất cả) của bộ model đang dùng đã được load.
+    Với MODEL_LOAD_MODE=lazy, model được load ở lần dùng đầu tiên (trong thread pool).
+
+    Returns:
+        ModelSet: Bộ model đang dùng (để lấy bundle qua `.get(name)`).
+    """
+    models = await registry.ensure(*names, models=active_models())
+    _publish_models()
+    return models
+
+
 # process input
 # Định nghĩa lại SEQ_FEATURES (phải khớp với SEQ_FEATURES đã dùng để train model)
 # FEATURES cho model 7day
@@ -94,6 +134,22 @@ def process_input_7days(df_input_7days, scaler_x, input_window=30):
         ValueError: Nếu DataFrame đầu vào không chứa đúng số hàng hoặc thiếu các cột cần thiết.
     """
 
+    processed_df = _seq_features_frame(df_input_7days, input_window)
+
+    # Chuẩn hóa các đặc trưng
+    scaled_data = scaler_x.transform(processed_df)
+
+    # Thay đổi hình dạng cho mô hình LSTM: (1, input_window, num_features)
+    model_input = scaled_data.reshape(1, input_window, len(SEQ_FEATURES))
+
+    return model_input
+
+
+def _seq_features_frame(df_input_7days, input_window=30):
+    """
+    Kiểm tra và tạo các đặc trưng SEQ_FEATURES (chưa chuẩn hóa) cho `input_window` ngày,
+    đã sắp xếp theo thời gian.
+    """
     if len(df_input_7days) != input_window:
         raise ValueError(f"DataFrame đầu vào phải chứa chính xác {input_window} hàng (ngày). Đã nhận {len(df_input_7days)}.")
 
@@ -118,17 +174,20 @@ def process_input_7days(df_input_7days, scaler_x, input_window=30):
     if missing_features:
         raise ValueError(f"DataFrame đầu vào thiếu các đặc trưng sau: {missing_features}")
 
-    processed_df = df_input_7days[SEQ_FEATURES]
+    return df_input_7days[SEQ_FEATURES]
 
-    # Chuẩn hóa các đặc trưng
-    scaled_data = scaler_x.transform(processed_df)
+def process_input_hourly(df_input_hourly):
+    processed_hourly = hourly_feature_frame(df_input_hourly)
 
-    # Thay đổi hình dạng cho mô hình LSTM: (1, input_window, num_features)
-    model_input = scaled_data.reshape(1, input_window, len(SEQ_FEATURES))
+    # Apply the same scaling used during training
+    scaled_data = _bundle("hourly")["scaler"].transform(processed_hourly)
+    scaled_hourly_df = pd.DataFrame(scaled_data, columns=hourly_features)
 
-    return model_input
+    return scaled_hourly_df
 
-def process_input_hourly(df_input_hourly):
+
+def hourly_feature_frame(df_input_hourly):
+    """Tạo các đặc trưng `hourly_features` (chưa chuẩn hóa) từ dữ liệu theo giờ."""
     # Ensure 'time' column is datetime
     df_input_hourly['time'] = pd.to_datetime(df_input_hourly['time'], errors='coerce')
 
@@ -143,13 +202,7 @@ def process_input_hourly(df_input_hourly):
     df_input_hourly['cos_doy'] = np.cos(2 * np.pi * df_input_hourly['dayofyear'] / 365)
 
     # Select only the features used for training
-    processed_hourly = df_input_hourly[hourly_features]
-
-    # Apply the same scaling used during training
-    scaled_data = scaler_hourly.transform(processed_hourly)
-    scaled_hourly_df = pd.DataFrame(scaled_data, columns=hourly_features)
-
-    return scaled_hourly_df
+    return df_input_hourly[hourly_features]
 
 def process_input_daily(df_input_daily):
     """
@@ -163,6 +216,17 @@ def process_input_daily(df_input_daily):
     Returns:
         pd.DataFrame: DataFrame đã được chuẩn hóa, sẵn sàng để dự đoán.
     """
+    df_processed = daily_feature_frame(df_input_daily)
+
+    # Áp dụng StandardScaler
+    scaled_data_daily = _bundle("daily")["scaler"].transform(df_processed)
+    df_scaled_daily = pd.DataFrame(scaled_data_daily, columns=daily_features)
+
+    return df_scaled_daily
+
+
+def daily_feature_frame(df_input_daily):
+    """Tạo các đặc trưng `daily_features` (chưa chuẩn hóa) từ dữ liệu theo ngày."""
     processed_daily = df_input_daily.copy()
 
     # Chuyển đổi cột 'date' sang định dạng datetime và tạo các đặc trưng thời gian
@@ -175,13 +239,7 @@ def process_input_daily(df_input_daily):
     df_processed = processed_daily.drop(columns=['time', 'dayofyear'], errors='ignore')
 
     # Đảm bảo các cột theo đúng thứ tự đã huấn luyện và chỉ chọn các đặc trưng đã sử dụng
-    df_processed = df_processed[daily_features]
-
-    # Áp dụng StandardScaler
-    scaled_data_daily = scaler_daily.transform(df_processed)
-    df_scaled_daily = pd.DataFrame(scaled_data_daily, columns=daily_features)
-
-    return df_scaled_daily
+    return df_processed[daily_features]
 
 def predict_weather_7days(
     input_history_df: pd.DataFrame,
@@ -205,6 +263,81 @@ def predict_weather_7days(
         pd.DataFrame: DataFrame dự đoán 7 ngày tiếp theo (có cột time).
     """
 
+    df = _validate_history(input_history_df, input_window)
+
+    # ===============================
+    # 3. Tiền xử lý cho mô hình
+    # ===============================
+    model_input = process_input_7days(
+        df,
+        scaler_x,
+        input_window=input_window
+    )
+
+    # ===============================
+    # 4. Predict (scaled)
+    # ===============================
+    with stage("model.7days"):
+        scaled_predictions = model.predict(model_input, verbose=0)
+
+    # ===============================
+    # 5. Inverse scale kết quả
+    # ===============================
+    unscaled_predictions = _inverse_scale_predictions(scaled_predictions, scaler_y)
+
+    # ===============================
+    # 6-7. Tạo DataFrame kết quả cho 7 ngày tiếp theo
+    # ===============================
+    return _predictions_frame(unscaled_predictions[0], df['time'].max())
+
+
+@timed("predict.7days")
+async def predict_weather_7days_window_async(window, scaler_x, scaler_y, model, batcher):
+    """
+    Như `predict_weather_7days`, nhưng từ RollingWindow (rolling_window) thay vì DataFrame 30 ngày
+    (cửa sổ giữ sẵn các dòng đã chuẩn hóa, chỉ ngày mới / đổi mới phải transform lại), và forward
+    pass đi qua MicroBatcher (inference_scheduler): các request đồng thời được gom thành một lần
+    model.predict thay vì batch size 1 mỗi request.
+
+    Args:
+        model: Mô hình LSTM (của phiên bản model mà request đang dùng).
+        batcher (MicroBatcher): Scheduler gom batch cho LSTM 7 ngày.
+
+    Returns:
+        pd.DataFrame: DataFrame dự đoán 7 ngày tiếp theo (có cột time).
+    """
+    model_input = window.model_input(scaler_x)
+    scaled_prediction = await batcher.submit(model_input[0], model)
+    unscaled_predictions = _inverse_scale_predictions(scaled_prediction[np.newaxis], scaler_y)
+
+    return _predictions_frame(unscaled_predictions[0], window.last_time())
+
+
+def predict_weather_7days_inputs(model_inputs, last_dates, scaler_y, model):
+    """
+    Bản batch của `predict_weather_7days_window_async`: MỘT forward pass LSTM cho các input
+    đã chuẩn hóa (RollingWindow.model_input) của nhiều địa điểm.
+
+    Args:
+        model_inputs (list): Các mảng (1, input_window, len(SEQ_FEATURES)).
+        last_dates (list): Ngày cuối của từng cửa sổ (pd.Timestamp).
+
+    Returns:
+        list: Danh sách DataFrame dự đoán 7 ngày, cùng thứ tự với `model_inputs`.
+    """
+    if not model_inputs:
+        return []
+
+    with stage("model.7days"):
+        scaled_predictions = model.predict(np.concatenate(model_inputs), verbose=0)
+    unscaled_predictions = _inverse_scale_predictions(scaled_predictions, scaler_y)
+
+    return [_predictions_frame(unscaled_predictions[i], last_date) for i, last_date in enumerate(last_dates)]
+
+
+def _validate_history(input_history_df, input_window):
+    """Copy, kiểm tra số ngày và ép kiểu cột 'time' của dữ liệu lịch sử."""
+
     # ===============================
     # 0. Copy & validate dữ liệu
     # ===============================
@@ -234,49 +367,31 @@ def predict_weather_7days(
         raise ValueError("Cột 'time' có giá trị không hợp lệ (NaT)")
 
     # Sắp xếp lại theo thời gian cho chắc chắn
-    df = df.sort_values('time').reset_index(drop=True)
-
-    # ===============================
-    # 3. Tiền xử lý cho mô hình
-    # ===============================
-    model_input = process_input_7days(
-        df,
-        scaler_x,
-        input_window=input_window
-    )
+    return df.sort_values('time').reset_index(drop=True)
 
-    # ===============================
-    # 4. Predict (scaled)
-    # ===============================
-    scaled_predictions = model.predict(model_input, verbose=0)
 
+def _inverse_scale_predictions(scaled_predictions, scaler_y):
+    """Kiểm tra output (N, 7, len(Y_FEATURES)) của LSTM và đưa về thang đo gốc."""
     if scaled_predictions.ndim != 3:
         raise ValueError(
             f"Output model không hợp lệ, shape={scaled_predictions.shape}"
         )
 
-    # ===============================
-    # 5. Inverse scale kết quả
-    # ===============================
-    unscaled_predictions = scaler_y.inverse_transform(
+    return scaler_y.inverse_transform(
         scaled_predictions.reshape(-1, scaled_predictions.shape[-1])
     ).reshape(scaled_predictions.shape)
 
-    # ===============================
-    # 6. Tạo mốc thời gian cho 7 ngày tiếp theo
-    # ===============================
-    last_date = df['time'].max()
+
+def _predictions_frame(unscaled_prediction, last_date):
+    """Tạo DataFrame 7 ngày (cột 'time' + Y_FEATURES) bắt đầu từ ngày sau `last_date`."""
     prediction_dates = pd.date_range(
         start=last_date + pd.Timedelta(days=1),
         periods=7,
         freq='D'
     )
 
-    # ===============================
-    # 7. Tạo DataFrame kết quả
-    # ===============================
     predictions_df = pd.DataFrame(
-        unscaled_predictions[0],
+        unscaled_prediction,
         columns=Y_FEATURES
     )
 
@@ -284,12 +399,15 @@ def predict_weather_7days(
 
     return predictions_df
 
+
 def predict_weather_hourly(prepared_data_hourly):
+    hourly = _bundle("hourly")
+
     # Make predictions
-    predictions_hourly_encoded = prehourly_model_hgbC.predict(prepared_data_hourly)
+    predictions_hourly_encoded = hourly["model"].predict(prepared_data_hourly)
 
     # Inverse transform the predictions to get original weather codes
-    predictions_hourly = labele_encoder_hourly.inverse_transform(predictions_hourly_encoded)
+    predictions_hourly = hourly["label_encoder"].inverse_transform(predictions_hourly_encoded)
 
     return predictions_hourly
 
@@ -304,11 +422,53 @@ def predict_weather_daily(prepared_data_daily):
     Returns:
         list: Danh sách các mã thời tiết dự đoán (giá trị gốc trước khi mã hóa).
     """
-    predictions_encoded_daily = predaily_model.predict(prepared_data_daily)
-    predictions_daily = labele_encoder_daily.inverse_transform(predictions_encoded_daily)
+    daily = _bundle("daily")
+    predictions_encoded_daily = daily["model"].predict(prepared_data_daily)
+    predictions_daily = daily["label_encoder"].inverse_transform(predictions_encoded_daily)
     return predictions_daily.tolist()
 
 
+def _split_by_lengths(values, frames):
+    """Chia mảng kết quả của khung đã nối (pd.concat) về lại từng DataFrame gốc."""
+    offsets = np.cumsum([len(df) for df in frames])[:-1]
+    return [list(part) for part in np.split(np.asarray(values), offsets)]
+
+
+def classify_features(bundle, features):
+    """
+    Chuẩn hóa -> predict -> giải mã nhãn cho bundle phân loại (daily/hourly) trên các đặc trưng
+    chưa chuẩn hóa. Chạy được cả trong process con (inference_executor) lẫn tiến trình chính.
+
+    Returns:
+        np.ndarray: Mã WMO tương ứng từng dòng của `features`.
+    """
+    scaled = pd.DataFrame(bundle["scaler"].transform(features), columns=features.columns)
+    return np.asarray(bundle["label_encoder"].inverse_transform(bundle["model"].predict(scaled)))
+
+
+async def predict_weather_codes_async(name, dfs, executor):
+    """
+    Dự đoán mã thời tiết bằng model `name` ('hourly' hoặc 'daily') cho nhiều DataFrame cùng lúc:
+    một lần tạo đặc trưng, một lần scale + predict, chạy trong InferenceExecutor để không chặn
+    event loop.
+
+    Args:
+        name (str): 'hourly' hoặc 'daily'.
+        dfs (list): Danh sách DataFrame (VD: 24 giờ của từng địa điểm, hay khung 7 ngày dự đoán).
+        executor (InferenceExecutor): Executor thực thi suy luận (thread/process pool).
+
+    Returns:
+        list: Danh sách list mã WMO (int) cho từng DataFrame, cùng thứ tự với `dfs`.
+    """
+    if not dfs:
+        return []
+    feature_frame = hourly_feature_frame if name == "hourly" else daily_feature_frame
+    features = feature_frame(pd.concat(dfs, ignore_index=True))
+    with stage(f"predict.{name}"):
+        codes = await executor.classify(name, active_models(), features)
+    return [[int(code) for code in part] for part in _split_by_lengths(codes, dfs)]
+
+
 def decode_wmo_code(code):
     """
     Chuyển đổi mã WMO weather code thành mô tả thời tiết bằng tiếng Anh.
@@ -368,6 +528,11 @@ def decode_wmo_code_batch(codes):
 
 if __name__ == "__main__":
     import sys
+    import asyncio
+    from http_client import close_client
+
+    # Các hàm crawl là async -> chạy chúng trên một event loop riêng cho script
+    loop = asyncio.new_event_loop()
 
     # Load models first
     print("Loading models...")
@@ -382,14 +547,14 @@ if __name__ == "__main__":
     try:
         # Step 1: Get coordinates
         print(f"\n🌍 Getting coordinates for {city}...")
-        coord = get_coordinates(city)
+        coord = loop.run_until_complete(get_coordinates(city))
         lat = coord["lat"]
         lon = coord["lon"]
         print(f"    ✓ Latitude: {lat}, Longitude: {lon}")
 
         # Step 2: Crawl weather data (30 days)
         print(f"\n📡 Fetching 30-day weather data...")
-        weather_30d = get_weather_data_30(city)
+        weather_30d = loop.run_until_complete(get_weather_data_30(city))
         print("✅ Weather data fetched successfully")
 
         # Step 3: Process to CSV/DataFrame
@@ -423,7 +588,7 @@ if __name__ == "__main__":
         print(f"\n💾 Results saved to {output_file}")
         # ==================== HOURLY PREDICTION ====================
         print(f"\n📡 Fetching 24-hour weather data...")
-        weather_24h = get_weather_data_24hour(city)
+        weather_24h = loop.run_until_complete(get_weather_data_24hour(city))
         print("✅ 24-hour weather data fetched successfully")
 
         # Process hourly data
@@ -458,7 +623,7 @@ if __name__ == "__main__":
 
         # ==================== DAILY WEATHER CODE PREDICTION ====================
         print(f"\n📡 Fetching daily weather data...")
-        weather_daily = get_weather_data_daily(city)
+        weather_daily = loop.run_until_complete(get_weather_data_daily(city))
         print("✅ Daily weather data fetched successfully")
 
     # Process daily data
@@ -493,4 +658,7 @@ if __name__ == "__main__":
 
     except Exception as e:
         print(f"\n❌ Error: {str(e)}")
-        
\ No newline at end of file
+
+    finally:
+        loop.run_until_complete(close_client())
+        loop.close()
@@ -0,0 +1,339 @@
+import json
+import os
+import re
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Cấu hình qua biến môi trường
+CHAT_CONTEXT_MODE = os.getenv("CHAT_CONTEXT_MODE", "compact")          # "compact" | "full" (JSON gốc như trước)
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", 1200))      # ngân sách token cho context thời tiết + kế hoạch
+
+# tiktoken là tùy chọn: có thì đếm token chính xác hơn, không thì ước lượng bằng regex
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+# Số, từ chữ cái, ký tự đặc biệt. Từ có dấu tiếng Việt thường bị BPE tách thành ~2 token
+_TOKEN_RE = re.compile(r"\d{1,3}|[^\W\d_]+|[^\w\s]")
+
+# Nhóm trường thời tiết: (từ khóa trong câu hỏi, {trường: (nhãn cột, số chữ số thập phân)})
+FIELD_GROUPS = {
+    "temp": ((), {
+        "temperature_2m": ("T°C", 0),
+        "temperature_2m_min": ("Tmin", 0),
+        "temperature_2m_max": ("Tmax", 0),
+    }),
+    "rain": ((), {
+        "precipitation": ("mưa_mm", 1),
+        "precipitation_sum": ("mưa_mm", 1),
+    }),
+    "humidity": ((), {
+        "relative_humidity_2m": ("ẩm%", 0),
+        "relative_humidity_2m_mean": ("ẩm%", 0),
+    }),
+    "feels": (("cảm giác", "cảm thấy", "oi", "feel", "apparent"), {
+        "apparent_temperature": ("cảm_giác°C", 0),
+        "apparent_temperature_min": ("cảm_giác_min", 0),
+        "apparent_temperature_max": ("cảm_giác_max", 0),
+    }),
+    "dew": (("sương", "dew", "nấm", "bệnh"), {
+        "dew_point_2m": ("điểm_sương", 0),
+        "dew_point_2m_mean": ("điểm_sương", 0),
+    }),
+    "wind": (("gió", "bão", "phun", "wind", "storm"), {
+        "wind_speed_10m": ("gió_kmh", 0),
+        "wind_speed_10m_mean": ("gió_kmh", 0),
+        "wind_speed_10m_max": ("gió_max", 0),
+        "wind_gusts_10m": ("giật_kmh", 0),
+        "wind_gusts_10m_mean": ("giật_kmh", 0),
+        "wind_direction_10m": ("hướng°", 0),
+        "winddirection_10m_dominant": ("hướng°", 0),
+    }),
+    "cloud": (("mây", "nắng", "phơi", "cloud", "sun"), {
+        "cloud_cover": ("mây%", 0),
+        "cloud_cover_mean": ("mây%", 0),
+        "sunshine_duration": ("nắng_h", 1),
+        "daylight_duration": ("ngày_h", 1),
+    }),
+    "pressure": (("áp suất", "khí áp", "bão", "pressure"), {
+        "surface_pressure": ("áp_hPa", 0),
+        "surface_pressure_mean": ("áp_hPa", 0),
+        "pressure_msl": ("áp_msl", 0),
+        "pressure_msl_mean": ("áp_msl", 0),
+    }),
+}
+CORE_GROUPS = ("temp", "rain", "humidity")
+_DURATION_FIELDS = ("sunshine_duration", "daylight_duration")   # giây -> giờ
+
+# Cách gộp dữ liệu theo giờ trong một khối: mưa cộng dồn, gió lấy max, còn lại trung bình
+_HOURLY_SUM = ("precipitation",)
+_HOURLY_MAX = ("wind_speed_10m", "wind_gusts_10m")
+
+# Trường kế hoạch nông vụ giữ lại (các trường id / thời điểm tạo bị bỏ)
+PLAN_FIELDS = {
+    "crop_name": "Cây trồng",
+    "farm_location": "Địa điểm",
+    "season_goal": "Mùa vụ/mục tiêu",
+    "notes": "Ghi chú",
+}
+_DROPPED_KEY_RE = re.compile(r"(^|_)(id|created_at|updated_at)$")
+
+# Mức nén tăng dần cho tới khi vừa ngân sách:
+# (nhóm trường: "relevant" | "core" | "minimal", số giờ mỗi khối hourly (0 = chỉ dòng tóm tắt),
+#  số ký tự tối đa của chi tiết công việc (0 = bỏ), giữ các khóa lạ?)
+LEVELS = (
+    ("relevant", 3, 160, True),
+    ("relevant", 6, 80, True),
+    ("core", 0, 0, False),
+    ("minimal", 0, 0, False),
+)
+
+
+def estimate_tokens(text):
+    """Ước lượng số token của `text` (tiktoken nếu có, ngược lại regex - sai số khoảng 20%)."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return sum(1 if piece.isascii() else 2 for piece in _TOKEN_RE.findall(text))
+
+
+def relevant_groups(question):
+    """Các nhóm trường cần cho câu hỏi: nhóm cốt lõi + nhóm có từ khóa xuất hiện trong câu hỏi."""
+    question = (question or "").lower()
+    groups = list(CORE_GROUPS)
+    for name, (keywords, _) in FIELD_GROUPS.items():
+        if name not in groups and any(keyword in question for keyword in keywords):
+            groups.append(name)
+    return groups
+
+
+def _columns(groups, available):
+    """[(trường, nhãn, số thập phân)] của `groups` có trong `available`."""
+    columns = []
+    for group in groups:
+        for field, (label, decimals) in FIELD_GROUPS[group][1].items():
+            if field in available:
+                columns.append((field, label, decimals))
+    return columns
+
+
+def _fmt(value, decimals=0, field=None):
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return "" if value is None else str(value)
+    if field in _DURATION_FIELDS:
+        value = value / 3600
+    value = round(float(value), decimals)
+    return f"{value:.{decimals}f}" if decimals else str(int(value))
+
+
+def _compact_json(value):
+    """JSON một dòng, số thực làm tròn 1 chữ số - dùng cho các khóa không biết cấu trúc."""
+    def rounded(v):
+        if isinstance(v, float):
+            return round(v, 1)
+        if isinstance(v, dict):
+            return {k: rounded(x) for k, x in v.items()}
+        if isinstance(v, list):
+            return [rounded(x) for x in v]
+        return v
+    return json.dumps(rounded(value), ensure_ascii=False, separators=(",", ":"))
+
+
+def _table(header, rows):
+    return "\n".join("|".join(row) for row in [header] + rows)
+
+
+def _weather_label(records):
+    """Mô tả thời tiết 'nặng' nhất (weather_code lớn nhất) trong các record."""
+    worst = max(records, key=lambda r: r.get("weather_code") or 0)
+    return worst.get("weather_description") or str(worst.get("weather_code", ""))
+
+
+def _today_text(today, groups):
+    raw = today.get("raw_data") or {}
+    parts = [f"{label} {_fmt(raw[field], decimals, field)}" for field, label, decimals in _columns(groups, raw)]
+    return f"today_forecast {today.get('time', '')}: " + " | ".join(
+        [today.get("weather_description", "")] + parts)
+
+
+def _numbers(raws, field):
+    """Các giá trị số của `field` (bỏ qua record thiếu trường hoặc giá trị None)."""
+    return [raw[field] for raw in raws if isinstance(raw.get(field), (int, float))]
+
+
+def _hourly_text(hourly, groups, block_hours):
+    records = [r for r in hourly if isinstance(r, dict)]
+    raws = [r.get("raw_data") or {} for r in records]
+    if not records:
+        return ""
+
+    temps = _numbers(raws, "temperature_2m")
+    rain = [raw["precipitation"] if isinstance(raw.get("precipitation"), (int, float)) else 0 for raw in raws]
+    rainy = [i for i, value in enumerate(rain) if value > 0]
+    summary = [f"hourly_forecast {_hour_range(records[0], records[-1])} ({len(records)}h)"]
+    if temps:
+        summary.append(f"T {_fmt(min(temps))}-{_fmt(max(temps))}°C")
+    summary.append(f"mưa tổng {_fmt(sum(rain), 1)}mm trong {len(rainy)}h")
+    if rainy:
+        wettest = max(rainy, key=lambda i: rain[i])
+        summary.append(f"mưa nhiều nhất {_hour_range(records[wettest], records[wettest])} ({_fmt(rain[wettest], 1)}mm)")
+    humidity = _numbers(raws, "relative_humidity_2m")
+    if humidity:
+        summary.append(f"ẩm {_fmt(min(humidity))}-{_fmt(max(humidity))}%")
+    lines = [", ".join(summary)]
+
+    if block_hours:
+        columns = _columns(groups, raws[0])
+        rows = []
+        for start in range(0, len(records), block_hours):
+            block, block_raws = records[start:start + block_hours], raws[start:start + block_hours]
+            row = [_hour_range(block[0], block[-1]), _weather_label(block)]
+            for field, _, decimals in columns:
+                values = _numbers(block_raws, field)
+                if not values:
+                    row.append("")
+                elif field in _HOURLY_SUM:
+                    row.append(_fmt(sum(values), decimals))
+                elif field in _HOURLY_MAX:
+                    row.append(_fmt(max(values), decimals))
+                elif field == "temperature_2m":
+                    row.append(f"{_fmt(min(values))}~{_fmt(max(values))}")
+                else:
+                    row.append(_fmt(sum(values) / len(values), decimals))
+            rows.append(row)
+        lines.append(_table(["giờ", "thời tiết"] + [label for _, label, _ in columns], rows))
+    return "\n".join(lines)
+
+
+def _hour(record):
+    """'2025-01-01 14:00:00' -> ('01/01', '14')"""
+    time = str(record.get("time", ""))
+    match = re.match(r"\d{4}-(\d{2})-(\d{2})[ T](\d{2})", time)
+    return (f"{match.group(2)}/{match.group(1)}", match.group(3)) if match else (time, "")
+
+
+def _hour_range(first, last):
+    """'01/01 14-16h', hoặc '01/01 22h-02/01 01h' khi qua ngày."""
+    (day, hour), (last_day, last_hour) = _hour(first), _hour(last)
+    if not hour:
+        return day if first is last else f"{day}-{last_day}"
+    if day == last_day:
+        return f"{day} {hour}h" if hour == last_hour else f"{day} {hour}-{last_hour}h"
+    return f"{day} {hour}h-{last_day} {last_hour}h"
+
+
+def _seven_day_text(days, groups):
+    days = [d for d in days if isinstance(d, dict)]
+    if not days:
+        return ""
+    columns = _columns(groups, days[0])
+    rows = [
+        [str(day.get("time", "")), day.get("weather_description", "")]
+        + [_fmt(day.get(field), decimals, field) for field, _, decimals in columns]
+        for day in days
+    ]
+    return "seven_day_forecast:\n" + _table(["ngày", "thời tiết"] + [label for _, label, _ in columns], rows)
+
+
+def compact_weather(weather_context, question="", level=0):
+    """Context thời tiết (dạng /api/predict/all) -> văn bản dạng bảng, giữ các trường liên quan tới câu hỏi."""
+    if not weather_context:
+        return "(không có dữ liệu thời tiết)"
+    field_mode, block_hours, _, keep_unknown = LEVELS[level]
+    groups = {"relevant": relevant_groups(question), "core": list(CORE_GROUPS),
+              "minimal": ["temp", "rain"]}[field_mode]
+
+    parts = []
+    if weather_context.get("city"):
+        parts.append(f"Thành phố: {weather_context['city']}")
+    if isinstance(weather_context.get("today_forecast"), dict):
+        parts.append(_today_text(weather_context["today_forecast"], groups))
+    if isinstance(weather_context.get("hourly_forecast"), list):
+        parts.append(_hourly_text(weather_context["hourly_forecast"], groups, block_hours))
+    if isinstance(weather_context.get("seven_day_forecast"), list):
+        parts.append(_seven_day_text(weather_context["seven_day_forecast"], groups))
+    if keep_unknown:
+        known = ("city", "today_forecast", "hourly_forecast", "seven_day_forecast")
+        for key, value in weather_context.items():
+            if key not in known and not _DROPPED_KEY_RE.search(key):
+                parts.append(f"{key}: {_compact_json(value)}")
+    return "\n".join(part for part in parts if part)
+
+
+def compact_agriculture(agriculture_context, level=0):
+    """Kế hoạch nông vụ -> thông tin cây trồng + bảng công việc theo ngày (bỏ id/timestamp, cắt ngắn chi tiết)."""
+    if not agriculture_context:
+        return "(chưa có kế hoạch nông vụ)"
+    _, _, details_chars, keep_unknown = LEVELS[level]
+
+    parts = [f"{label}: {agriculture_context[key]}" for key, label in PLAN_FIELDS.items()
+             if agriculture_context.get(key)]
+    tasks = agriculture_context.get("daily_tasks") or agriculture_context.get("tasks") or []
+    rows = []
+    for task in sorted((t for t in tasks if isinstance(t, dict)),
+                       key=lambda t: str(t.get("task_date", t.get("day", "")))):
+        row = [str(task.get("task_date", task.get("day", ""))),
+               str(task.get("task_description") or task.get("description") or "")]
+        if details_chars:
+            details = " ".join(str(task.get("task_details") or task.get("details") or "").split())
+            row.append(details if len(details) <= details_chars else details[:details_chars - 1] + "…")
+        rows.append(row)
+    if rows:
+        header = ["ngày", "công việc"] + (["chi tiết"] if details_chars else [])
+        parts.append("daily_tasks:\n" + _table(header, rows))
+    if keep_unknown:
+        for key, value in agriculture_context.items():
+            if key in PLAN_FIELDS or key in ("daily_tasks", "tasks") or _DROPPED_KEY_RE.search(key):
+                continue
+            if value not in (None, "", [], {}):
+                parts.append(f"{key}: {value if isinstance(value, str) else _compact_json(value)}")
+    return "\n".join(parts)
+
+
+def _truncate(text, budget):
+    """Cắt bớt dòng cuối cho tới khi `text` vừa `budget` token."""
+    lines = text.split("\n")
+    while lines and estimate_tokens("\n".join(lines)) > budget:
+        lines.pop()
+    return "\n".join(lines + ["…"])
+
+
+def format_chat_context(weather_context, agriculture_context, question="", budget=None, mode=None):
+    """
+    Dựng phần context thời tiết và kế hoạch cho system prompt của chat.
+
+    Ở chế độ "compact", context được nén dần (LEVELS) cho tới khi tổng số token ước lượng
+    không vượt `budget`; nếu mức nén cuối vẫn quá thì cắt bớt dòng.
+
+    Returns:
+        tuple: (weather_str, agri_str, info) với info = {"mode", "level", "tokens", "budget"}.
+    """
+    budget = CHAT_CONTEXT_TOKENS if budget is None else budget
+    mode = mode or CHAT_CONTEXT_MODE
+    if mode == "full":
+        weather_str = json.dumps(weather_context, ensure_ascii=False, indent=2)
+        agri_str = json.dumps(agriculture_context, ensure_ascii=False, indent=2)
+        return weather_str, agri_str, {"mode": mode, "level": None, "budget": None,
+                                       "tokens": estimate_tokens(weather_str) + estimate_tokens(agri_str)}
+
+    for level in range(len(LEVELS)):
+        weather_str = compact_weather(weather_context, question, level)
+        agri_str = compact_agriculture(agriculture_context, level)
+        weather_tokens, agri_tokens = estimate_tokens(weather_str), estimate_tokens(agri_str)
+        if weather_tokens + agri_tokens <= budget:
+            break
+    else:
+        # Chia ngân sách theo tỉ lệ kích thước hiện tại của hai phần
+        weather_budget = budget * weather_tokens // (weather_tokens + agri_tokens)
+        if weather_tokens > weather_budget:
+            weather_str = _truncate(weather_str, weather_budget)
+        if agri_tokens > budget - weather_budget:
+            agri_str = _truncate(agri_str, budget - weather_budget)
+
+    tokens = estimate_tokens(weather_str) + estimate_tokens(agri_str)
+    return weather_str, agri_str, {"mode": mode, "level": level, "tokens": tokens, "budget": budget}
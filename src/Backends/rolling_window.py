@@ -0,0 +1,226 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from crawl import _fetch_open_meteo, DAILY_SCHEMA, DAILY_VARIABLES, PAST_DAYS_30, TZ_VN
+from data_sources import data_source
+from forecast_cache import current_hour_bucket
+from predict import SEQ_FEATURES
+from timing import timed
+
+load_dotenv()
+
+# Cấu hình qua biến môi trường
+ROLLING_WINDOW_ENABLED = os.getenv("ROLLING_WINDOW_ENABLED", "1").lower() not in ("0", "false", "no")
+ROLLING_WINDOW_LOCATIONS = int(os.getenv("ROLLING_WINDOW_LOCATIONS", 2048))   # số địa điểm giữ trong bộ nhớ
+
+WINDOW_DAYS = PAST_DAYS_30 + 1
+# Các cột daily (theo thứ tự SEQ_FEATURES) - còn lại là sin_doy, cos_doy
+_DAILY_FEATURES = [f for f in SEQ_FEATURES if f in DAILY_SCHEMA]
+
+
+def _today():
+    return datetime.now(TZ_VN).date()
+
+
+def feature_rows(block, until):
+    """
+    Các dòng SEQ_FEATURES (chưa chuẩn hóa) từ block `daily` của Open-Meteo, chỉ lấy các ngày <= `until`.
+    Cùng cách tính với block_to_frame + _seq_features_frame (ép float32, sin/cos theo dayofyear / 365).
+
+    Returns:
+        tuple: (dates datetime64[D], rows (n, len(SEQ_FEATURES)))
+    """
+    dates = np.array(block.get("time") or [], dtype="datetime64[D]")
+    keep = dates <= np.datetime64(until, "D")
+    columns = []
+    for field in _DAILY_FEATURES:
+        values = block.get(field)
+        values = np.asarray(values, dtype=np.float64)[keep] if values else np.full(keep.sum(), np.nan)
+        columns.append(values.astype(DAILY_SCHEMA[field]).astype(np.float64))
+    dayofyear = pd.DatetimeIndex(dates[keep]).dayofyear.to_numpy()
+    columns += [np.sin(2 * np.pi * dayofyear / 365), np.cos(2 * np.pi * dayofyear / 365)]
+    return dates[keep], np.column_stack(columns)
+
+
+class RollingWindow:
+    """
+    Cửa sổ WINDOW_DAYS ngày gần nhất của một địa điểm cho model 7 ngày, dạng ring buffer.
+
+    Mỗi slot giữ một ngày: dòng SEQ_FEATURES chưa chuẩn hóa và dòng đã chuẩn hóa bằng scaler_x.
+    Ngày mới ghi đè ngày cũ nhất, ngày đã có (VD: hôm nay, số liệu đổi trong ngày) ghi đè tại chỗ;
+    chỉ các dòng mới / bị ghi đè phải chuẩn hóa lại.
+    """
+
+    def __init__(self, days=WINDOW_DAYS):
+        self.days = days
+        self.dates = np.full(days, np.datetime64("NaT"), dtype="datetime64[D]")
+        self.features = np.full((days, len(SEQ_FEATURES)), np.nan)
+        self.scaled = np.full((days, len(SEQ_FEATURES)), np.nan)
+        self._dirty = np.ones(days, dtype=bool)
+        self._scaler = None
+        self.head = 0           # slot của ngày cũ nhất
+        self.count = 0
+        self.updated_hour = None
+
+    @property
+    def last_date(self):
+        return self.dates[(self.head + self.count - 1) % self.days] if self.count else None
+
+    def last_time(self):
+        return pd.Timestamp(self.last_date)
+
+    def is_current(self, today):
+        """Đủ WINDOW_DAYS ngày, kết thúc hôm nay, và đã cập nhật trong giờ hiện tại (GMT+7)."""
+        return (self.count == self.days and self.last_date == np.datetime64(today, "D")
+                and self.updated_hour == current_hour_bucket())
+
+    def missing_days(self, today):
+        """
+        past_days cần tải để đưa cửa sổ tới hôm nay: tải lại cả ngày cuối đang có (hôm qua có thể
+        mới chỉ là số liệu giữa ngày), hoặc PAST_DAYS_30 nếu cửa sổ chưa đủ / quá cũ.
+        """
+        if self.count < self.days:
+            return PAST_DAYS_30
+        gap = int((np.datetime64(today, "D") - self.last_date).astype(int))
+        return gap if 0 <= gap <= PAST_DAYS_30 else PAST_DAYS_30
+
+    def extend(self, block, today):
+        """Ghép các ngày <= hôm nay trong block `daily` vào cửa sổ. Thiếu ngày ở giữa -> bắt đầu lại từ block."""
+        dates, rows = feature_rows(block, today)
+        if not len(dates):
+            return
+        if self.count and dates[0] > self.last_date + 1:
+            self.head, self.count = 0, 0
+        for date, row in zip(dates, rows):
+            self._put(date, row)
+        self.updated_hour = current_hour_bucket()
+
+    def _put(self, date, row):
+        if self.count:
+            offset = int((date - self.dates[self.head]).astype(int))
+            if offset < 0:
+                return                      # cũ hơn cửa sổ
+            if offset < self.count:
+                slot = (self.head + offset) % self.days
+                self.features[slot] = row
+                self._dirty[slot] = True
+                return
+        # Ngày mới: ghi vào slot sau ngày cuối, cửa sổ đầy thì đè ngày cũ nhất
+        slot = (self.head + self.count) % self.days
+        if self.count == self.days:
+            self.head = (self.head + 1) % self.days
+        else:
+            self.count += 1
+        self.dates[slot] = date
+        self.features[slot] = row
+        self._dirty[slot] = True
+
+    def model_input(self, scaler_x):
+        """
+        Input LSTM (1, WINDOW_DAYS, len(SEQ_FEATURES)) theo thứ tự thời gian, như process_input_7days.
+
+        Raises:
+            ValueError: Nếu cửa sổ chưa đủ WINDOW_DAYS ngày.
+        """
+        if self.count != self.days:
+            raise ValueError(f"Cần đúng {self.days} ngày dữ liệu lịch sử, nhận được {self.count} ngày")
+        if scaler_x is not self._scaler:
+            # Bộ model khác (hot-reload / A-B) -> chuẩn hóa lại cả cửa sổ
+            self._dirty[:] = True
+            self._scaler = scaler_x
+        dirty = np.flatnonzero(self._dirty)
+        if dirty.size:
+            self.scaled[dirty] = scaler_x.transform(pd.DataFrame(self.features[dirty], columns=SEQ_FEATURES))
+            self._dirty[dirty] = False
+        order = (self.head + np.arange(self.days)) % self.days
+        return self.scaled[order][np.newaxis]
+
+
+class RollingWindowStore:
+    """LRU các RollingWindow theo nguồn dữ liệu + tọa độ (làm tròn 4 chữ số như geocode_cache)."""
+
+    def __init__(self, maxsize=ROLLING_WINDOW_LOCATIONS, enabled=ROLLING_WINDOW_ENABLED):
+        self.maxsize = maxsize
+        self.enabled = enabled
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(coord):
+        return f"{data_source().name}|{round(float(coord['lat']), 4)},{round(float(coord['lon']), 4)}"
+
+    def get(self, coord):
+        if not self.enabled:
+            return None
+        key = self.key(coord)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None:
+                self._windows.move_to_end(key)
+            return window
+
+    def missing_days(self, coord, today=None):
+        """past_days cần tải cho `coord` (PAST_DAYS_30 nếu chưa có cửa sổ hoặc đã tắt)."""
+        window = self.get(coord)
+        return window.missing_days(today or _today()) if window is not None else PAST_DAYS_30
+
+    @timed("process.window")
+    def update(self, coord, block, today=None):
+        """Ghép block `daily` vào cửa sổ của `coord` (tạo mới nếu chưa có) và trả về cửa sổ đó."""
+        window = self.get(coord)
+        if window is None:
+            window = RollingWindow()
+            if self.enabled:
+                with self._lock:
+                    self._windows[self.key(coord)] = window
+                    while len(self._windows) > self.maxsize:
+                        self._windows.popitem(last=False)
+        window.extend(block or {}, today or _today())
+        return window
+
+    def __len__(self):
+        return len(self._windows)
+
+
+rolling_windows = RollingWindowStore()
+
+
+async def history_window(coord, daily_block=None):
+    """
+    Cửa sổ 30 ngày (kết thúc hôm nay) của `coord` cho model 7 ngày.
+
+    `daily_block` - block `daily` của một response vừa tải với past_days = rolling_windows.missing_days(coord)
+    (VD: từ get_weather_data_all) - được ghép vào trước. Nếu cửa sổ vẫn chưa đủ hoặc chưa cập nhật
+    trong giờ này thì chỉ tải các ngày còn thiếu: thường là hôm nay (past_days=0), sang ngày mới
+    là hôm qua + hôm nay, thay vì cả 30 ngày.
+
+    Raises:
+        ValueError: Nếu upstream lỗi hoặc không đủ dữ liệu.
+    """
+    today = _today()
+    window = rolling_windows.update(coord, daily_block, today) if daily_block is not None \
+        else rolling_windows.get(coord)
+    if window is not None and window.is_current(today):
+        return window
+
+    data = await _fetch_open_meteo({
+        "latitude": coord["lat"],
+        "longitude": coord["lon"],
+        "daily": DAILY_VARIABLES,
+        "timezone": "Asia/Bangkok",
+        "past_days": rolling_windows.missing_days(coord, today),
+        "forecast_days": 1,
+    })
+    if data is None:
+        raise ValueError("Upstream weather data unavailable")
+
+    window = rolling_windows.update(coord, data.get("daily"), today)
+    if not window.is_current(today):
+        raise ValueError(f"Cần đúng {WINDOW_DAYS} ngày dữ liệu lịch sử, nhận được {window.count} ngày")
+    return window
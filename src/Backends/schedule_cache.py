@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from cache_store import TTLCache, SQLiteStore
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cấu hình qua biến môi trường
+SCHEDULE_CACHE_ENABLED = os.getenv("SCHEDULE_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+SCHEDULE_CACHE_DB = os.getenv("SCHEDULE_CACHE_DB", os.path.join(BASE_DIR, "cache", "schedule.sqlite3"))
+SCHEDULE_CACHE_SIZE = int(os.getenv("SCHEDULE_CACHE_SIZE", 512))
+SCHEDULE_CACHE_MAX_TTL = float(os.getenv("SCHEDULE_CACHE_MAX_TTL", 24 * 3600))   # trần TTL (giây)
+
+TZ_VN = timezone(timedelta(hours=7))
+
+# Độ chính xác khi lượng tử hóa dự báo trong khóa cache: dao động nhỏ giữa các lần chạy model
+# (VD: 31.2°C -> 31.4°C) vẫn trùng khóa, còn thay đổi đáng kể thì tạo lịch mới
+WEATHER_QUANTUM = {
+    "temp_max": 1.0,        # °C
+    "temp_min": 1.0,        # °C
+    "precipitation": 2.0,   # mm
+    "humidity": 5.0,        # %
+    "wind_speed": 5.0,      # km/h
+}
+
+
+def _normalize_text(text):
+    """Chuẩn hóa chữ người dùng nhập: Unicode NFC, chữ thường, gộp khoảng trắng (giữ dấu tiếng Việt)."""
+    text = unicodedata.normalize("NFC", str(text or ""))
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def _quantize(value, step):
+    try:
+        return round(round(float(value) / step) * step, 1)
+    except (TypeError, ValueError):
+        return None
+
+
+def quantize_weather(weather_summary):
+    """Bản tóm tắt dự báo 7 ngày (như trong prompt) với các giá trị số làm tròn theo WEATHER_QUANTUM."""
+    return [
+        {
+            "date": day.get("date"),
+            "weather": day.get("weather"),
+            **{field: _quantize(day.get(field), step) for field, step in WEATHER_QUANTUM.items()},
+        }
+        for day in weather_summary
+    ]
+
+
+def schedule_key(model, prompt_version, crop_name, location, season, notes, weather_summary):
+    """Khóa cache: SHA-256 của JSON chuẩn tắc (model, phiên bản prompt, thông tin nông trại, dự báo đã lượng tử)."""
+    payload = {
+        "model": model,
+        "prompt": prompt_version,
+        "crop": _normalize_text(crop_name),
+        "location": _normalize_text(location),
+        "season": _normalize_text(season),
+        "notes": _normalize_text(notes),
+        "weather": quantize_weather(weather_summary),
+    }
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def schedule_ttl(weather_summary, now=None):
+    """
+    TTL theo khoảng ngày của dự báo: tới hết ngày đầu tiên (GMT+7). Sang ngày mới, cửa sổ 7 ngày
+    dời đi nên khóa đổi theo và lịch cũ không còn dùng được. Tối đa SCHEDULE_CACHE_MAX_TTL.
+    """
+    now = now or datetime.now(TZ_VN)
+    try:
+        first_day = datetime.strptime(str(weather_summary[0]["date"])[:10], "%Y-%m-%d")
+    except (IndexError, KeyError, ValueError):
+        return SCHEDULE_CACHE_MAX_TTL
+    end_of_day = first_day.replace(tzinfo=TZ_VN) + timedelta(days=1)
+    return min(max((end_of_day - now).total_seconds(), 0.0), SCHEDULE_CACHE_MAX_TTL)
+
+
+class ScheduleCache:
+    """
+    Cache lịch nông vụ do Groq sinh ra, theo khóa băm của input (xem schedule_key).
+
+    Hai tầng giống GeocodeCache: LRU có TTL trong tiến trình, phía sau là SQLite trên đĩa
+    dùng chung giữa các worker uvicorn và còn nguyên sau khi khởi động lại.
+    """
+
+    def __init__(self, db_path=SCHEDULE_CACHE_DB, maxsize=SCHEDULE_CACHE_SIZE):
+        self.memory = TTLCache(maxsize=maxsize)
+        self.store = SQLiteStore(db_path, table="schedule")
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None:
+            value = self.store.get(key)
+            if value is not None:
+                self.memory.set(key, value, ttl=self.store.ttl_remaining(key))
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        self.memory.set(key, value, ttl=ttl)
+        self.store.set(key, value, ttl=ttl)
+        self.store.purge_expired()
+
+
+schedule_cache = ScheduleCache() if SCHEDULE_CACHE_ENABLED else None
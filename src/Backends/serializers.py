@@ -0,0 +1,110 @@
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi.responses import ORJSONResponse
+
+from data_sources import float32_to_float64
+from crawl import HOURLY_SCHEMA, DAILY_SCHEMA, HOURLY_TIME_FORMAT as OPEN_METEO_HOURLY_FORMAT
+from timing import timed
+
+# Các trường trả về trong raw_data (cùng thứ tự với schema dữ liệu Open-Meteo)
+HOURLY_FIELDS = list(HOURLY_SCHEMA)
+DAILY_FIELDS = list(DAILY_SCHEMA)
+
+# Định dạng thời gian giữ nguyên như các response trước đây
+DATE_FORMAT = "%Y-%m-%d"
+HOURLY_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Định dạng response streaming -> media type
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def column_values(series, fill_value=0.0):
+    """
+    Chuyển cả cột số sang list float Python một lần (NaN/None -> `fill_value`).
+
+    Thay cho việc gọi safe_float(df.iloc[i][col]) trên từng ô.
+    """
+    values = series.to_numpy()
+    if values.dtype == np.float32:
+        # Làm tròn 7 chữ số có nghĩa, để 23.1 không thành 23.100000381469727
+        values = float32_to_float64(values)
+    else:
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    missing = np.isnan(values)
+    if not missing.any():
+        return values.tolist()
+    if fill_value is None:
+        return np.where(missing, None, values).tolist()
+    return np.where(missing, fill_value, values).tolist()
+
+
+def time_values(series, time_format=None):
+    """Chuyển cột thời gian sang list chuỗi (format theo `time_format` nếu có)."""
+    if time_format is None:
+        return series.astype(str).tolist()
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        series = pd.to_datetime(series, errors="coerce")
+    return series.dt.strftime(time_format).tolist()
+
+
+@timed("serialize")
+def frame_records(df, columns=None, time_format=None, fill_value=0.0, extra=None):
+    """
+    Chuyển DataFrame thành list dict theo cột (columnar), không truy cập từng ô pandas.
+
+    Args:
+        df (pd.DataFrame): Dữ liệu cần chuyển.
+        columns (list | None): Các cột số cần lấy (mặc định: mọi cột trừ 'time').
+        time_format (str | None): Format cho cột 'time' (None = giữ dạng chuỗi hiện tại).
+        fill_value: Giá trị thay cho NaN (0.0 như safe_float cũ, None -> null trong JSON).
+        extra (dict | None): Các cột bổ sung {tên: list giá trị} nối vào cuối mỗi record.
+
+    Returns:
+        list: Mỗi phần tử là một dict {"time": ..., <cột>: float, ...}.
+    """
+    if columns is None:
+        columns = [c for c in df.columns if c != "time"]
+
+    keys, arrays = [], []
+    if "time" in df.columns:
+        keys.append("time")
+        arrays.append(time_values(df["time"], time_format))
+    for col in columns:
+        keys.append(col)
+        arrays.append(column_values(df[col], fill_value))
+    for key, values in (extra or {}).items():
+        keys.append(key)
+        arrays.append(list(values))
+
+    return [dict(zip(keys, row)) for row in zip(*arrays)]
+
+
+@timed("serialize")
+def forecast_records(df, fields, codes, descriptions, time_format=None):
+    """
+    Dựng các record dạng {"time", "weather_code", "weather_description", "raw_data": {...}}
+    dùng cho hourly_forecast / today_forecast.
+    """
+    times = time_values(df["time"], time_format)
+    raw_rows = frame_records(df[fields], fields)
+    return [
+        {
+            "time": t,
+            "weather_code": int(code),
+            "weather_description": description,
+            "raw_data": raw,
+        }
+        for t, code, description, raw in zip(times, codes, descriptions, raw_rows)
+    ]
+
+
+def stream_event(fmt, section, data):
+    """
+    Mã hóa một phần (section) của response streaming:
+    - ndjson: một dòng {"section": ..., "data": ...}
+    - sse: một sự kiện Server-Sent Events (event: <section>, data: <json>)
+    """
+    if fmt == "sse":
+        return b"event: " + section.encode() + b"\ndata: " + orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n\n"
+    return orjson.dumps({"section": section, "data": data}, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
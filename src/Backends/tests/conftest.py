@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Cache trên đĩa của các module (đọc lúc import) trỏ sang thư mục tạm, không đụng vào src/Backends/cache
+_CACHE_DIR = tempfile.mkdtemp(prefix="agriweather-tests-")
+os.environ.setdefault("GEOCODE_CACHE_DB", os.path.join(_CACHE_DIR, "geocode.sqlite3"))
+os.environ.setdefault("SCHEDULE_CACHE_DB", os.path.join(_CACHE_DIR, "schedule.sqlite3"))
+os.environ.setdefault("REPLAY_DIR", os.path.join(_CACHE_DIR, "replay"))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    """Upstream giả (benchmarks/stubs.py) trên 127.0.0.1; backend được trỏ sang đó trong suốt test."""
+    from benchmarks.stubs import UpstreamStubs
+    import crawl
+    import data_sources
+
+    upstream = UpstreamStubs(data="synthetic").start()
+    env = upstream.env()
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    # Các URL được đọc lúc import module
+    monkeypatch.setattr(data_sources, "OPEN_METEO_URL", env["OPEN_METEO_URL"])
+    monkeypatch.setattr(data_sources, "WEATHER_SOURCE", "live")
+    monkeypatch.setattr(crawl, "OPENWEATHER_URL", env["OPENWEATHER_URL"])
+    yield upstream
+    upstream.stop()
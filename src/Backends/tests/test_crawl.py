@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import pytest
+
+import crawl
+from geocode_cache import GeocodeCache
+from http_client import close_client
+
+
+def run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await close_client()
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def empty_geocode_cache(monkeypatch, tmp_path):
+    """Cache geocode không nạp sẵn 63 tỉnh, để get_coordinates phải gọi OpenWeatherMap (stub)."""
+    cache = GeocodeCache(db_path=str(tmp_path / "geocode.sqlite3"), seed_dir=None)
+    monkeypatch.setattr(crawl, "geocode_cache", cache)
+    return cache
+
+
+def test_concurrent_fetches_overlap(stubs):
+    stubs.latency_ms["open_meteo"] = 300
+    coords = [{"lat": 21.0 + i, "lon": 105.8} for i in range(5)]
+
+    async def fetch_all():
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            crawl._fetch_open_meteo({"latitude": c["lat"], "longitude": c["lon"], "daily": crawl.DAILY_VARIABLES,
+                                     "timezone": "Asia/Bangkok", "forecast_days": 1})
+            for c in coords
+        ))
+        return results, time.perf_counter() - started
+
+    results, elapsed = run(fetch_all())
+
+    assert [r["latitude"] for r in results] == [c["lat"] for c in coords]
+    assert stubs.calls["open_meteo"] == len(coords)
+    assert elapsed < 0.3 * len(coords) / 2   # song song, không tuần tự
+
+
+@pytest.mark.parametrize("status", [400, 429, 500, 503])
+def test_upstream_error_returns_none(stubs, status):
+    stubs.open_meteo_errors.append(status)
+
+    assert run(crawl.get_weather_data_30("Hà Nội")) is None
+    assert run(crawl.get_weather_data_30("Hà Nội"))["daily"]["time"]   # lỗi chỉ ảnh hưởng lần gọi đó
+    assert stubs.calls["open_meteo"] == 2
+
+    stubs.open_meteo_errors.append(status)
+    assert run(crawl.get_weather_data_all("Hà Nội")) == (None, None, None)
+
+
+def test_upstream_error_in_batch_returns_none_for_chunk(stubs):
+    stubs.open_meteo_errors.append(502)
+    coords = [{"lat": 10.0, "lon": 106.0}, {"lat": 16.0, "lon": 108.0}]
+
+    assert run(crawl.get_weather_data_all_batch(coords)) == [(None, None, None)] * 2
+
+
+def test_geocode_coalesces_concurrent_lookups(stubs, empty_geocode_cache):
+    stubs.latency_ms["openweather"] = 200
+
+    async def lookup():
+        return await asyncio.gather(*(crawl.get_coordinates(name) for name in ["Hà Nội", "ha noi", "Hà Nội"] * 4))
+
+    coords = run(lookup())
+
+    assert stubs.calls["openweather"] == 1
+    assert all(c == coords[0] for c in coords)
+    assert empty_geocode_cache.get("Hà Nội") == {"lat": coords[0]["lat"], "lon": coords[0]["lon"]}
+    assert crawl._pending_geocodes == {}
+
+
+def test_cancelled_caller_does_not_cancel_shared_geocode(stubs, empty_geocode_cache):
+    stubs.latency_ms["openweather"] = 200
+
+    async def lookup():
+        first = asyncio.ensure_future(crawl.get_coordinates("Đà Nẵng"))
+        await asyncio.sleep(0.05)
+        others = [asyncio.ensure_future(crawl.get_coordinates("Đà Nẵng")) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        first.cancel()
+        return first, await asyncio.gather(*others)
+
+    first, coords = run(lookup())
+
+    assert first.cancelled()
+    assert stubs.calls["openweather"] == 1
+    assert len(coords) == 3 and all(c["lat"] == coords[0]["lat"] for c in coords)
+
+
+@pytest.mark.parametrize("past_days", [0, 1, 5, crawl.PAST_DAYS_30])
+def test_split_without_today_in_times_uses_past_days(past_days):
+    # Ngày "hôm nay" của upstream khác ngày hiện tại (VD: lệch múi giờ quanh nửa đêm): vị trí suy từ past_days
+    times = [f"2020-01-{day:02d}" for day in range(1, past_days + 4)]
+    data = {"latitude": 21.0, "hourly": {"time": [f"{times[0]}T00:00"], "temperature_2m": [20.0]},
+            "daily": {"time": times, "temperature_2m_max": list(range(len(times)))}}
+
+    weather_30d, _, weather_daily = crawl.split_weather_bundle(data, past_days)
+
+    assert weather_daily["daily"]["time"] == [times[past_days]]
+    assert weather_daily["daily"]["temperature_2m_max"] == [past_days]
+    assert weather_30d["daily"]["time"] == times[:past_days + 1]
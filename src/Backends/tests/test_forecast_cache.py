@@ -0,0 +1,157 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+
+from forecast_cache import ForecastCache, MemoryBackend, RedisBackend, make_key, TZ_VN
+
+COORD = {"lat": 21.0285, "lon": 105.8542}
+
+
+class InProcessRedis:
+    """Stand-in cho redis.asyncio trong tiến trình: chỉ các lệnh RedisBackend dùng (GET, SET EX)."""
+
+    def __init__(self):
+        self._data = {}
+
+    async def get(self, name):
+        value, expires_at = self._data.get(name, (None, None))
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[name]
+            return None
+        return value
+
+    async def set(self, name, value, ex=None):
+        self._data[name] = (value.encode() if isinstance(value, str) else value,
+                            time.time() + ex if ex is not None else None)
+        return True
+
+    async def aclose(self):
+        self._data.clear()
+
+
+def _redis_clients():
+    clients = [pytest.param(InProcessRedis, id="in-process")]
+    try:
+        import fakeredis.aioredis
+        clients.append(pytest.param(fakeredis.aioredis.FakeRedis, id="fakeredis"))
+    except ImportError:
+        pass
+    return clients
+
+
+@pytest.fixture(params=[pytest.param(None, id="memory")] + _redis_clients())
+def cache(request):
+    if request.param is None:
+        return ForecastCache(MemoryBackend())
+    return ForecastCache(RedisBackend(client=request.param(), prefix="test:"))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Đồng hồ giả cho time.time (TTL của MemoryBackend và của stand-in)."""
+    now = [time.time()]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+def test_concurrent_identical_calls_compute_once(cache):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"predictions": [1.5, 2.5]}
+
+    async def main():
+        key = make_key("7days", COORD, "v1")
+        return await asyncio.gather(*(cache.get_or_compute(key, compute) for _ in range(20)))
+
+    results = asyncio.run(main())
+
+    assert len(calls) == 1
+    assert all(r == {"predictions": [1.5, 2.5]} for r in results)
+    assert cache.misses == 1 and cache.hits == 19
+
+
+def test_cached_value_is_served_until_ttl_expires(cache, clock):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    async def main():
+        key = make_key("7days", COORD, "v1")
+        first = await cache.get_or_compute(key, compute, ttl=60)
+        clock[0] += 59
+        second = await cache.get_or_compute(key, compute, ttl=60)
+        clock[0] += 2
+        third = await cache.get_or_compute(key, compute, ttl=60)
+        return first, second, third
+
+    assert asyncio.run(main()) == ({"n": 1}, {"n": 1}, {"n": 2})
+
+
+def test_errors_are_not_cached(cache):
+    attempts = []
+
+    async def compute():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("upstream down")
+        return {"ok": True}
+
+    async def main():
+        key = make_key("all", COORD, "v1")
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute(key, compute)
+        return await cache.get_or_compute(key, compute)
+
+    assert asyncio.run(main()) == {"ok": True}
+
+
+def test_key_changes_with_hour_bucket_model_version_and_source():
+    key = make_key("7days", COORD, "v1", hour_bucket="2026-01-05T14")
+
+    assert key == make_key("7days", {"lat": 21.02851, "lon": 105.85419}, "v1", hour_bucket="2026-01-05T14")
+    assert key != make_key("7days", COORD, "v1", hour_bucket="2026-01-05T15")
+    assert key != make_key("7days", COORD, "v2", hour_bucket="2026-01-05T14")
+    assert key != make_key("hourly", COORD, "v1", hour_bucket="2026-01-05T14")
+    assert key != make_key("7days", COORD, "v1", hour_bucket="2026-01-05T14", source="local")
+
+
+def test_default_hour_bucket_follows_gmt7_clock(monkeypatch):
+    import forecast_cache
+
+    class FakeDatetime(datetime):
+        current = datetime(2026, 1, 5, 14, 59, tzinfo=TZ_VN)
+
+        @classmethod
+        def now(cls, tz=None):
+            return cls.current
+
+    monkeypatch.setattr(forecast_cache, "datetime", FakeDatetime)
+    before = make_key("7days", COORD, "v1")
+    FakeDatetime.current = datetime(2026, 1, 5, 15, 0, tzinfo=TZ_VN)
+
+    assert before.endswith("2026-01-05T14")
+    assert make_key("7days", COORD, "v1").endswith("2026-01-05T15")
+
+
+def test_new_hour_or_model_version_recomputes(cache):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    async def main():
+        return [
+            await cache.get_or_compute(make_key("7days", COORD, version, hour_bucket=hour), compute)
+            for version, hour in [("v1", "2026-01-05T14"), ("v1", "2026-01-05T14"),
+                                  ("v1", "2026-01-05T15"), ("v2", "2026-01-05T15")]
+        ]
+
+    assert asyncio.run(main()) == [{"n": 1}, {"n": 1}, {"n": 2}, {"n": 3}]
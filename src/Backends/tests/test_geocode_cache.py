@@ -0,0 +1,26 @@
+import pytest
+
+from geocode_cache import GeocodeCache, load_province_seeds, normalize_city_name
+
+
+@pytest.mark.parametrize("name, key", [
+    ("Đà Nẵng", "danang"),
+    ("Thành phố Đà Nẵng", "danang"),
+    ("Thừa Thiên Huế", "hue"),
+    ("Thừa Thiên - Huế", "hue"),
+    ("Bà Rịa - Vũng Tàu", "vungtau"),
+    ("Sài Gòn", "hochiminh"),
+    ("TP.HCM", "hochiminh"),
+    ("Ho Chi Minh City", "hochiminh"),
+])
+def test_normalize_city_name(name, key):
+    assert normalize_city_name(name) == key
+
+
+def test_official_names_hit_province_seeds(tmp_path):
+    seeds = load_province_seeds()
+    cache = GeocodeCache(db_path=str(tmp_path / "geocode.sqlite3"))
+
+    for name, province in [("Thừa Thiên Huế", "hue"), ("Bà Rịa - Vũng Tàu", "vungtau"), ("Sài Gòn", "hochiminh")]:
+        assert cache.get(name) == seeds[province]
+    assert cache.misses == 0
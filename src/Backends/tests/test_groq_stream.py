@@ -0,0 +1,113 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.stubs import _groq_content
+import groq_service
+import main
+
+CHAT_BODY = {"user_message": "Hôm nay có nên tưới lúa không?", "weather_context": {}, "agriculture_context": {}}
+
+
+@pytest.fixture
+def groq_stub(stubs, monkeypatch):
+    """Groq trỏ sang stub; client dùng chung được tạo lại với cấu hình của test."""
+    monkeypatch.setattr(groq_service, "GROQ_BASE_URL", stubs.base_url)
+    monkeypatch.setattr(groq_service, "_client", None)
+    yield stubs
+    groq_service._client = None
+
+
+def parse_sse(raw):
+    """[(event, data)] từ body text/event-stream."""
+    events = []
+    for block in raw.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_tokens_arrive_in_order_and_done_has_stats(groq_stub):
+    response = TestClient(main.app).post("/api/groq/chat/stream", json=CHAT_BODY)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    words = _groq_content({}).split(" ")
+
+    tokens = [data["content"] for event, data in events if event == "token"]
+    assert tokens == [words[0]] + [" " + word for word in words[1:]]
+    event, done = events[-1]
+    assert event == "done"
+    assert done["reply"] == _groq_content({})
+    assert done["tokens"] == len(words)
+    assert done["ttft_ms"] >= 0
+    assert groq_service.groq_stats["in_flight"] == 0
+
+
+def test_busy_returns_503_before_streaming(groq_stub, monkeypatch):
+    monkeypatch.setattr(groq_service, "GROQ_MAX_CONCURRENCY", 0)
+    monkeypatch.setattr(groq_service, "GROQ_QUEUE_TIMEOUT", 0.01)
+
+    response = TestClient(main.app).post("/api/groq/chat/stream", json=CHAT_BODY)
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+    assert groq_stub.calls["groq"] == 0
+
+
+def test_upstream_error_returns_500(groq_stub):
+    groq_stub.groq_errors = [400]
+
+    response = TestClient(main.app).post("/api/groq/chat/stream", json=CHAT_BODY)
+
+    assert response.status_code == 500
+    assert groq_service.groq_stats["in_flight"] == 0
+
+
+async def _stream_then_disconnect(app, body, after_events):
+    """Gọi endpoint qua ASGI, nhận `after_events` sự kiện rồi báo client ngắt kết nối."""
+    disconnected = asyncio.Event()
+    requested = False
+    events = []
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            events.append(message["body"])
+            if len(events) >= after_events:
+                disconnected.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/api/groq/chat/stream",
+        "raw_path": b"/api/groq/chat/stream", "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), timeout=10)
+    await groq_service.close_groq_client()
+    return events
+
+
+def test_client_disconnect_aborts_upstream_stream(groq_stub):
+    groq_stub.token_ms = 50
+
+    events = asyncio.run(_stream_then_disconnect(main.app, json.dumps(CHAT_BODY).encode(), after_events=2))
+
+    assert 2 <= len(events) < len(_groq_content({}).split(" "))
+    deadline = time.monotonic() + 5
+    while groq_stub.aborted_streams < 1 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert groq_stub.aborted_streams == 1
+    assert groq_service.groq_stats["in_flight"] == 0
@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import inference_executor
+
+
+@pytest.fixture
+def model_dir(monkeypatch):
+    """Thư mục model giả: `disk["version"]` là dấu vân tay hiện tại, mỗi lần load trả về bundle mới."""
+    disk = {"version": "v1", "loads": []}
+
+    def load(path):
+        disk["loads"].append(disk["version"])
+        return {"version": disk["version"]}
+
+    monkeypatch.setattr(inference_executor, "_worker_bundles", {})
+    monkeypatch.setitem(inference_executor.BUNDLE_LOADERS, "daily", load)
+    monkeypatch.setattr(inference_executor, "compute_model_fingerprint", lambda path: disk["version"])
+    return disk
+
+
+def test_alternating_versions_during_reload_do_not_reload_from_disk(model_dir):
+    assert inference_executor._worker_load("/models", "v1", "daily") == {"version": "v1"}
+    model_dir["version"] = "v2"
+    for _ in range(5):
+        assert inference_executor._worker_load("/models", "v2", "daily") == {"version": "v2"}
+        assert inference_executor._worker_load("/models", "v1", "daily") == {"version": "v1"}
+
+    assert model_dir["loads"] == ["v1", "v2"]
+
+
+def test_version_replaced_on_disk_is_refused(model_dir):
+    model_dir["version"] = "v2"
+
+    # Process con khởi động sau khi v1 đã bị thay: chỉ còn file v2 trên đĩa
+    with pytest.raises(inference_executor.ModelVersionUnavailable):
+        inference_executor._worker_load("/models", "v1", "daily")
+    assert inference_executor._worker_load("/models", "v2", "daily") == {"version": "v2"}
+    assert list(inference_executor._worker_bundles["daily"]) == ["v2"]
+    assert model_dir["loads"] == ["v2"]
+
+
+def test_classify_uses_request_models_when_worker_lacks_its_version(model_dir, monkeypatch):
+    import predict
+
+    monkeypatch.setattr(predict, "classify_features", lambda bundle, features: (bundle["version"], features))
+    executor = inference_executor.InferenceExecutor(threads=1, lstm_threads=1, processes={})
+    # Process con chạy trong thread pool (cùng _worker_bundles) thay cho process pool thật
+    monkeypatch.setattr(executor, "_process_pool", lambda name, models: executor.threads)
+    model_dir["version"] = "v2"
+
+    def snapshot(version):
+        return SimpleNamespace(model_dir="/models", version=version, get=lambda name: {"version": version})
+
+    assert asyncio.run(executor.classify("daily", snapshot("v1"), "rows")) == ("v1", "rows")
+    assert asyncio.run(executor.classify("daily", snapshot("v2"), "rows")) == ("v2", "rows")
+    assert model_dir["loads"] == ["v2"]
+    executor.shutdown()
+
+
+def test_keeps_only_recent_versions(model_dir):
+    for version in ("v1", "v2", "v3"):
+        model_dir["version"] = version
+        inference_executor._worker_load("/models", version, "daily")
+
+    assert list(inference_executor._worker_bundles["daily"]) == ["v2", "v3"]
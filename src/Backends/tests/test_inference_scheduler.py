@@ -0,0 +1,46 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from inference_scheduler import MicroBatcher
+
+
+def test_restarted_worker_serves_requests_queued_before_it_died():
+    release = threading.Event()
+
+    def predict(model, inputs):
+        release.wait(5)
+        return inputs * 2
+
+    async def scenario():
+        batcher = MicroBatcher(predict, max_batch_size=1, max_wait_ms=0)
+        running = asyncio.ensure_future(batcher.submit(np.array([1.0]), "model"))
+        await asyncio.sleep(0.05)          # đang chạy predict trong thread pool
+        queued = asyncio.ensure_future(batcher.submit(np.array([2.0]), "model"))
+        await asyncio.sleep(0)
+
+        batcher._worker.cancel()           # worker chết khi còn request trong hàng đợi
+        await asyncio.sleep(0.01)
+        release.set()
+
+        assert (await batcher.submit(np.array([3.0]), "model")).tolist() == [6.0]
+        assert (await asyncio.wait_for(queued, 1)).tolist() == [4.0]
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(running, 1)
+        await batcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_new_event_loop_gets_a_new_queue():
+    batcher = MicroBatcher(lambda model, inputs: inputs + 1, max_wait_ms=0)
+
+    async def once(value):
+        result = await batcher.submit(np.array([value]), "model")
+        await batcher.close()
+        return result.tolist()
+
+    assert asyncio.run(once(1.0)) == [2.0]
+    assert asyncio.run(once(2.0)) == [3.0]
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import lstm_runtime
+from lstm_runtime import NumpyLSTMModel, OnnxLSTMModel, export_numpy_weights, export_onnx
+
+keras = pytest.importorskip("keras")
+
+INPUT_WINDOW, NUM_FEATURES, HORIZON, NUM_TARGETS = 30, 19, 7, 17
+
+
+@pytest.fixture(scope="module")
+def keras_model():
+    """Model cùng kiến trúc với 7day_model.keras, trọng số ngẫu nhiên cố định theo seed."""
+    keras.utils.set_random_seed(0)
+    model = keras.Sequential([
+        keras.Input((INPUT_WINDOW, NUM_FEATURES)),
+        keras.layers.LSTM(64, return_sequences=True),
+        keras.layers.Dropout(0.2),
+        keras.layers.LSTM(32),
+        keras.layers.Dropout(0.2),
+        keras.layers.Dense(HORIZON * NUM_TARGETS),
+        keras.layers.Reshape((HORIZON, NUM_TARGETS)),
+    ])
+    # Khởi tạo mặc định có bias = 0: cộng nhiễu vào mọi trọng số để so sánh cả bias và từng cổng
+    rng = np.random.default_rng(0)
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if weights:
+            layer.set_weights([w + rng.normal(0, 0.1, w.shape).astype(w.dtype) for w in weights])
+    return model
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    return np.random.default_rng(1).standard_normal((16, INPUT_WINDOW, NUM_FEATURES)).astype(np.float32)
+
+
+def test_numpy_backend_matches_keras(keras_model, inputs, tmp_path):
+    path = export_numpy_weights(keras_model, str(tmp_path / lstm_runtime.NUMPY_WEIGHTS_FILE))
+
+    expected = np.asarray(keras_model.predict(inputs, verbose=0))
+    actual = NumpyLSTMModel.load(path).predict(inputs, verbose=0)
+
+    assert actual.shape == (len(inputs), HORIZON, NUM_TARGETS)
+    assert np.allclose(actual, expected, atol=1e-5)
+
+
+def test_onnx_backend_matches_keras(keras_model, inputs, tmp_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("tf2onnx")
+    path = export_onnx(keras_model, str(tmp_path / lstm_runtime.ONNX_FILE), INPUT_WINDOW, NUM_FEATURES)
+
+    expected = np.asarray(keras_model.predict(inputs, verbose=0))
+    actual = OnnxLSTMModel(path).predict(inputs, verbose=0)
+
+    assert np.allclose(actual, expected, atol=1e-5)
+
+
+def test_load_lstm_exports_and_check_parity_passes(keras_model, tmp_path):
+    keras_model.save(str(tmp_path / lstm_runtime.KERAS_FILE))
+
+    model = lstm_runtime.load_lstm(str(tmp_path), backend="numpy")
+    result = lstm_runtime.check_parity(str(tmp_path), backend="numpy", samples=8)
+
+    assert isinstance(model, NumpyLSTMModel)
+    assert (tmp_path / lstm_runtime.NUMPY_WEIGHTS_FILE).exists()
+    assert result["ok"], result
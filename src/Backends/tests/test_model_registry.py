@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+import model_registry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Registry một worker load, bundle 'daily' giả đã load ở phiên bản v1."""
+    monkeypatch.setitem(model_registry.BUNDLE_LOADERS, "daily", lambda path: {"path": path})
+    monkeypatch.setitem(model_registry.BUNDLE_VALIDATORS, "daily", lambda bundle: None)
+    registry = model_registry.ModelRegistry(model_dir="/nonexistent/models", workers=1)
+    registry.load_all(["daily"])
+    return registry
+
+
+def test_watch_reloads_with_a_single_load_worker(registry):
+    registry.fingerprint = lambda: "v2"
+
+    async def run():
+        watcher = asyncio.ensure_future(registry.watch(interval=0.01))
+        try:
+            while registry.version != "v2":
+                await asyncio.sleep(0.01)
+        finally:
+            watcher.cancel()
+
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+    assert registry.reloads == 1
+    assert "daily" in registry.bundles
@@ -0,0 +1,63 @@
+import pytest
+
+from prompt_context import LEVELS, compact_weather, format_chat_context
+
+
+def _hour(hour, **raw):
+    return {"time": f"2025-06-01 {hour:02d}:00:00", "weather_code": 61, "weather_description": "Mưa nhẹ",
+            "raw_data": raw}
+
+
+# Context như frontend gửi lên: record thiếu trường, trường None (Open-Meteo trả null)
+SPARSE_WEATHER = {
+    "city": "Hà Nội",
+    "today_forecast": {"time": "2025-06-01", "weather_description": "Mưa nhẹ",
+                       "raw_data": {"temperature_2m_max": None, "precipitation_sum": 3.2}},
+    "hourly_forecast": [
+        _hour(0, temperature_2m=None, relative_humidity_2m=None, precipitation=None),
+        _hour(1, temperature_2m=27.4, precipitation=0.6),
+        _hour(2, relative_humidity_2m=88, precipitation=1.2),
+        _hour(3),
+        {"time": "2025-06-01 04:00:00"},
+        "not a record",
+    ],
+    "seven_day_forecast": [{"time": "2025-06-02", "temperature_2m_max": None}, {"time": "2025-06-03"}],
+}
+SPARSE_PLAN = {"crop_type": "Lúa", "daily_tasks": [{"task_date": "2025-06-01", "task_description": None}, {}]}
+
+
+@pytest.mark.parametrize("level", range(len(LEVELS)))
+def test_every_level_skips_missing_and_none_fields(level):
+    text = compact_weather(SPARSE_WEATHER, "nhiệt độ độ ẩm mưa", level)
+
+    assert "mưa tổng 1.8mm trong 2h" in text
+    assert "None" not in text
+
+
+def test_compact_context_with_missing_and_none_fields():
+    weather, agri, info = format_chat_context(SPARSE_WEATHER, SPARSE_PLAN, "nhiệt độ độ ẩm mưa",
+                                              budget=10_000, mode="compact")
+
+    assert info["level"] == 0
+    assert "T 27-27°C" in weather
+    assert "ẩm 88-88%" in weather
+    assert "Lúa" in agri
+    # Ngân sách 0: qua mọi mức nén rồi cắt bớt dòng
+    format_chat_context(SPARSE_WEATHER, SPARSE_PLAN, "nhiệt độ độ ẩm mưa", budget=0, mode="compact")
+
+
+def test_all_values_missing():
+    weather = {"hourly_forecast": [_hour(0, temperature_2m=None, relative_humidity_2m=None), _hour(1)]}
+
+    text, _, _ = format_chat_context(weather, {}, budget=10_000, mode="compact")
+
+    summary = text.splitlines()[0]
+    assert summary.startswith("hourly_forecast")
+    assert "°C" not in summary and "ẩm" not in summary
+
+
+def test_full_mode_keeps_none_fields():
+    weather, agri, info = format_chat_context(SPARSE_WEATHER, SPARSE_PLAN, mode="full")
+
+    assert info["mode"] == "full"
+    assert '"temperature_2m": null' in weather
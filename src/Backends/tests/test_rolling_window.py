@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import StandardScaler
+
+from crawl import DAILY_SCHEMA
+from predict import SEQ_FEATURES, process_input_7days
+from rolling_window import WINDOW_DAYS, RollingWindow
+
+FIRST_DAY = date(2024, 12, 20)   # cửa sổ đi qua năm mới (dayofyear quay về 1)
+
+
+@pytest.fixture
+def history():
+    """60 ngày daily ngẫu nhiên, ép kiểu như DAILY_SCHEMA (float32 như response Open-Meteo)."""
+    rng = np.random.default_rng(7)
+    frame = pd.DataFrame({"time": pd.date_range(FIRST_DAY, periods=60, freq="D")})
+    for field, dtype in DAILY_SCHEMA.items():
+        frame[field] = rng.normal(25, 8, len(frame)).astype(dtype)
+    return frame
+
+
+@pytest.fixture
+def scaler_x():
+    rng = np.random.default_rng(11)
+    return StandardScaler().fit(pd.DataFrame(rng.normal(20, 10, (200, len(SEQ_FEATURES))), columns=SEQ_FEATURES))
+
+
+def _block(frame):
+    return {"time": frame["time"].dt.strftime("%Y-%m-%d").tolist(),
+            **{field: frame[field].tolist() for field in DAILY_SCHEMA}}
+
+
+def _expected(history, scaler_x, end):
+    rows = history[history["time"] <= pd.Timestamp(end)].tail(WINDOW_DAYS)
+    return process_input_7days(rows[["time"] + list(DAILY_SCHEMA)].copy(), scaler_x, input_window=WINDOW_DAYS)
+
+
+def test_first_load_matches_process_input_7days(history, scaler_x):
+    today = FIRST_DAY + timedelta(days=35)
+    window = RollingWindow()
+    window.extend(_block(history), today)   # block dài hơn cửa sổ, có cả ngày sau hôm nay
+
+    np.testing.assert_allclose(window.model_input(scaler_x), _expected(history, scaler_x, today), rtol=1e-12)
+    assert window.last_time() == pd.Timestamp(today)
+
+
+def test_incremental_days_match_a_fresh_window(history, scaler_x):
+    today = FIRST_DAY + timedelta(days=WINDOW_DAYS - 1)
+    window = RollingWindow()
+    window.extend(_block(history.head(WINDOW_DAYS)), today)
+    window.model_input(scaler_x)
+
+    for _ in range(10):
+        # Ngày mới: tải lại hôm qua + hôm nay như history_window (missing_days)
+        today += timedelta(days=1)
+        assert window.missing_days(today) == 1
+        days = history[(history["time"] >= pd.Timestamp(today - timedelta(days=1)))
+                       & (history["time"] <= pd.Timestamp(today))]
+        window.extend(_block(days), today)
+
+        np.testing.assert_allclose(window.model_input(scaler_x), _expected(history, scaler_x, today), rtol=1e-12)
+
+
+def test_gap_restarts_the_window(history, scaler_x):
+    window = RollingWindow()
+    window.extend(_block(history.head(WINDOW_DAYS)), FIRST_DAY + timedelta(days=WINDOW_DAYS - 1))
+
+    window.extend(_block(history.tail(5)), history["time"].max().date())
+
+    assert window.count == 5
+    with pytest.raises(ValueError):
+        window.model_input(scaler_x)
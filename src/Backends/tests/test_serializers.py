@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from data_sources import float32_to_float64
+from serializers import column_values, frame_records
+
+
+def test_float32_columns_serialize_to_short_decimals():
+    series = pd.Series(np.array([23.1, 0.1, 1013.2, 43200.5, np.nan], dtype=np.float32))
+
+    assert column_values(series) == [23.1, 0.1, 1013.2, 43200.5, 0.0]
+    assert column_values(series, fill_value=None)[-1] is None
+
+
+def test_float32_to_float64_matches_shortest_float32_repr():
+    rng = np.random.default_rng(0)
+    values = (rng.uniform(-1, 1, 10_000) * rng.choice([1, 40, 1_000, 101_325, 86_400], 10_000)).astype(np.float32)
+
+    converted = float32_to_float64(values)
+
+    assert (converted.astype(np.float32) == values).all()
+    assert (converted == values.astype(str).astype(np.float64)).all()
+
+
+def test_frame_records_keeps_float64_columns():
+    df = pd.DataFrame({"time": pd.to_datetime(["2026-01-05"]), "precipitation_sum": [1.25]})
+
+    assert frame_records(df, time_format="%Y-%m-%d") == [{"time": "2026-01-05", "precipitation_sum": 1.25}]
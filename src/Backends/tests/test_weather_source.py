@@ -0,0 +1,57 @@
+import pytest
+
+import data_sources
+
+
+@pytest.fixture
+def overrides(monkeypatch):
+    def configure(names, default="live"):
+        monkeypatch.setattr(data_sources, "WEATHER_SOURCE", default)
+        monkeypatch.setattr(data_sources, "WEATHER_SOURCE_OVERRIDES", set(names))
+    return configure
+
+
+def _select(name):
+    """Chọn nguồn trong một context riêng (như một request) và trả về tên nguồn đang dùng."""
+    import contextvars
+
+    def run():
+        data_sources.use_request_source(name)
+        return data_sources.data_source().name
+    return contextvars.copy_context().run(run)
+
+
+def test_overrides_are_disabled_by_default(overrides):
+    overrides([])
+
+    with pytest.raises(PermissionError):
+        _select("local")
+    assert _select("live") == "live"   # trùng nguồn mặc định: không đổi gì
+
+
+def test_allowlisted_source_can_be_selected(overrides):
+    overrides(["local", "replay"])
+
+    assert _select("LOCAL") == "local"
+    assert _select("replay") == "replay"
+
+
+@pytest.mark.parametrize("value, allowed", [
+    ("", set()),
+    ("local, Replay", {"local", "replay"}),
+    ("record,local", {"local"}),
+])
+def test_record_is_never_allowed_per_request(value, allowed):
+    assert data_sources.parse_source_overrides(value) == allowed
+
+
+def test_middleware_rejects_source_outside_allowlist(overrides):
+    from fastapi.testclient import TestClient
+    import main
+
+    overrides(["local"])
+    client = TestClient(main.app)
+
+    assert client.get("/api/precompute/status", headers={"X-Weather-Source": "record"}).status_code == 403
+    assert client.get("/api/precompute/status?source=replay").status_code == 403
+    assert client.get("/api/precompute/status", headers={"X-Weather-Source": "local"}).status_code == 200
@@ -0,0 +1,91 @@
+import asyncio
+import contextvars
+import functools
+import time
+from contextlib import contextmanager, nullcontext
+
+# Thời gian các bước (stage) của request hiện tại: {tên stage: [tổng giây, số lần]}
+_stages = contextvars.ContextVar("request_stages", default=None)
+
+# Các hàm được gọi mỗi khi một stage kết thúc: fn(name, seconds) - dùng cho metrics (Prometheus, ...)
+_observers = []
+
+# Tracer OpenTelemetry (tùy chọn): mỗi stage thành một span cùng tên
+_tracer = None
+
+
+def add_observer(fn):
+    """Đăng ký hàm nhận (tên stage, số giây) sau mỗi stage, kể cả ngoài request."""
+    _observers.append(fn)
+
+
+def set_tracer(tracer):
+    global _tracer
+    _tracer = tracer
+
+
+def start_request():
+    """Bắt đầu ghi thời gian các stage cho context hiện tại (gọi ở đầu mỗi request)."""
+    stages = {}
+    _stages.set(stages)
+    return stages
+
+
+def record(name, seconds):
+    stages = _stages.get()
+    if stages is not None:
+        total = stages.setdefault(name, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+    for fn in _observers:
+        fn(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """
+    Đo thời gian một khối lệnh:
+
+        with stage("process.hourly"):
+            df = process_hourly_weather_data(...)
+    """
+    span = _tracer.start_as_current_span(name) if _tracer is not None else nullcontext()
+    with span:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            record(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """Decorator đo thời gian một hàm (sync hoặc async) dưới tên stage `name`."""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing_header(stages):
+    """
+    Dựng header Server-Timing (W3C) từ các stage đã ghi, VD:
+    'geocode;dur=0.4, upstream.open_meteo;dur=182.3;desc="x1"'.
+    Các stage chạy song song (asyncio.gather) có thể có tổng lớn hơn thời gian request.
+    """
+    parts = []
+    for name, (seconds, count) in stages.items():
+        entry = f"{name};dur={seconds * 1000:.2f}"
+        if count > 1:
+            entry += f';desc="x{count}"'
+        parts.append(entry)
+    return ", ".join(parts)
@@ -181,6 +181,72 @@ export async function getAllWeather(city: string): Promise<AllWeatherResponse> {
   return response.json();
 }
 
+export interface AllWeatherStreamHandlers {
+  onToday?: (today: AllWeatherResponse['today_forecast']) => void;
+  onHourly?: (hourly: HourlyWeatherItem[]) => void;
+  onSevenDay?: (sevenDay: SevenDayItem[]) => void;
+}
+
+// Streaming variant of getAllWeather: each section is delivered as soon as the backend has it
+// (today and hourly usually arrive before the 7-day LSTM forecast). Resolves with the full response.
+export async function streamAllWeather(
+  city: string,
+  handlers: AllWeatherStreamHandlers = {},
+  signal?: AbortSignal
+): Promise<AllWeatherResponse> {
+  const response = await fetch(`${API_BASE_URL}/api/predict/all/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'Accept': 'application/x-ndjson',
+    },
+    body: JSON.stringify({ city }),
+    signal,
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error('Failed to fetch all weather data');
+  }
+
+  const result = { city } as AllWeatherResponse;
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  const handleLine = (line: string) => {
+    if (!line.trim()) return;
+    const { section, data } = JSON.parse(line);
+    switch (section) {
+      case 'today_forecast':
+        result.today_forecast = data;
+        handlers.onToday?.(data);
+        break;
+      case 'hourly_forecast':
+        result.hourly_forecast = data;
+        handlers.onHourly?.(data);
+        break;
+      case 'seven_day_forecast':
+        result.seven_day_forecast = data;
+        handlers.onSevenDay?.(data);
+        break;
+      case 'error':
+        throw new Error(data.detail || 'Failed to fetch all weather data');
+    }
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop() ?? '';
+    lines.forEach(handleLine);
+  }
+  handleLine(buffer);
+
+  return result;
+}
+
 // Helper function to get wind direction name
 export function getWindDirection(degrees: number): string {
   const directions = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW'];